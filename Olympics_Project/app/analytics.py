@@ -0,0 +1,256 @@
+import logging
+import os
+import threading
+import time
+
+from db import get_db_connection, release_db_connection
+from dataversion import data_version
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+ANALYTICS_ENGINE = os.getenv('ANALYTICS_ENGINE', '0') == '1'
+ANALYTICS_REFRESH_INTERVAL = float(os.getenv('ANALYTICS_REFRESH_INTERVAL', '600'))
+
+MEDAL_CODES = {'NA': 0, 'Gold': 1, 'Silver': 2, 'Bronze': 3}
+SEX_CODES = {'M': 0, 'F': 1}
+
+logger = logging.getLogger('olympics.analytics')
+
+
+class ColumnarEngine:
+    # Copia in memoria di Participations in colonne NumPy, con nazioni, edizioni, sport,
+    # eventi e medaglie codificati come interi. I dizionari sono letti con lo stesso
+    # ORDER BY del database: l'ordine dei codici coincide con quello della collation, e
+    # MAX e STRING_AGG(DISTINCT ...) si calcolano sui codici.
+
+    def __init__(self, enabled, interval):
+        self.enabled = enabled and np is not None
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._loading = False
+        self._data = None
+        self._loaded_at = 0.0
+        if enabled and np is None:
+            logger.warning("ANALYTICS_ENGINE=1 ma NumPy non e' installato: motore colonnare disattivato")
+
+    def _load(self):
+        start = time.perf_counter()
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            # Stesso snapshot per tutte le tabelle e per il contatore DataVersion.
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            cur.execute("SELECT version FROM DataVersion")
+            row = cur.fetchone()
+            version = row[0] if row else None
+            cur.execute("SELECT noc, region FROM Nations ORDER BY region NULLS FIRST, noc")
+            nations = cur.fetchall()
+            cur.execute("SELECT game_id, game_name, year, season FROM Games ORDER BY game_name")
+            games = cur.fetchall()
+            cur.execute("SELECT DISTINCT sport FROM Events ORDER BY sport")
+            sports = [r[0] for r in cur.fetchall()]
+            cur.execute("SELECT event_id, sport FROM Events")
+            events = cur.fetchall()
+            # L'indice di un atleta e' la sua posizione nell'ordinamento (name, athlete_id).
+            cur.execute("SELECT athlete_id, name, sex FROM Athletes ORDER BY name, athlete_id")
+            athletes = cur.fetchall()
+            cur.execute("SELECT athlete_id, game_id, event_id, noc, age, medal FROM Participations")
+            participations = cur.fetchall()
+            cur.close()
+            conn.rollback()
+        finally:
+            release_db_connection(conn)
+
+        noc_code = {noc: i for i, (noc, _) in enumerate(nations)}
+        game_code = {game_id: i for i, (game_id, *_) in enumerate(games)}
+        sport_code = {sport: i for i, sport in enumerate(sports)}
+        event_sport = {event_id: sport_code[sport] for event_id, sport in events}
+
+        athlete_ids = np.array([a[0] for a in athletes], dtype=np.int64)
+        by_id = np.argsort(athlete_ids)
+        p_athlete_ids = np.fromiter((p[0] for p in participations), dtype=np.int64, count=len(participations))
+        data = {
+            'version': version,
+            'nocs': [n[0] for n in nations],
+            'regions': [n[1] for n in nations],
+            'game_names': [g[1] for g in games],
+            'game_years': np.array([g[2] for g in games], dtype=np.int32),
+            'game_seasons': [g[3] for g in games],
+            'game_by_name': {g[1]: i for i, g in enumerate(games)},
+            'sports': sports,
+            'athlete_ids': athlete_ids,
+            'athlete_names': [a[1] for a in athletes],
+            'athlete_sex': np.array([SEX_CODES.get(a[2], -1) for a in athletes], dtype=np.int8),
+            'ids_sorted': athlete_ids[by_id],
+            'ids_order': by_id,
+            'athlete': by_id[np.searchsorted(athlete_ids[by_id], p_athlete_ids)].astype(np.int32),
+            'game': np.fromiter((game_code[p[1]] for p in participations), dtype=np.int16, count=len(participations)),
+            'sport': np.fromiter((event_sport[p[2]] for p in participations), dtype=np.int16, count=len(participations)),
+            'noc': np.fromiter((noc_code[p[3]] for p in participations), dtype=np.int16, count=len(participations)),
+            'age': np.fromiter((-1 if p[4] is None else p[4] for p in participations), dtype=np.int16, count=len(participations)),
+            'medal': np.fromiter((MEDAL_CODES.get(p[5], 0) for p in participations), dtype=np.int8, count=len(participations)),
+        }
+        logger.info("Motore colonnare caricato: %d partecipazioni, %d atleti in %.2f s",
+                    len(participations), len(athletes), time.perf_counter() - start)
+        return data
+
+    def _reload(self):
+        try:
+            data = self._load()
+            with self._lock:
+                self._data = data
+                self._loaded_at = time.monotonic()
+        except Exception:
+            logger.exception("Caricamento del motore colonnare non riuscito")
+        finally:
+            self._loading = False
+
+    def warm(self):
+        if self.enabled:
+            self._loading = True
+            self._reload()
+
+    def _get(self):
+        # I dati servono solo se corrispondono alla versione corrente: altrimenti si
+        # avvia un ricaricamento in background e la richiesta passa per SQL, senza
+        # attendere ne' restituire risultati anteriori a una scrittura.
+        data = self._data
+        version = data_version.current()
+        if (data is not None and version is not None and data['version'] == version
+                and time.monotonic() - self._loaded_at < self.interval):
+            return data
+        with self._lock:
+            if not self._loading:
+                self._loading = True
+                threading.Thread(target=self._reload, name='analytics-reload', daemon=True).start()
+        return None
+
+    def _mask(self, data, args):
+        # Tabelle di verita' per codice (edizione, nazione, sport, medaglia, sesso) indicizzate
+        # con le colonne: ogni filtro costa un accesso vettoriale per partecipazione.
+        team = args.get('team', '').strip()
+        game_filter = args.get('games', '').strip()
+        medals = args.getlist('medal')
+        seasons = args.getlist('season')
+        sexes = args.getlist('sex')
+        year = args.get('year', '').strip()
+        sport = args.get('sport', '').strip()
+
+        mask = np.ones(len(data['game']), dtype=bool)
+        if game_filter or seasons or year.isdigit():
+            game_ok = np.ones(len(data['game_names']), dtype=bool)
+            if game_filter:
+                game_ok[:] = False
+                if game_filter in data['game_by_name']:
+                    game_ok[data['game_by_name'][game_filter]] = True
+            if seasons:
+                game_ok &= np.array([s in seasons for s in data['game_seasons']], dtype=bool)
+            if year.isdigit():
+                game_ok &= data['game_years'] == int(year)
+            mask &= game_ok[data['game']]
+        if team:
+            mask &= np.array([r == team for r in data['regions']], dtype=bool)[data['noc']]
+        if sport:
+            needle = sport.lower()
+            mask &= np.array([needle in s.lower() for s in data['sports']], dtype=bool)[data['sport']]
+        if medals:
+            medal_ok = np.zeros(len(MEDAL_CODES), dtype=bool)
+            medal_ok[[MEDAL_CODES[m] for m in medals if m in MEDAL_CODES]] = True
+            mask &= medal_ok[data['medal']]
+        if sexes:
+            sex_ok = np.isin(data['athlete_sex'], [SEX_CODES[s] for s in sexes if s in SEX_CODES])
+            mask &= sex_ok[data['athlete']]
+        return np.flatnonzero(mask)
+
+    def _cursor_key(self, data, cursor):
+        position = np.searchsorted(data['ids_sorted'], cursor[4])
+        if position >= len(data['ids_sorted']) or data['ids_sorted'][position] != cursor[4]:
+            return None
+        index = int(data['ids_order'][position])
+        if data['athlete_names'][index] != cursor[3]:
+            return None
+        return (-cursor[0], -cursor[1], -cursor[2], index)
+
+    def athletes(self, args, after, before, limit):
+        # Stessi filtri, ordinamento e cursori di fetch_athletes. Restituisce None quando la
+        # richiesta va servita da SQL: motore disattivato o non allineato, ricerca libera
+        # (indici trigram), nessun filtro sulle partecipazioni (AthleteSummary) o cursore
+        # che non corrisponde piu' a un atleta.
+        if not self.enabled or args.get('q', '').strip():
+            return None
+        if not (args.get('team', '').strip() or args.get('games', '').strip() or args.getlist('medal')
+                or args.getlist('season') or args.get('year', '').strip().isdigit() or args.get('sport', '').strip()):
+            return None
+        data = self._get()
+        if data is None:
+            return None
+        cursor = after or before
+        cursor_key = self._cursor_key(data, cursor) if cursor else None
+        if cursor and cursor_key is None:
+            return None
+
+        selected = self._mask(data, args)
+        athlete = data['athlete'][selected]
+        medal = data['medal'][selected]
+        size = len(data['athlete_ids'])
+        present = np.flatnonzero(np.bincount(athlete, minlength=size))
+        gold = np.bincount(athlete[medal == 1], minlength=size)[present]
+        silver = np.bincount(athlete[medal == 2], minlength=size)[present]
+        bronze = np.bincount(athlete[medal == 3], minlength=size)[present]
+        keys = (-gold, -silver, -bronze, present)
+
+        if cursor_key:
+            # Confronto lessicografico tra la chiave di ogni atleta e quella del cursore.
+            beyond = np.zeros(len(present), dtype=bool)
+            equal = np.ones(len(present), dtype=bool)
+            for column, value in zip(keys, cursor_key):
+                beyond |= equal & ((column > value) if after else (column < value))
+                equal &= column == value
+            keys = tuple(column[beyond] for column in keys)
+        order = np.lexsort(keys[::-1])
+        page = order[:limit + 1] if not before else order[::-1][:limit + 1]
+        rows = self._rows(data, selected, athlete, keys, page)
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if before:
+            rows.reverse()
+            return rows, has_more, True
+        return rows, bool(after), has_more
+
+    def _rows(self, data, selected, athlete, keys, page):
+        indexes = keys[3][page]
+        rows = []
+        if not len(indexes):
+            return rows
+        in_page = np.isin(athlete, indexes)
+        page_rows = selected[in_page]
+        page_athletes = athlete[in_page]
+        groups = {}
+        for row, index in zip(page_rows.tolist(), page_athletes.tolist()):
+            groups.setdefault(index, []).append(row)
+        for position, index in zip(page.tolist(), indexes.tolist()):
+            members = groups[index]
+            ages = [a for a in data['age'][members].tolist() if a >= 0]
+            nocs = set(data['noc'][members].tolist())
+            regions = [data['regions'][n] for n in sorted(nocs) if data['regions'][n] is not None]
+            rows.append({
+                'id': int(data['athlete_ids'][index]),
+                'name': data['athlete_names'][index],
+                'sex': 'MF'[data['athlete_sex'][index]] if data['athlete_sex'][index] >= 0 else None,
+                'age': max(ages) if ages else None,
+                'team': regions[-1] if regions else None,
+                'noc': max(data['nocs'][n] for n in nocs),
+                'sport': ', '.join(data['sports'][s] for s in sorted(set(data['sport'][members].tolist()))),
+                'games': ', '.join(data['game_names'][g] for g in sorted(set(data['game'][members].tolist()))),
+                'gold': int(-keys[0][position]),
+                'silver': int(-keys[1][position]),
+                'bronze': int(-keys[2][position]),
+            })
+        return rows
+
+
+columnar_engine = ColumnarEngine(ANALYTICS_ENGINE, ANALYTICS_REFRESH_INTERVAL)
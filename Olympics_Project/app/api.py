@@ -0,0 +1,242 @@
+from flask import Blueprint, Response, request
+from decimal import Decimal
+import gzip
+import json
+import logging
+import os
+
+from db import release_db_connection
+from importer import import_athletes
+from replicas import get_read_connection
+from bulkops import update_participations, delete_participations, delete_athletes
+from queries import (
+    ATHLETES_PAGE_SIZE, DETAIL_PAGE_SIZE, encode_cursor, fetch_athletes, fetch_athlete_detail, fetch_nation_detail,
+    fetch_game_detail, fetch_sport_detail, fetch_nations, fetch_games, fetch_sports, fetch_medal_table,
+    fetch_global_stats, MEDAL_TABLE_GROUPS,
+)
+
+API_GZIP_MIN_SIZE = int(os.getenv('API_GZIP_MIN_SIZE', '1024'))
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+logger = logging.getLogger('olympics.api')
+
+
+def json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Tipo non serializzabile: {type(value).__name__}")
+
+
+def shape_rows(rows, fields, columnar):
+    if fields:
+        rows = [{k: row[k] for k in fields if k in row} for row in rows]
+    if not columnar:
+        return rows
+    # Formato colonnare: i nomi dei campi compaiono una sola volta invece che in ogni riga.
+    columns = list(rows[0].keys()) if rows else list(fields)
+    return {'columns': columns, 'data': [[row.get(c) for row in rows] for c in columns]}
+
+
+def api_response(payload, status=200, rows_keys=()):
+    # fields e format si applicano solo alle liste di righe indicate da rows_keys: ID
+    # importati, errori e risultati delle operazioni massive restano invariati.
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    columnar = request.args.get('format') == 'columnar'
+    for key in rows_keys:
+        payload[key] = shape_rows(payload[key], fields, columnar)
+
+    body = json.dumps(payload, default=json_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    response = Response(body, status=status, mimetype='application/json')
+    response.headers['Vary'] = 'Accept-Encoding'
+    if len(body) >= API_GZIP_MIN_SIZE and 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def api_error(message, status):
+    return api_response({'error': message}, status)
+
+
+def page_limit(default):
+    return min(max(request.args.get('limit', default, type=int), 1), ATHLETES_PAGE_SIZE)
+
+
+def run_query(fetch):
+    try:
+        conn = get_read_connection()
+        return fetch(conn)
+    except Exception:
+        logger.exception("Errore API su %s", request.path)
+        return None
+    finally:
+        if 'conn' in locals() and conn: release_db_connection(conn)
+
+
+@api.route('/stats')
+def stats():
+    row = run_query(fetch_global_stats)
+    if row is None:
+        return api_error("Database non disponibile.", 503)
+    return api_response({'stats': row})
+
+
+@api.route('/athletes')
+def athletes():
+    limit = page_limit(ATHLETES_PAGE_SIZE)
+    result = run_query(lambda conn: fetch_athletes(conn, request.args, limit))
+    if result is None:
+        return api_error("Database non disponibile.", 503)
+    rows, has_prev, has_next = result
+    return api_response({
+        'athletes': rows,
+        'prev': encode_cursor(rows[0]) if rows and has_prev else None,
+        'next': encode_cursor(rows[-1]) if rows and has_next else None,
+    }, rows_keys=('athletes',))
+
+
+@api.route('/athletes/<int:id>')
+def athlete_detail(id):
+    rows = run_query(lambda conn: fetch_athlete_detail(conn, id))
+    if rows is None:
+        return api_error("Database non disponibile.", 503)
+    if not rows:
+        return api_error("Atleta non trovato.", 404)
+    return api_response({'participations': rows}, rows_keys=('participations',))
+
+
+@api.route('/nations')
+def nations():
+    q = request.args.get('q', '').strip()
+    rows = run_query(lambda conn: fetch_nations(conn, q))
+    if rows is None:
+        return api_error("Database non disponibile.", 503)
+    return api_response({'nations': rows}, rows_keys=('nations',))
+
+
+@api.route('/nations/<noc>')
+def nation_detail(noc):
+    page = run_query(lambda conn: fetch_nation_detail(conn, noc, request.args, page_limit(DETAIL_PAGE_SIZE)))
+    if page is None:
+        return api_error("Database non disponibile.", 503)
+    if not page['nation_info']:
+        return api_error("Nazione non trovata.", 404)
+    return api_response({
+        'noc': noc,
+        'region': page['nation_info']['region'],
+        'stats': page['nation_stats'],
+        'top_athletes': page['top_athletes'],
+        'athletes': page['details'],
+        'prev': page['prev'],
+        'next': page['next'],
+    }, rows_keys=('top_athletes', 'athletes'))
+
+
+@api.route('/games')
+def games():
+    q = request.args.get('q', '').strip()
+    seasons = request.args.getlist('season')
+    rows = run_query(lambda conn: fetch_games(conn, q, seasons))
+    if rows is None:
+        return api_error("Database non disponibile.", 503)
+    return api_response({'games': rows}, rows_keys=('games',))
+
+
+@api.route('/games/<path:game_name>')
+def game_detail(game_name):
+    page = run_query(lambda conn: fetch_game_detail(conn, game_name, request.args, page_limit(DETAIL_PAGE_SIZE)))
+    if page is None:
+        return api_error("Database non disponibile.", 503)
+    if not page['game_info']:
+        return api_error("Edizione non trovata.", 404)
+    return api_response({
+        'game_name': game_name,
+        'game': page['game_info'],
+        'stats': page['game_stats'],
+        'top_athletes': page['top_athletes'],
+        'athletes': page['details'],
+        'prev': page['prev'],
+        'next': page['next'],
+    }, rows_keys=('top_athletes', 'athletes'))
+
+
+@api.route('/sports')
+def sports():
+    q = request.args.get('q', '').strip()
+    rows = run_query(lambda conn: fetch_sports(conn, q))
+    if rows is None:
+        return api_error("Database non disponibile.", 503)
+    return api_response({'sports': rows}, rows_keys=('sports',))
+
+
+@api.route('/sports/<path:sport_name>')
+def sport_detail(sport_name):
+    page = run_query(lambda conn: fetch_sport_detail(conn, sport_name, request.args, page_limit(DETAIL_PAGE_SIZE)))
+    if page is None:
+        return api_error("Database non disponibile.", 503)
+    if not page['sport_stats']['total_athletes']:
+        return api_error("Sport non trovato.", 404)
+    return api_response({
+        'sport': sport_name,
+        'stats': page['sport_stats'],
+        'top_athletes': page['top_athletes'],
+        'participations': page['details'],
+        'prev': page['prev'],
+        'next': page['next'],
+    }, rows_keys=('top_athletes', 'participations'))
+
+
+@api.route('/medals')
+def medals():
+    group = request.args.get('group', 'nation')
+    if group not in MEDAL_TABLE_GROUPS:
+        return api_error(f"Raggruppamento non valido: usare {', '.join(MEDAL_TABLE_GROUPS)}.", 400)
+    rows = run_query(lambda conn: fetch_medal_table(conn, request.args))
+    if rows is None:
+        return api_error("Database non disponibile.", 503)
+    return api_response({'group': group, 'medals': rows}, rows_keys=('medals',))
+
+@api.route('/import', methods=['POST'])
+def import_batch():
+    # Import massivo di atleti e partecipazioni: CSV (text/csv) o JSON (application/json).
+    fmt = {'text/csv': 'csv', 'application/json': 'json'}.get(request.mimetype)
+    if fmt is None:
+        return api_error("Content-Type non supportato: usare text/csv o application/json.", 415)
+    try:
+        athlete_ids, errors = import_athletes(request.get_data(as_text=True), fmt)
+    except ValueError as e:
+        return api_error(str(e), 400)
+    except Exception:
+        logger.exception("Errore durante l'import massivo")
+        return api_error("Database non disponibile.", 503)
+    if errors:
+        return api_response({'error': "Dati non validi, nessuna riga importata.", 'errors': errors}, 422)
+    return api_response({'imported': len(athlete_ids), 'athlete_ids': athlete_ids}, 201)
+
+
+def run_bulk(operation, *args):
+    try:
+        return api_response(operation(*args))
+    except ValueError as e:
+        return api_error(str(e), 400)
+    except Exception:
+        logger.exception("Errore durante l'operazione massiva su %s", request.path)
+        return api_error("Operazione interrotta: i lotti gia' completati restano applicati.", 503)
+
+
+@api.route('/participations/bulk-update', methods=['POST'])
+def bulk_update_participations():
+    body = request.get_json(silent=True) or {}
+    return run_bulk(update_participations, body.get('filter'), body.get('set'))
+
+
+@api.route('/participations/bulk-delete', methods=['POST'])
+def bulk_delete_participations():
+    body = request.get_json(silent=True) or {}
+    return run_bulk(delete_participations, body.get('filter'))
+
+
+@api.route('/athletes/bulk-delete', methods=['POST'])
+def bulk_delete_athletes():
+    body = request.get_json(silent=True) or {}
+    return run_bulk(delete_athletes, body.get('filter'))
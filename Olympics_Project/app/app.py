@@ -1,150 +1,177 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
-import psycopg
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, jsonify, g, session, stream_with_context
 from psycopg.rows import dict_row
+import csv
+import io
+import json
+import logging
 import os
+import time
+import zlib
+
+from db import get_db_connection, release_db_connection, get_pool_stats, get_replica_stats
+from database.summary import refresh_athlete_summary
+from database.rollup import refresh_medal_rollup
+from database.versioning import bump_data_version
+from queries import (
+    encode_cursor, build_athlete_query, fetch_athletes, fetch_athlete_detail, fetch_nation_detail,
+    fetch_game_detail, fetch_sport_detail, fetch_nations, fetch_games, fetch_sports, fetch_medal_table,
+    fetch_global_stats, MEDAL_TABLE_GROUPS,
+)
+from refcache import reference_cache
+from respcache import cached_page
+from dataversion import data_version
+from replicas import replica_router, get_read_connection, stick_to_primary, DB_REPLICA_STICKY_SECONDS
+from api import api
+from instrument import metrics, render_metrics
+
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'), format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger('olympics')
 
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'olympia-manager-secret-key-2026')
+app.register_blueprint(api)
+
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '2000'))
+EXPORT_COLUMNS = ['id', 'name', 'sex', 'age', 'team', 'noc', 'sport', 'games', 'gold', 'silver', 'bronze']
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.before_request
+def route_reads():
+    # Dopo una scrittura la sessione legge dal primario per DB_REPLICA_STICKY_SECONDS
+    # secondi: le repliche potrebbero non averla ancora applicata.
+    if replica_router.enabled:
+        stick_to_primary(time.time() - session.get('last_write', 0) < DB_REPLICA_STICKY_SECONDS)
 
-DB_HOST = os.getenv('DB_HOST', 'localhost')
-DB_NAME = os.getenv('DB_NAME', 'olympics_db')
-DB_USER = os.getenv('DB_USER', 'user')
-DB_PASS = os.getenv('DB_PASS', 'password')
+@app.after_request
+def remember_write(response):
+    if replica_router.enabled and request.method == 'POST':
+        session['last_write'] = time.time()
+    return response
 
-def get_db_connection():
-    return psycopg.connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS)
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        metrics.record_request(request.endpoint or 'unknown', request.method, response.status_code,
+                               time.perf_counter() - started)
+    return response
 
 @app.route('/')
 def index():
     stats = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(row_factory=dict_row)
-        cur.execute("""
-            SELECT
-                (SELECT COUNT(*) FROM Athletes) AS athletes,
-                (SELECT COUNT(*) FROM Nations) AS nations,
-                (SELECT COUNT(*) FROM Games) AS games,
-                (SELECT COUNT(*) FROM Participations WHERE medal != 'NA') AS medals
-        """)
-        stats = cur.fetchone()
+        conn = get_read_connection()
+        stats = fetch_global_stats(conn)
     except Exception:
+        logger.exception("Errore nel caricamento delle statistiche generali")
         stats = None
     finally:
-        if 'cur' in locals() and cur: cur.close()
-        if 'conn' in locals() and conn: conn.close()
+        if 'conn' in locals() and conn: release_db_connection(conn)
     return render_template('index.html', stats=stats)
 
 @app.route('/athletes')
 def athletes():
     athletes_list = []
     
-    q = request.args.get('q', '').strip()
-    team = request.args.get('team', '').strip()
-    game_filter = request.args.get('games', '').strip()
-    medals = request.args.getlist('medal')
-    seasons = request.args.getlist('season')
-    sexes = request.args.getlist('sex')
-    year = request.args.get('year', '').strip()
-    sport = request.args.get('sport', '').strip()
-    
     page = request.args.get('page', 1, type=int)
-    limit = 500
-    offset = (page - 1) * limit
+    if not request.args.get('after') and not request.args.get('before'):
+        page = 1
+    has_next = False
+    has_prev = False
 
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(row_factory=dict_row)
-        
-        query = """
-            SELECT a.athlete_id as id, a.name, a.sex, 
-                    MAX(p.age) as age, 
-                    MAX(n.region) as team,
-                    MAX(n.noc) as noc,
-                    STRING_AGG(DISTINCT e.sport, ', ') as sport, 
-                    STRING_AGG(DISTINCT g.game_name, ', ') as games,
-                    COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
-                    COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
-                    COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze
-            FROM Participations p
-            JOIN Athletes a ON p.athlete_id = a.athlete_id
-            JOIN Games g ON p.game_id = g.game_id
-            JOIN Events e ON p.event_id = e.event_id
-            JOIN Nations n ON p.noc = n.noc
-            WHERE 1=1
-        """
-        params = []
-
-        if q:
-            query += " AND (a.name ILIKE %s OR e.sport ILIKE %s OR n.region ILIKE %s)"
-            params.extend([f'%{q}%', f'%{q}%', f'%{q}%'])
-        if team:
-            query += " AND n.region = %s"
-            params.append(team)
-        if game_filter:
-            query += " AND g.game_name = %s"
-            params.append(game_filter)
-        if medals:
-            query += " AND p.medal = ANY(%s::text[])"
-            params.append(medals)
-        if seasons:
-            query += " AND g.season = ANY(%s::text[])"
-            params.append(seasons)
-        if sexes:
-            query += " AND a.sex = ANY(%s::text[])"
-            params.append(sexes)
-        if year.isdigit():
-            query += " AND g.year = %s"
-            params.append(int(year))
-        if sport:
-            query += " AND e.sport ILIKE %s"
-            params.append(f'%{sport}%')
-
-        query += """
-            GROUP BY a.athlete_id, a.name, a.sex
-            ORDER BY gold DESC, silver DESC, bronze DESC, a.name ASC
-            LIMIT %s OFFSET %s
-        """
-        params.extend([limit, offset])
-
-        cur.execute(query, params)
-        athletes_list = cur.fetchall()
-        has_next = len(athletes_list) == limit
-        
-    except Exception as e:
-        print(f"Error: {e}")
+        conn = get_read_connection()
+        athletes_list, has_prev, has_next = fetch_athletes(conn, request.args)
+    except Exception:
+        logger.exception("Errore nella ricerca atleti")
         athletes_list = []
-        has_next = False
     finally:
-        if 'cur' in locals() and cur: cur.close()
-        if 'conn' in locals() and conn: conn.close()
-        
-    return render_template('athletes.html', athletes=athletes_list, page=page, has_next=has_next)
+        if 'conn' in locals() and conn: release_db_connection(conn)
+
+    prev_url = None
+    next_url = None
+    args = {k: v for k, v in request.args.lists() if k not in ('page', 'after', 'before')}
+    if athletes_list:
+        if has_prev:
+            prev_url = url_for('athletes', **args, page=max(page - 1, 1), before=encode_cursor(athletes_list[0]))
+        if has_next:
+            next_url = url_for('athletes', **args, page=page + 1, after=encode_cursor(athletes_list[-1]))
+    export_urls = {fmt: url_for('export_athletes', **args, format=fmt) for fmt in ('csv', 'ndjson')}
+        
+    return render_template('athletes.html', athletes=athletes_list, page=page, prev_url=prev_url, next_url=next_url,
+                           export_urls=export_urls)
+
+def export_rows_csv(rows, header=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow([row[c] for c in EXPORT_COLUMNS])
+    return buffer.getvalue()
+
+def export_rows_ndjson(rows):
+    return ''.join(json.dumps({c: row[c] for c in EXPORT_COLUMNS}, ensure_ascii=False) + '\n' for row in rows)
+
+@app.route('/athletes/export')
+def export_athletes():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return "Formato non supportato: usare 'csv' oppure 'ndjson'.", 400
+
+    query, params = build_athlete_query(request.args)
+    query = "SELECT * FROM (" + query + ") s ORDER BY -s.gold, -s.silver, -s.bronze, s.name ASC, s.id ASC"
+    use_gzip = 'gzip' in request.headers.get('Accept-Encoding', '')
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if use_gzip else None
+
+    def encode(text):
+        data = text.encode('utf-8')
+        if compressor:
+            data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        return data
+
+    def generate():
+        # Cursore lato server: PostgreSQL consegna le righe a blocchi di EXPORT_BATCH_SIZE,
+        # quindi la memoria usata non dipende dalla dimensione del risultato.
+        conn = get_read_connection()
+        try:
+            with conn.cursor(name='athletes_export', row_factory=dict_row) as cur:
+                cur.itersize = EXPORT_BATCH_SIZE
+                cur.execute(query, params)
+                if fmt == 'csv':
+                    yield encode(export_rows_csv([], header=True))
+                while True:
+                    rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+                    if not rows:
+                        break
+                    yield encode(export_rows_csv(rows) if fmt == 'csv' else export_rows_ndjson(rows))
+            if compressor:
+                yield compressor.flush()
+        finally:
+            release_db_connection(conn)
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=athletes.{fmt}'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
 
 @app.route('/athlete/<int:id>')
 def athlete_detail(id):
     athlete_data = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(row_factory=dict_row)
-        query = """
-            SELECT a.athlete_id, a.name, a.sex, p.age, p.height, p.weight, n.region, e.sport, e.event_name, g.game_name, p.medal,
-                    g.game_id, e.event_id
-            FROM Athletes a
-            JOIN Participations p ON a.athlete_id = p.athlete_id
-            JOIN Nations n ON p.noc = n.noc
-            JOIN Games g ON p.game_id = g.game_id
-            JOIN Events e ON p.event_id = e.event_id
-            WHERE a.athlete_id = %s
-            ORDER BY g.year DESC
-        """
-        cur.execute(query, (id,))
-        athlete_data = cur.fetchall()
+        conn = get_read_connection()
+        athlete_data = fetch_athlete_detail(conn, id)
     except Exception:
+        logger.exception("Errore nel caricamento dell'atleta %s", id)
         athlete_data = None
     finally:
-        if 'cur' in locals() and cur: cur.close()
-        if 'conn' in locals() and conn: conn.close()
+        if 'conn' in locals() and conn: release_db_connection(conn)
     return render_template('athlete_detail.html', details=athlete_data)
 
 @app.route('/edit_participation/<int:athlete_id>/<int:game_id>/<int:old_event_id>', methods=['GET', 'POST'])
@@ -162,14 +189,25 @@ def edit_participation(athlete_id, game_id, old_event_id):
             noc = request.form.get('noc')
             new_event_id = request.form.get('event_id')
 
+            # Il self-join restituisce anche i valori precedenti: il cubo del medagliere va
+            # aggiornato sia nella cella di partenza sia in quella di arrivo.
             cur.execute("""
-                UPDATE Participations 
+                UPDATE Participations p
                 SET age = %s, height = %s, weight = %s, medal = %s,
                     noc = %s, event_id = %s
-                WHERE athlete_id = %s AND game_id = %s AND event_id = %s
+                FROM Participations old
+                WHERE old.participation_id = p.participation_id
+                  AND p.athlete_id = %s AND p.game_id = %s AND p.event_id = %s
+                RETURNING old.noc AS old_noc, old.event_id AS old_event_id, p.noc, p.game_id, p.event_id
             """, (age, height, weight, medal, noc, new_event_id, athlete_id, game_id, old_event_id))
-            
+            changed = cur.fetchall()
+            refresh_athlete_summary(cur, [athlete_id])
+            refresh_medal_rollup(cur, [(r['old_noc'], r['game_id'], r['old_event_id']) for r in changed] +
+                                      [(r['noc'], r['game_id'], r['event_id']) for r in changed])
+            bump_data_version(cur)
+
             conn.commit()
+            data_version.expire()
             flash('Dati della partecipazione aggiornati con successo.', 'success')
             return redirect(url_for('athlete_detail', id=athlete_id))
         
@@ -190,165 +228,61 @@ def edit_participation(athlete_id, game_id, old_event_id):
             flash('Partecipazione non trovata.', 'danger')
             return redirect(url_for('athlete_detail', id=athlete_id))
         
-        cur.execute("SELECT noc, region FROM Nations ORDER BY region ASC")
-        nations = cur.fetchall()
-        
-        cur.execute("SELECT event_id, sport, event_name FROM Events ORDER BY sport ASC, event_name ASC")
-        events = cur.fetchall()
-            
+        nations = reference_cache.nations()
+        events = reference_cache.events()
+
         return render_template('edit_participation.html', part=part, athlete_id=athlete_id, game_id=game_id, event_id=old_event_id, nations=nations, events=events)
             
-    except Exception as e:
+    except Exception:
         if 'conn' in locals() and conn: conn.rollback()
-        print(f"Errore: {e}")
+        logger.exception("Errore nell'aggiornamento della partecipazione %s/%s/%s", athlete_id, game_id, old_event_id)
         flash("Errore durante l'aggiornamento. Verifica che i dati siano corretti.", 'danger')
         return redirect(url_for('athlete_detail', id=athlete_id))
     finally:
         if 'cur' in locals() and cur: cur.close()
-        if 'conn' in locals() and conn: conn.close()
+        if 'conn' in locals() and conn: release_db_connection(conn)
+
+def detail_page_urls(endpoint, page, **values):
+    # Collegamenti alle pagine adiacenti delle tabelle di dettaglio (cursori keyset).
+    return {
+        'prev': url_for(endpoint, **values, before=page['prev']) if page['prev'] else None,
+        'next': url_for(endpoint, **values, after=page['next']) if page['next'] else None,
+    }
 
 @app.route('/nation/<noc>')
+@cached_page
 def nation_detail(noc):
-    nation_info = None
-    nation_stats = None
-    top_athletes = []
-    details = []
+    status = 200
+    page = {'nation_info': None, 'nation_stats': None, 'top_athletes': [], 'details': [], 'prev': None, 'next': None}
     
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(row_factory=dict_row)
-        
-        cur.execute("SELECT region FROM Nations WHERE noc = %s", (noc,))
-        nation_info = cur.fetchone()
-        
-        cur.execute("""
-            SELECT
-                COUNT(DISTINCT p.athlete_id) AS total_athletes,
-                COUNT(DISTINCT p.game_id) AS total_editions,
-                COUNT(DISTINCT e.sport) AS total_sports,
-                COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
-                COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
-                COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze
-            FROM Participations p
-            JOIN Events e ON p.event_id = e.event_id
-            WHERE p.noc = %s
-        """, (noc,))
-        nation_stats = cur.fetchone()
-        
-        cur.execute("""
-            SELECT a.athlete_id, a.name, a.sex,
-                COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
-                COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
-                COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze,
-                COUNT(p.medal) FILTER (WHERE p.medal IN ('Gold', 'Silver', 'Bronze')) AS total_medals
-            FROM Participations p
-            JOIN Athletes a ON p.athlete_id = a.athlete_id
-            WHERE p.noc = %s
-            GROUP BY a.athlete_id, a.name, a.sex
-            ORDER BY gold DESC, silver DESC, bronze DESC, a.name ASC
-            LIMIT 3
-        """, (noc,))
-        top_athletes = cur.fetchall()
-        
-        cur.execute("""
-            SELECT a.athlete_id as id, a.name, 
-                    STRING_AGG(DISTINCT e.sport, ', ') as sport, 
-                    STRING_AGG(DISTINCT g.game_name, ', ') as game_name,
-                    COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
-                    COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
-                    COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze
-            FROM Participations p
-            JOIN Athletes a ON p.athlete_id = a.athlete_id
-            JOIN Events e ON p.event_id = e.event_id
-            JOIN Games g ON p.game_id = g.game_id
-            WHERE p.noc = %s
-            GROUP BY a.athlete_id, a.name
-            ORDER BY gold DESC, silver DESC, bronze DESC, a.name ASC
-            OFFSET 3
-        """, (noc,))
-        details = cur.fetchall()
-        
+        conn = get_read_connection()
+        page = fetch_nation_detail(conn, noc, request.args)
     except Exception:
-        pass
+        logger.exception("Errore nel caricamento della nazione %s", noc)
+        # 503: cached_page memorizza solo le risposte 200, la pagina vuota non resta in cache.
+        status = 503
     finally:
-        if 'cur' in locals() and cur: cur.close()
-        if 'conn' in locals() and conn: conn.close()
+        if 'conn' in locals() and conn: release_db_connection(conn)
         
-    return render_template('nation_detail.html', nation_info=nation_info, nation_stats=nation_stats, top_athletes=top_athletes, details=details, noc=noc)
+    return render_template('nation_detail.html', noc=noc, page_urls=detail_page_urls('nation_detail', page, noc=noc), **page), status
 
 @app.route('/game/<path:game_name>')
+@cached_page
 def game_detail(game_name):
-    game_info = None
-    game_stats = None
-    top_athletes = []
-    details = []
+    status = 200
+    page = {'game_info': None, 'game_stats': None, 'top_athletes': [], 'details': [], 'prev': None, 'next': None}
     
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(row_factory=dict_row)
-        
-        cur.execute("SELECT city, season, year FROM Games WHERE game_name = %s", (game_name,))
-        game_info = cur.fetchone()
-        
-        cur.execute("""
-            SELECT
-                COUNT(DISTINCT p.athlete_id) AS total_athletes,
-                COUNT(DISTINCT p.noc) AS total_nations,
-                COUNT(DISTINCT e.sport) AS total_sports,
-                COUNT(DISTINCT p.event_id) AS total_events,
-                COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
-                COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
-                COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze
-            FROM Participations p
-            JOIN Events e ON p.event_id = e.event_id
-            JOIN Games g ON p.game_id = g.game_id
-            WHERE g.game_name = %s
-        """, (game_name,))
-        game_stats = cur.fetchone()
-        
-        cur.execute("""
-            SELECT a.athlete_id, a.name, n.region AS nation, a.sex,
-                COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
-                COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
-                COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze,
-                COUNT(p.medal) FILTER (WHERE p.medal IN ('Gold', 'Silver', 'Bronze')) AS total_medals
-            FROM Participations p
-            JOIN Athletes a ON p.athlete_id = a.athlete_id
-            JOIN Nations n ON p.noc = n.noc
-            JOIN Games g ON p.game_id = g.game_id
-            WHERE g.game_name = %s
-            GROUP BY a.athlete_id, a.name, n.region, a.sex
-            ORDER BY gold DESC, silver DESC, bronze DESC, a.name ASC
-            LIMIT 3
-        """, (game_name,))
-        top_athletes = cur.fetchall()
-        
-        cur.execute("""
-            SELECT a.athlete_id as id, a.name, MAX(n.region) as region, 
-                    STRING_AGG(DISTINCT e.sport, ', ') as sport,
-                    STRING_AGG(DISTINCT e.event_name, ', ') as event_name,
-                    COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
-                    COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
-                    COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze
-            FROM Participations p
-            JOIN Athletes a ON p.athlete_id = a.athlete_id
-            JOIN Nations n ON p.noc = n.noc
-            JOIN Events e ON p.event_id = e.event_id
-            JOIN Games g ON p.game_id = g.game_id
-            WHERE g.game_name = %s
-            GROUP BY a.athlete_id, a.name
-            ORDER BY gold DESC, silver DESC, bronze DESC, a.name ASC
-            LIMIT 500 OFFSET 3
-        """, (game_name,))
-        details = cur.fetchall()
-        
+        conn = get_read_connection()
+        page = fetch_game_detail(conn, game_name, request.args)
     except Exception:
-        pass
+        logger.exception("Errore nel caricamento dell'edizione %s", game_name)
+        status = 503
     finally:
-        if 'cur' in locals() and cur: cur.close()
-        if 'conn' in locals() and conn: conn.close()
+        if 'conn' in locals() and conn: release_db_connection(conn)
         
-    return render_template('edition_detail.html', game_info=game_info, game_stats=game_stats, top_athletes=top_athletes, details=details, game_name=game_name)
+    return render_template('edition_detail.html', game_name=game_name, page_urls=detail_page_urls('game_detail', page, game_name=game_name), **page), status
 
 @app.route('/nations')
 def nations():
@@ -356,25 +290,13 @@ def nations():
     q = request.args.get('q', '').strip()
     
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(row_factory=dict_row)
-        
-        query = "SELECT noc AS code, region AS name FROM Nations WHERE 1=1"
-        params = []
-        
-        if q:
-            query += " AND (region ILIKE %s OR noc ILIKE %s)"
-            params.extend([f'%{q}%', f'%{q}%'])
-            
-        query += " ORDER BY region ASC"
-        
-        cur.execute(query, params)
-        nations_list = cur.fetchall()
+        conn = get_read_connection()
+        nations_list = fetch_nations(conn, q)
     except Exception:
+        logger.exception("Errore nell'elenco delle nazioni")
         nations_list = []
     finally:
-        if 'cur' in locals() and cur: cur.close()
-        if 'conn' in locals() and conn: conn.close()
+        if 'conn' in locals() and conn: release_db_connection(conn)
         
     return render_template('nations.html', nations=nations_list)
 
@@ -385,29 +307,13 @@ def games():
     seasons = request.args.getlist('season')
     
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(row_factory=dict_row)
-        
-        query = "SELECT year, season, game_name, city FROM Games WHERE 1=1"
-        params = []
-        
-        if q:
-            query += " AND city ILIKE %s"
-            params.append(f'%{q}%')
-            
-        if seasons:
-            query += " AND season = ANY(%s::text[])"
-            params.append(seasons)
-            
-        query += " ORDER BY year DESC, season ASC"
-        
-        cur.execute(query, params)
-        games_list = cur.fetchall()
+        conn = get_read_connection()
+        games_list = fetch_games(conn, q, seasons)
     except Exception:
+        logger.exception("Errore nell'elenco delle edizioni")
         games_list = []
     finally:
-        if 'cur' in locals() and cur: cur.close()
-        if 'conn' in locals() and conn: conn.close()
+        if 'conn' in locals() and conn: release_db_connection(conn)
         
     return render_template('games.html', games=games_list)
 
@@ -417,100 +323,56 @@ def sports():
     q = request.args.get('q', '').strip()
     
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(row_factory=dict_row)
-        
-        query = """
-            SELECT sport, COUNT(DISTINCT event_name) as total_events
-            FROM Events
-            WHERE 1=1
-        """
-        params = []
-        
-        if q:
-            query += " AND sport ILIKE %s"
-            params.append(f'%{q}%')
-            
-        query += " GROUP BY sport ORDER BY sport ASC"
-        
-        cur.execute(query, params)
-        sports_list = cur.fetchall()
-    except Exception as e:
-        print(f"Errore: {e}")
+        conn = get_read_connection()
+        sports_list = fetch_sports(conn, q)
+    except Exception:
+        logger.exception("Errore nell'elenco degli sport")
         sports_list = []
     finally:
-        if 'cur' in locals() and cur: cur.close()
-        if 'conn' in locals() and conn: conn.close()
+        if 'conn' in locals() and conn: release_db_connection(conn)
         
     return render_template('sports.html', sports=sports_list)
 
 @app.route('/sport/<path:sport_name>')
+@cached_page
 def sport_detail(sport_name):
-    sport_stats = None
-    top_athletes = []
-    details = []
+    status = 200
+    page = {'sport_stats': None, 'top_athletes': [], 'details': [], 'prev': None, 'next': None}
     
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(row_factory=dict_row)
-        
-        cur.execute("""
-            SELECT
-                COUNT(DISTINCT p.athlete_id) AS total_athletes,
-                COUNT(DISTINCT p.noc) AS total_nations,
-                COUNT(DISTINCT e.event_id) AS total_events,
-                COUNT(DISTINCT p.game_id) AS total_editions,
-                COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
-                COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
-                COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze
-            FROM Participations p
-            JOIN Events e ON p.event_id = e.event_id
-            WHERE e.sport = %s
-        """, (sport_name,))
-        sport_stats = cur.fetchone()
-        
-        cur.execute("""
-            SELECT a.athlete_id, a.name, MAX(n.region) AS nation, a.sex,
-                COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
-                COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
-                COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze,
-                COUNT(p.medal) FILTER (WHERE p.medal IN ('Gold', 'Silver', 'Bronze')) AS total_medals
-            FROM Participations p
-            JOIN Athletes a ON p.athlete_id = a.athlete_id
-            JOIN Nations n ON p.noc = n.noc
-            JOIN Events e ON p.event_id = e.event_id
-            WHERE e.sport = %s AND p.medal IN ('Gold', 'Silver', 'Bronze')
-            GROUP BY a.athlete_id, a.name, a.sex
-            ORDER BY total_medals DESC, gold DESC, silver DESC, bronze DESC
-            LIMIT 3
-        """, (sport_name,))
-        top_athletes = cur.fetchall()
-        
-        cur.execute("""
-            SELECT a.athlete_id, a.name, MAX(n.region) as region, 
-                    MAX(g.game_name) as game_name, MAX(e.event_name) as event_name,
-                    COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
-                    COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
-                    COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze
-            FROM Participations p
-            JOIN Athletes a ON p.athlete_id = a.athlete_id
-            JOIN Nations n ON p.noc = n.noc
-            JOIN Events e ON p.event_id = e.event_id
-            JOIN Games g ON p.game_id = g.game_id
-            WHERE e.sport = %s
-            GROUP BY a.athlete_id, a.name, g.game_id, e.event_id
-            ORDER BY g.year DESC, a.name ASC
-            LIMIT 500
-        """, (sport_name,))
-        details = cur.fetchall()
-        
-    except Exception as e:
-        print(f"Errore: {e}")
+        conn = get_read_connection()
+        page = fetch_sport_detail(conn, sport_name, request.args)
+    except Exception:
+        logger.exception("Errore nel caricamento dello sport %s", sport_name)
+        status = 503
     finally:
-        if 'cur' in locals() and cur: cur.close()
-        if 'conn' in locals() and conn: conn.close()
+        if 'conn' in locals() and conn: release_db_connection(conn)
         
-    return render_template('sport_detail.html', sport_name=sport_name, sport_stats=sport_stats, top_athletes=top_athletes, details=details)
+    return render_template('sport_detail.html', sport_name=sport_name, page_urls=detail_page_urls('sport_detail', page, sport_name=sport_name), **page), status
+
+@app.route('/medals')
+def medals():
+    rows = []
+    try:
+        conn = get_read_connection()
+        rows = fetch_medal_table(conn, request.args)
+    except Exception:
+        logger.exception("Errore nel calcolo del medagliere")
+        rows = []
+    finally:
+        if 'conn' in locals() and conn: release_db_connection(conn)
+
+    sports = []
+    nations = []
+    try:
+        sports = sorted({e['sport'] for e in reference_cache.events()})
+        nations = reference_cache.nations()
+    except Exception:
+        logger.exception("Errore nel caricamento dei filtri del medagliere")
+
+    group = request.args.get('group', 'nation')
+    return render_template('medals.html', rows=rows, sports=sports, nations=nations,
+                           group=group if group in MEDAL_TABLE_GROUPS else 'nation')
 
 @app.route('/add_athlete', methods=['GET', 'POST'])
 def add_athlete():
@@ -530,49 +392,40 @@ def add_athlete():
             game_id = request.form.get('game_id')
             event_id = request.form.get('event_id')
 
-            cur.execute("SELECT COALESCE(MAX(athlete_id), 0) + 1 FROM Athletes")
+            cur.execute("INSERT INTO Athletes (name, sex) VALUES (%s, %s) RETURNING athlete_id", (name, sex))
             new_athlete_id = cur.fetchone()[0]
-            cur.execute("INSERT INTO Athletes (athlete_id, name, sex) VALUES (%s, %s, %s)", 
-                        (new_athlete_id, name, sex))
 
             cur.execute("""
                 INSERT INTO Participations (athlete_id, game_id, event_id, noc, age, height, weight, medal)
                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
             """, (new_athlete_id, game_id, event_id, noc, age, height, weight, medal))
+            refresh_athlete_summary(cur, [new_athlete_id])
+            refresh_medal_rollup(cur, [(noc, game_id, event_id)])
+            bump_data_version(cur)
 
             conn.commit()
+            data_version.expire()
             flash('Atleta e partecipazione registrati con successo.', 'success')
             return redirect(url_for('athletes'))
             
-        except Exception as e:
+        except Exception:
             if 'conn' in locals() and conn: conn.rollback()
-            print(f"Errore: {e}")
+            logger.exception("Errore nell'inserimento di un nuovo atleta")
             flash("Errore durante l'inserimento. Controlla i dati.", 'danger')
         finally:
             if 'cur' in locals() and cur: cur.close()
-            if 'conn' in locals() and conn: conn.close()
+            if 'conn' in locals() and conn: release_db_connection(conn)
     
     nations = []
     games = []
     events = []
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(row_factory=dict_row)
-        
-        cur.execute("SELECT noc, region FROM Nations ORDER BY region ASC")
-        nations = cur.fetchall()
-        
-        cur.execute("SELECT game_id, game_name, city FROM Games ORDER BY year DESC, season ASC")
-        games = cur.fetchall()
-        
-        cur.execute("SELECT event_id, sport, event_name FROM Events ORDER BY sport ASC, event_name ASC")
-        events = cur.fetchall()
-    except Exception as e:
-        print(f"Errore caricamento form: {e}")
-    finally:
-        if 'cur' in locals() and cur: cur.close()
-        if 'conn' in locals() and conn: conn.close()
-        
+        nations = reference_cache.nations()
+        games = reference_cache.games()
+        events = reference_cache.events()
+    except Exception:
+        logger.exception("Errore nel caricamento dei dati del form")
+
     return render_template('add_athlete.html', nations=nations, games=games, events=events)
 
 @app.route('/delete_athlete/<int:id>', methods=['POST'])
@@ -581,18 +434,32 @@ def delete_athlete(id):
         conn = get_db_connection()
         cur = conn.cursor()
         
-        cur.execute("DELETE FROM Participations WHERE athlete_id = %s", (id,))
+        cur.execute("DELETE FROM Participations WHERE athlete_id = %s RETURNING noc, game_id, event_id", (id,))
+        cells = cur.fetchall()
         cur.execute("DELETE FROM Athletes WHERE athlete_id = %s", (id,))
-        
+        refresh_athlete_summary(cur, [id])
+        refresh_medal_rollup(cur, cells)
+        bump_data_version(cur)
+
         conn.commit()
+        data_version.expire()
         flash('Record eliminato con successo.', 'success')
     except Exception:
-        if conn: conn.rollback()
+        if 'conn' in locals() and conn: conn.rollback()
+        logger.exception("Errore nell'eliminazione dell'atleta %s", id)
         flash("Errore durante l'eliminazione.", 'danger')
     finally:
         if 'cur' in locals() and cur: cur.close()
-        if 'conn' in locals() and conn: conn.close()
+        if 'conn' in locals() and conn: release_db_connection(conn)
     return redirect(url_for('athletes'))
 
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(render_metrics(get_pool_stats), mimetype='text/plain; version=0.0.4')
+
+@app.route('/status/db')
+def db_status():
+    return jsonify(pool=get_pool_stats(), replicas=get_replica_stats(), routing=replica_router.status())
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0')
+    app.run(debug=os.getenv('FLASK_DEBUG', '0') == '1', host='0.0.0.0')
@@ -0,0 +1,232 @@
+import logging
+import os
+
+from db import get_db_connection, release_db_connection
+from database.summary import refresh_athlete_summary
+from database.rollup import refresh_medal_rollup
+from database.versioning import bump_data_version
+from dataversion import data_version
+from importer import MEDALS, lookup_event, lookup_game, to_number
+from refcache import reference_cache
+
+BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', '1000'))
+BULK_LOCK_TIMEOUT = os.getenv('BULK_LOCK_TIMEOUT', '2s')
+
+logger = logging.getLogger('olympics.bulk')
+
+
+def id_list(values, key):
+    # Solo liste di interi: una stringa come "123" verrebbe letta come [1, 2, 3] e True
+    # come 1, e questi ID finiscono in operazioni distruttive.
+    if not isinstance(values, (list, tuple)) or any(
+            isinstance(i, bool) or not isinstance(i, int) for i in values):
+        raise ValueError(f"'{key}' deve essere una lista di interi.")
+    return list(values)
+
+
+def participation_filter(filters):
+    # Traduce il filtro della richiesta (ID espliciti e/o nazione, edizione, evento,
+    # medaglia) in una condizione su Participations p. Un filtro vuoto non e' ammesso:
+    # un errore nel client non deve poter toccare l'intera tabella.
+    if not isinstance(filters, dict):
+        raise ValueError("Il filtro deve essere un oggetto.")
+    conditions = []
+    params = []
+
+    athlete_ids = filters.get('athlete_ids')
+    if athlete_ids is not None:
+        athlete_ids = id_list(athlete_ids, 'athlete_ids')
+        conditions.append("p.athlete_id = ANY(%s)")
+        params.append(athlete_ids)
+    participation_ids = filters.get('participation_ids')
+    if participation_ids is not None:
+        participation_ids = id_list(participation_ids, 'participation_ids')
+        conditions.append("p.participation_id = ANY(%s)")
+        params.append(participation_ids)
+    if filters.get('noc'):
+        noc = str(filters['noc']).strip().upper()
+        if reference_cache.nation(noc) is None:
+            raise ValueError(f"Nazione '{noc}' sconosciuta.")
+        conditions.append("p.noc = %s")
+        params.append(noc)
+    if filters.get('game'):
+        game = lookup_game(filters['game'])
+        if game is None:
+            raise ValueError(f"Edizione '{filters['game']}' sconosciuta.")
+        conditions.append("p.game_id = %s")
+        params.append(game['game_id'])
+    if filters.get('event'):
+        event = lookup_event(filters['event'])
+        if event is None:
+            raise ValueError(f"Evento '{filters['event']}' sconosciuto.")
+        conditions.append("p.event_id = %s")
+        params.append(event['event_id'])
+    if filters.get('medal'):
+        if filters['medal'] not in MEDALS:
+            raise ValueError(f"Medaglia '{filters['medal']}' non valida.")
+        conditions.append("p.medal = %s")
+        params.append(filters['medal'])
+
+    if not conditions:
+        raise ValueError("Specificare almeno un filtro (athlete_ids, participation_ids, noc, game, event, medal).")
+    return ' AND '.join(conditions), params
+
+
+def participation_changes(changes):
+    if not isinstance(changes, dict) or not changes:
+        raise ValueError("Indicare i campi da modificare in 'set'.")
+    assignments = []
+    params = []
+    for field, value in changes.items():
+        if field == 'medal':
+            if value not in MEDALS:
+                raise ValueError(f"Medaglia '{value}' non valida.")
+        elif field == 'noc':
+            value = str(value or '').strip().upper()
+            if reference_cache.nation(value) is None:
+                raise ValueError(f"Nazione '{value}' sconosciuta.")
+        elif field == 'event':
+            event = lookup_event(value)
+            if event is None:
+                raise ValueError(f"Evento '{value}' sconosciuto.")
+            field, value = 'event_id', event['event_id']
+        elif field in ('age', 'height', 'weight'):
+            try:
+                value = to_number(value, field)
+            except (TypeError, ValueError):
+                raise ValueError(f"Valore non numerico o fuori intervallo per '{field}'.")
+        else:
+            raise ValueError(f"Campo '{field}' non modificabile.")
+        assignments.append(f"{field} = %s")
+        params.append(value)
+    return ', '.join(assignments), params
+
+
+def run_batches(conn, apply_batch):
+    # Ogni lotto e' una transazione a se': i lock durano al massimo un lotto e riepilogo e
+    # contatore DataVersion vengono aggiornati una volta per lotto. apply_batch riceve il
+    # cursore e l'ultima chiave elaborata e restituisce (ultima chiave, righe, athlete_ids,
+    # celle del medagliere); il ciclo termina al primo lotto che non tocca nessun atleta.
+    totals = {'rows': 0, 'batches': 0}
+    touched = set()
+    last_key = 0
+    try:
+        while True:
+            with conn.cursor() as cur:
+                cur.execute(f"SET LOCAL lock_timeout = '{BULK_LOCK_TIMEOUT}'")
+                last_key, rows, athlete_ids, cells = apply_batch(cur, last_key)
+                if not athlete_ids:
+                    conn.rollback()
+                    break
+                refresh_athlete_summary(cur, athlete_ids)
+                refresh_medal_rollup(cur, cells)
+                bump_data_version(cur)
+            conn.commit()
+            totals['rows'] += rows
+            totals['batches'] += 1
+            touched.update(athlete_ids)
+    finally:
+        if totals['batches']:
+            data_version.expire()
+    totals['athletes'] = len(touched)
+    return totals
+
+
+def update_participations(filters, changes):
+    where, where_params = participation_filter(filters)
+    assignments, set_params = participation_changes(changes)
+
+    # La chiave participation_id avanza a ogni lotto: le righe gia' modificate che
+    # soddisfano ancora il filtro non vengono rielaborate.
+    def apply_batch(cur, last_key):
+        cur.execute(f"""
+            WITH batch AS (
+                SELECT p.participation_id, p.noc, p.event_id FROM Participations p
+                WHERE {where} AND p.participation_id > %s
+                ORDER BY p.participation_id
+                LIMIT %s
+            )
+            UPDATE Participations p SET {assignments}
+            FROM batch WHERE p.participation_id = batch.participation_id
+            RETURNING p.participation_id, p.athlete_id, batch.noc, batch.event_id, p.noc, p.game_id, p.event_id
+        """, where_params + [last_key, BULK_BATCH_SIZE] + set_params)
+        rows = cur.fetchall()
+        if not rows:
+            return last_key, 0, [], []
+        cells = [(r[2], r[5], r[3]) for r in rows] + [(r[4], r[5], r[6]) for r in rows]
+        return max(r[0] for r in rows), len(rows), [r[1] for r in rows], cells
+
+    return bulk_run("modifica partecipazioni", apply_batch, {'updated': 'rows', 'athletes': 'athletes'})
+
+
+def delete_participations(filters):
+    where, params = participation_filter(filters)
+
+    def apply_batch(cur, last_key):
+        cur.execute(f"""
+            WITH batch AS (
+                SELECT p.participation_id FROM Participations p
+                WHERE {where}
+                ORDER BY p.participation_id
+                LIMIT %s
+            )
+            DELETE FROM Participations p USING batch
+            WHERE p.participation_id = batch.participation_id
+            RETURNING p.athlete_id, p.noc, p.game_id, p.event_id
+        """, params + [BULK_BATCH_SIZE])
+        rows = cur.fetchall()
+        return last_key, len(rows), [r[0] for r in rows], [r[1:] for r in rows]
+
+    return bulk_run("eliminazione partecipazioni", apply_batch, {'deleted': 'rows', 'athletes': 'athletes'})
+
+
+def delete_athletes(filters):
+    # Elimina gli atleti indicati (o con almeno una partecipazione che soddisfa il filtro)
+    # insieme a tutte le loro partecipazioni.
+    filters = dict(filters) if isinstance(filters, dict) else filters
+    explicit_ids = filters.pop('athlete_ids', None) if isinstance(filters, dict) else None
+    conditions = []
+    params = []
+    if explicit_ids is not None:
+        conditions.append("a.athlete_id = ANY(%s)")
+        params.append(id_list(explicit_ids, 'athlete_ids'))
+    if explicit_ids is None or any(filters.values()):
+        where, where_params = participation_filter(filters)
+        conditions.append(f"EXISTS (SELECT 1 FROM Participations p WHERE p.athlete_id = a.athlete_id AND {where})")
+        params.extend(where_params)
+    condition = ' AND '.join(conditions)
+
+    def apply_batch(cur, last_key):
+        cur.execute(f"""
+            SELECT a.athlete_id FROM Athletes a
+            WHERE {condition} AND a.athlete_id > %s
+            ORDER BY a.athlete_id
+            LIMIT %s
+        """, params + [last_key, BULK_BATCH_SIZE])
+        athlete_ids = [r[0] for r in cur.fetchall()]
+        if not athlete_ids:
+            return last_key, 0, [], []
+        cur.execute(
+            "DELETE FROM Participations WHERE athlete_id = ANY(%s) RETURNING noc, game_id, event_id",
+            (athlete_ids,),
+        )
+        cells = cur.fetchall()
+        cur.execute("DELETE FROM Athletes WHERE athlete_id = ANY(%s)", (athlete_ids,))
+        return athlete_ids[-1], len(cells), athlete_ids, cells
+
+    return bulk_run("eliminazione atleti", apply_batch, {'deleted': 'athletes', 'participations': 'rows'})
+
+
+def bulk_run(label, apply_batch, report):
+    conn = get_db_connection()
+    try:
+        totals = run_batches(conn, apply_batch)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+    logger.info("Operazione massiva (%s): %d righe in %d lotti", label, totals['rows'], totals['batches'])
+    result = {key: totals[source] for key, source in report.items()}
+    result['batches'] = totals['batches']
+    return result
@@ -19,4 +19,28 @@ ORDER BY
     Oro DESC, 
     Argento DESC, 
     Bronzo DESC
-LIMIT 20;
\ No newline at end of file
+LIMIT 20;
+
+-- Lo stesso medagliere letto dal cubo MedalRollup (righe di totale per nazione ed edizione).
+SELECT
+    n.region AS Nazione,
+    SUM(r.gold) AS Oro,
+    SUM(r.silver) AS Argento,
+    SUM(r.bronze) AS Bronzo,
+    SUM(r.gold + r.silver + r.bronze) AS Totale_Medaglie
+FROM
+    MedalRollup r
+JOIN
+    Nations n ON r.noc = n.noc
+JOIN
+    Games g ON r.game_id = g.game_id
+WHERE
+    r.sport = ''
+    AND g.season = 'Summer'
+GROUP BY
+    n.region
+ORDER BY
+    Oro DESC,
+    Argento DESC,
+    Bronzo DESC
+LIMIT 20;
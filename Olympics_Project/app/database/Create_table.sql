@@ -5,7 +5,7 @@ CREATE TABLE IF NOT EXISTS Nations (
 );
 
 CREATE TABLE IF NOT EXISTS Athletes (
-    athlete_id INTEGER PRIMARY KEY,
+    athlete_id SERIAL PRIMARY KEY,
     name VARCHAR(255) NOT NULL,
     sex CHAR(1) CHECK (sex IN ('M', 'F'))
 );
@@ -33,7 +33,7 @@ CREATE TABLE IF NOT EXISTS Participations (
     age INTEGER,
     height INTEGER,
     weight NUMERIC(5,2),
-    medal VARCHAR(10) DEFAULT 'None' CHECK (medal IN ('Gold', 'Silver', 'Bronze', 'NA')),
+    medal VARCHAR(10) DEFAULT 'NA' CHECK (medal IN ('Gold', 'Silver', 'Bronze', 'NA')),
    
     CONSTRAINT fk_athlete FOREIGN KEY (athlete_id) REFERENCES Athletes(athlete_id),
     CONSTRAINT fk_game FOREIGN KEY (game_id) REFERENCES Games(game_id),
@@ -0,0 +1,260 @@
+import io
+import time
+
+import pandas as pd
+import psycopg
+
+from load_data import (
+    DB_HOST, DB_NAME, DB_PASS, DB_USER, EVENTS_CSV, REGIONS_CSV, CSV_COLUMNS, CSV_DTYPES, TABLES, sync_sequences,
+)
+from summary import rebuild_athlete_summary, refresh_athlete_summary
+from rollup import rebuild_medal_rollup, refresh_medal_rollup_games
+from versioning import bump_data_version
+
+# Oltre questa soglia di atleti toccati conviene ricostruire il riepilogo da zero.
+SUMMARY_REBUILD_THRESHOLD = 20000
+
+PARTICIPATION_KEY = ['athlete_id', 'game_id', 'event_id', 'ord']
+PARTICIPATION_VALUES = ['noc', 'age', 'height', 'weight', 'medal']
+
+
+def read_source():
+    df = pd.read_csv(EVENTS_CSV, usecols=CSV_COLUMNS, dtype=CSV_DTYPES)
+    df['Medal'] = df['Medal'].fillna('NA')
+    regions = pd.read_csv(REGIONS_CSV)
+
+    nations = pd.DataFrame({'noc': df['NOC'].unique()})
+    nations = nations.merge(regions, how='left', left_on='noc', right_on='NOC')[TABLES['nations']]
+
+    athletes = df[['ID', 'Name', 'Sex']].drop_duplicates(subset=['ID'])
+    athletes.columns = ['athlete_id', 'name', 'sex']
+
+    games = df[['Games', 'Year', 'Season', 'City']].drop_duplicates(subset=['Games'])
+    games.columns = ['game_name', 'year', 'season', 'city']
+
+    events = df[['Sport', 'Event']].drop_duplicates(subset=['Event'])
+    events.columns = ['sport', 'event_name']
+
+    participations = df[['ID', 'Games', 'Event', 'NOC', 'Age', 'Height', 'Weight', 'Medal']]
+    participations.columns = ['athlete_id', 'game_name', 'event_name', 'noc', 'age', 'height', 'weight', 'medal']
+    return nations, athletes, games, events, participations
+
+
+def read_table(cur, query):
+    cur.execute(query)
+    columns = [c.name for c in cur.description]
+    return pd.DataFrame(cur.fetchall(), columns=columns)
+
+
+def diff_dimension(source, current, key, columns):
+    # Confronta sorgente e database sulla chiave naturale: righe nuove, modificate
+    # (almeno una colonna diversa, NULL uguale a NULL) e rimosse.
+    merged = source.merge(current, on=key, how='outer', suffixes=('', '_db'), indicator=True)
+    new = merged[merged['_merge'] == 'left_only']
+    removed = merged[merged['_merge'] == 'right_only']
+    both = merged[merged['_merge'] == 'both']
+    changed_mask = pd.Series(False, index=both.index)
+    for col in columns:
+        a, b = both[col].astype(object), both[f'{col}_db'].astype(object)
+        changed_mask |= (a != b) & ~(a.isna() & b.isna())
+    return new, both[changed_mask], removed
+
+
+def canonical_participations(frame):
+    canonical = pd.DataFrame({
+        'athlete_id': frame['athlete_id'].astype('int64'),
+        'game_id': frame['game_id'].astype('int64'),
+        'event_id': frame['event_id'].astype('int64'),
+        'noc': frame['noc'].astype(str),
+        'age': pd.to_numeric(frame['age']).astype('Int64'),
+        'height': pd.to_numeric(frame['height']).astype('Int64'),
+        'weight': pd.to_numeric(frame['weight'].astype(object), errors='coerce').astype('float64').round(2),
+        'medal': frame['medal'].astype(str),
+    }, index=frame.index)
+    canonical['row_hash'] = pd.util.hash_pandas_object(canonical[PARTICIPATION_VALUES], index=False)
+    # Il dataset contiene partecipazioni ripetute con la stessa terna atleta/edizione/evento:
+    # l'ordinale, assegnato dopo l'ordinamento per hash, rende la chiave univoca e stabile.
+    canonical = canonical.sort_values(['athlete_id', 'game_id', 'event_id', 'row_hash'])
+    canonical['ord'] = canonical.groupby(['athlete_id', 'game_id', 'event_id']).cumcount()
+    return canonical
+
+
+def allocate_ids(cur, table, column, count):
+    cur.execute(
+        "SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)",
+        (table, column, count),
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+def stage(cur, name, frame, columns, types):
+    definition = ', '.join(f'{col} {typ}' for col, typ in zip(columns, types))
+    cur.execute(f"CREATE TEMP TABLE {name} ({definition}) ON COMMIT DROP")
+    if frame.empty:
+        return
+    buffer = io.StringIO()
+    frame[columns].to_csv(buffer, header=False, index=False)
+    with cur.copy(f"COPY {name} ({', '.join(columns)}) FROM STDIN (FORMAT csv)") as copy:
+        copy.write(buffer.getvalue())
+
+
+def run_incremental_ingestion():
+    print("Avvio dell'ingestione incrementale...")
+    start = time.perf_counter()
+
+    try:
+        src_nations, src_athletes, src_games, src_events, src_parts = read_source()
+    except FileNotFoundError:
+        print("Errore: Impossibile trovare i file CSV. Assicurarsi che siano presenti nella cartella 'data/'.")
+        return
+
+    try:
+        with psycopg.connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS) as conn:
+            with conn.cursor() as cur:
+                cur.execute("LOCK TABLE nations, athletes, games, events, participations IN SHARE ROW EXCLUSIVE MODE")
+                sync_sequences(cur)
+
+                db_nations = read_table(cur, "SELECT noc, region, notes FROM nations")
+                db_athletes = read_table(cur, "SELECT athlete_id, name, sex FROM athletes")
+                db_games = read_table(cur, "SELECT game_id, game_name, year, season, city FROM games")
+                db_events = read_table(cur, "SELECT event_id, sport, event_name FROM events")
+                db_parts = read_table(cur, """
+                    SELECT participation_id, athlete_id, game_id, event_id, noc, age, height, weight, medal
+                    FROM participations
+                """)
+
+                nations_new, nations_changed, nations_removed = diff_dimension(
+                    src_nations, db_nations, ['noc'], ['region', 'notes'])
+                athletes_new, athletes_changed, athletes_removed = diff_dimension(
+                    src_athletes, db_athletes, ['athlete_id'], ['name', 'sex'])
+                games_new, games_changed, games_removed = diff_dimension(
+                    src_games, db_games.drop(columns=['game_id']), ['game_name'], ['year', 'season', 'city'])
+                events_new, events_changed, events_removed = diff_dimension(
+                    src_events, db_events.drop(columns=['event_id']), ['event_name'], ['sport'])
+
+                # Le edizioni e gli eventi gia' presenti mantengono il loro ID; i nuovi lo
+                # ricevono dalla sequenza, quindi gli ID restano stabili tra un'esecuzione e l'altra.
+                games_new = games_new.assign(game_id=allocate_ids(cur, 'games', 'game_id', len(games_new)))
+                events_new = events_new.assign(event_id=allocate_ids(cur, 'events', 'event_id', len(events_new)))
+                game_ids = dict(zip(db_games['game_name'], db_games['game_id']))
+                game_ids.update(zip(games_new['game_name'], games_new['game_id']))
+                event_ids = dict(zip(db_events['event_name'], db_events['event_id']))
+                event_ids.update(zip(events_new['event_name'], events_new['event_id']))
+                games_changed = games_changed.assign(game_id=games_changed['game_name'].map(game_ids))
+                events_changed = events_changed.assign(event_id=events_changed['event_name'].map(event_ids))
+
+                src_parts = src_parts.assign(
+                    game_id=src_parts['game_name'].map(game_ids),
+                    event_id=src_parts['event_name'].map(event_ids),
+                )
+                source = canonical_participations(src_parts)
+                current = canonical_participations(db_parts)
+                current['participation_id_db'] = db_parts.loc[current.index, 'participation_id']
+
+                merged = source.merge(
+                    current[PARTICIPATION_KEY + ['row_hash', 'participation_id_db']],
+                    on=PARTICIPATION_KEY, how='outer', suffixes=('', '_db'), indicator=True,
+                )
+                parts_new = merged[merged['_merge'] == 'left_only']
+                parts_removed = merged[merged['_merge'] == 'right_only']
+                parts_changed = merged[(merged['_merge'] == 'both') & (merged['row_hash'] != merged['row_hash_db'])]
+
+                print("Differenze rilevate (nuove / modificate / rimosse):")
+                for table, delta in (
+                    ('nations', (nations_new, nations_changed, nations_removed)),
+                    ('athletes', (athletes_new, athletes_changed, athletes_removed)),
+                    ('games', (games_new, games_changed, games_removed)),
+                    ('events', (events_new, events_changed, events_removed)),
+                    ('participations', (parts_new, parts_changed, parts_removed)),
+                ):
+                    print(f"  {table:<15} {len(delta[0]):>7} / {len(delta[1]):>7} / {len(delta[2]):>7}")
+
+                stage(cur, 'stage_nations', pd.concat([nations_new, nations_changed]),
+                      TABLES['nations'], ['varchar(3)', 'varchar(255)', 'text'])
+                stage(cur, 'stage_athletes', pd.concat([athletes_new, athletes_changed]),
+                      TABLES['athletes'], ['integer', 'varchar(255)', 'char(1)'])
+                stage(cur, 'stage_games', pd.concat([games_new, games_changed]),
+                      TABLES['games'], ['integer', 'varchar(255)', 'integer', 'varchar(10)', 'varchar(255)'])
+                stage(cur, 'stage_events', pd.concat([events_new, events_changed]),
+                      TABLES['events'], ['integer', 'varchar(255)', 'varchar(255)'])
+                stage(cur, 'stage_part_upsert', pd.concat([parts_new, parts_changed]).astype({'participation_id_db': 'Int64'}),
+                      ['participation_id_db'] + TABLES['participations'],
+                      ['integer', 'integer', 'integer', 'integer', 'varchar(3)', 'integer', 'integer', 'numeric(5,2)', 'varchar(10)'])
+                stage(cur, 'stage_part_delete', parts_removed.astype({'participation_id_db': 'int64'}),
+                      ['participation_id_db', 'athlete_id'], ['integer', 'integer'])
+
+                cur.execute("""
+                    INSERT INTO nations (noc, region, notes) SELECT noc, region, notes FROM stage_nations
+                    ON CONFLICT (noc) DO UPDATE SET region = EXCLUDED.region, notes = EXCLUDED.notes
+                """)
+                cur.execute("""
+                    INSERT INTO athletes (athlete_id, name, sex) SELECT athlete_id, name, sex FROM stage_athletes
+                    ON CONFLICT (athlete_id) DO UPDATE SET name = EXCLUDED.name, sex = EXCLUDED.sex
+                """)
+                cur.execute("""
+                    INSERT INTO games (game_id, game_name, year, season, city)
+                    SELECT game_id, game_name, year, season, city FROM stage_games
+                    ON CONFLICT (game_id) DO UPDATE SET year = EXCLUDED.year, season = EXCLUDED.season, city = EXCLUDED.city
+                """)
+                cur.execute("""
+                    INSERT INTO events (event_id, sport, event_name) SELECT event_id, sport, event_name FROM stage_events
+                    ON CONFLICT (event_id) DO UPDATE SET sport = EXCLUDED.sport
+                """)
+
+                cur.execute("""
+                    DELETE FROM participations p USING stage_part_delete s
+                    WHERE p.participation_id = s.participation_id_db
+                """)
+                cur.execute("""
+                    UPDATE participations p
+                    SET noc = s.noc, age = s.age, height = s.height, weight = s.weight, medal = s.medal
+                    FROM stage_part_upsert s
+                    WHERE p.participation_id = s.participation_id_db
+                """)
+                cur.execute("""
+                    INSERT INTO participations (athlete_id, game_id, event_id, noc, age, height, weight, medal)
+                    SELECT athlete_id, game_id, event_id, noc, age, height, weight, medal
+                    FROM stage_part_upsert WHERE participation_id_db IS NULL
+                """)
+
+                # Anagrafiche non piu' presenti nella sorgente: rimosse solo se non referenziate.
+                cur.execute("""
+                    DELETE FROM athletes a WHERE a.athlete_id = ANY(%s)
+                      AND NOT EXISTS (SELECT 1 FROM participations p WHERE p.athlete_id = a.athlete_id)
+                """, (athletes_removed['athlete_id'].astype(int).tolist(),))
+                cur.execute("""
+                    DELETE FROM games g WHERE g.game_name = ANY(%s)
+                      AND NOT EXISTS (SELECT 1 FROM participations p WHERE p.game_id = g.game_id)
+                """, (games_removed['game_name'].tolist(),))
+                cur.execute("""
+                    DELETE FROM events e WHERE e.event_name = ANY(%s)
+                      AND NOT EXISTS (SELECT 1 FROM participations p WHERE p.event_id = e.event_id)
+                """, (events_removed['event_name'].tolist(),))
+                cur.execute("""
+                    DELETE FROM nations n WHERE n.noc = ANY(%s)
+                      AND NOT EXISTS (SELECT 1 FROM participations p WHERE p.noc = n.noc)
+                """, (nations_removed['noc'].tolist(),))
+
+                touched = set(parts_new['athlete_id']) | set(parts_changed['athlete_id']) | set(parts_removed['athlete_id'])
+                touched |= set(athletes_changed['athlete_id'])
+                if len(touched) > SUMMARY_REBUILD_THRESHOLD:
+                    rebuild_athlete_summary(cur)
+                else:
+                    refresh_athlete_summary(cur, touched)
+
+                # Le partecipazioni cambiano solo all'interno della propria edizione: basta
+                # ricalcolare il cubo delle edizioni toccate. Un evento che cambia sport sposta
+                # invece righe di ogni edizione, quindi il cubo viene ricostruito.
+                if len(events_changed):
+                    rebuild_medal_rollup(cur)
+                else:
+                    refresh_medal_rollup_games(cur, set(parts_new['game_id']) | set(parts_changed['game_id'])
+                                               | set(parts_removed['game_id']))
+                bump_data_version(cur)
+
+        print("Ingestione incrementale completata. La transazione e' stata confermata (COMMIT).")
+        print(f"Tempo totale: {time.perf_counter() - start:.1f} s")
+
+    except Exception as e:
+        print(f"Si e' verificato un errore critico durante l'ingestione incrementale: {e}")
+        print("La transazione e' stata annullata. Nessun dato e' stato salvato.")
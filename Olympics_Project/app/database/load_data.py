@@ -1,73 +1,285 @@
-import pandas as pd
-from sqlalchemy import create_engine
+import argparse
+import io
 import os
+import time
+
+import pandas as pd
+import psycopg
+
+from summary import rebuild_athlete_summary
+from rollup import rebuild_medal_rollup
+from versioning import bump_data_version
+from partitions import is_partitioned, rebuild_participations
+import snapshot
 
 DB_USER = os.getenv('DB_USER', 'user')
 DB_PASS = os.getenv('DB_PASS', 'password')
 DB_HOST = os.getenv('DB_HOST', 'db')
 DB_NAME = os.getenv('DB_NAME', 'olympics_db')
-DB_URL = f"postgresql+psycopg://{DB_USER}:{DB_PASS}@{DB_HOST}:5432/{DB_NAME}"
-engine = create_engine(DB_URL)
 
-def run_ingestion():
-    print("Avvio del processo di preparazione e caricamento dati...")
+EVENTS_CSV = 'data/athlete_events.csv'
+REGIONS_CSV = 'data/noc_regions.csv'
+CHUNK_SIZE = int(os.getenv('LOAD_CHUNK_SIZE', '50000'))
 
-    try:
-        df_main = pd.read_csv('data/athlete_events.csv')
-        df_regions = pd.read_csv('data/noc_regions.csv')
-    except FileNotFoundError:
-        print("Errore: Impossibile trovare i file CSV. Assicurarsi che siano presenti nella cartella 'data/'.")
+TABLES = {
+    'nations': ['noc', 'region', 'notes'],
+    'athletes': ['athlete_id', 'name', 'sex'],
+    'games': ['game_id', 'game_name', 'year', 'season', 'city'],
+    'events': ['event_id', 'sport', 'event_name'],
+    'participations': ['athlete_id', 'game_id', 'event_id', 'noc', 'age', 'height', 'weight', 'medal'],
+}
+
+CSV_COLUMNS = ['ID', 'Name', 'Sex', 'Age', 'Height', 'Weight', 'NOC', 'Games', 'Year', 'Season', 'City', 'Sport', 'Event', 'Medal']
+CSV_DTYPES = {'ID': 'int32', 'Age': 'Int16', 'Height': 'Int16', 'Year': 'int16'}
+# Caricamento completo: le colonne testuali ripetute diventano categorie (un codice per riga
+# invece di una stringa Python) e il peso un float32.
+LOAD_DTYPES = {
+    **CSV_DTYPES,
+    'Weight': 'float32',
+    **dict.fromkeys(['Sex', 'NOC', 'Games', 'Season', 'City', 'Sport', 'Event', 'Medal'], 'category'),
+}
+
+
+class CopyStats:
+    def __init__(self):
+        self.rows = dict.fromkeys(TABLES, 0)
+        self.seconds = dict.fromkeys(TABLES, 0.0)
+
+    def report(self):
+        for table in TABLES:
+            rows, seconds = self.rows[table], self.seconds[table]
+            rate = rows / seconds if seconds else 0
+            print(f"  {table:<15} {rows:>9} righe  {seconds:>7.2f} s  {rate:>10.0f} righe/s")
+
+
+def copy_frame(cur, table, frame, stats):
+    # COPY in formato CSV: pandas serializza il blocco in C e PostgreSQL lo legge in un
+    # unico flusso, senza un INSERT per riga. Le celle vuote diventano NULL.
+    if frame.empty:
         return
+    buffer = io.StringIO()
+    frame.to_csv(buffer, header=False, index=False)
+    copy_csv(cur, table, buffer.getvalue(), len(frame), stats)
+
+
+def copy_csv(cur, table, data, rows, stats):
+    start = time.perf_counter()
+    columns = ', '.join(TABLES[table])
+    with cur.copy(f"COPY {table} ({columns}) FROM STDIN (FORMAT csv)") as copy:
+        copy.write(data)
+    stats.seconds[table] += time.perf_counter() - start
+    stats.rows[table] += rows
+
+
+def drop_indexes_and_constraints(cur):
+    # Salva le definizioni di indici secondari e chiavi esterne delle tabelle caricate e
+    # li rimuove: vengono ricreati una sola volta a fine caricamento. Con Participations
+    # partizionata bastano indici e vincoli della tabella padre (conparentid = 0): quelli
+    # delle partizioni li seguono.
+    tables = list(TABLES)
+    cur.execute("""
+        SELECT i.indexname, i.indexdef
+        FROM pg_indexes i
+        WHERE i.schemaname = current_schema() AND i.tablename = ANY(%s)
+          AND NOT EXISTS (
+              SELECT 1 FROM pg_constraint c
+              WHERE c.conindid = format('%%I.%%I', i.schemaname, i.indexname)::regclass
+          )
+    """, (tables,))
+    indexes = cur.fetchall()
+    cur.execute("""
+        SELECT c.conrelid::regclass::text, c.conname, pg_get_constraintdef(c.oid)
+        FROM pg_constraint c
+        WHERE c.contype = 'f' AND c.conparentid = 0
+          AND (c.conrelid::regclass::text = ANY(%s) OR c.confrelid::regclass::text = ANY(%s))
+    """, (tables, tables))
+    constraints = cur.fetchall()
+
+    for table, name, _ in constraints:
+        cur.execute(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"')
+    for name, _ in indexes:
+        cur.execute(f'DROP INDEX "{name}"')
+    return indexes, constraints
+
+
+def restore_indexes_and_constraints(cur, indexes, constraints):
+    for _, definition in indexes:
+        # Sulla tabella partizionata l'indice va ricreato anche sulle partizioni.
+        cur.execute(definition.replace(' ON ONLY ', ' ON ', 1))
+    for table, name, definition in constraints:
+        cur.execute(f'ALTER TABLE {table} ADD CONSTRAINT "{name}" {definition}')
 
-    print("Elaborazione e normalizzazione dei dati in corso...")
 
-    df_main['Medal'] = df_main['Medal'].fillna('NA')
+def sync_sequences(cur):
+    for table, column in (('athletes', 'athlete_id'), ('games', 'game_id'), ('events', 'event_id'),
+                          ('participations', 'participation_id')):
+        cur.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, %s), COALESCE(MAX({column}), 0) + 1, false) FROM {table}",
+            (table, column),
+        )
 
-    unique_nocs = pd.DataFrame({'noc': df_main['NOC'].unique()})
-    nations = unique_nocs.merge(df_regions, how='left', left_on='noc', right_on='NOC')
-    nations = nations[['noc', 'region', 'notes']]
 
-    athletes = df_main[['ID', 'Name', 'Sex']].drop_duplicates(subset=['ID'])
-    athletes.columns = ['athlete_id', 'name', 'sex']
+def normalize():
+    # Legge il CSV a blocchi e restituisce, per ogni blocco, le righe nuove delle cinque
+    # tabelle con le colonne di TABLES. Gli ID di edizioni ed eventi seguono l'ordine di
+    # prima apparizione, quindi non dipendono dalla dimensione dei blocchi.
+    regions = pd.read_csv(REGIONS_CSV)
+    seen_nocs = set()
+    seen_athletes = set()
+    game_ids = {}
+    event_ids = {}
 
-    games = df_main[['Games', 'Year', 'Season', 'City']].drop_duplicates(subset=['Games'])
-    games.columns = ['game_name', 'year', 'season', 'city']
-    games['game_id'] = range(1, len(games) + 1)
+    reader = pd.read_csv(EVENTS_CSV, usecols=CSV_COLUMNS, dtype=LOAD_DTYPES, chunksize=CHUNK_SIZE)
+    for chunk in reader:
+        if 'NA' not in chunk['Medal'].cat.categories:
+            chunk['Medal'] = chunk['Medal'].cat.add_categories('NA')
+        chunk['Medal'] = chunk['Medal'].fillna('NA')
 
-    events = df_main[['Sport', 'Event']].drop_duplicates(subset=['Event'])
-    events.columns = ['sport', 'event_name']
-    events['event_id'] = range(1, len(events) + 1)
+        new_nocs = [noc for noc in chunk['NOC'].unique().tolist() if noc not in seen_nocs]
+        nations = pd.DataFrame({'noc': new_nocs}, dtype=object)
+        nations = nations.merge(regions, how='left', left_on='noc', right_on='NOC')[TABLES['nations']]
+        seen_nocs.update(new_nocs)
 
-    part_temp = df_main.merge(games[['game_name', 'game_id']], left_on='Games', right_on='game_name')
-    part_temp = part_temp.merge(events[['event_name', 'event_id']], left_on='Event', right_on='event_name')
-    
-    participations = part_temp[['ID', 'game_id', 'event_id', 'NOC', 'Age', 'Height', 'Weight', 'Medal']]
-    participations.columns = ['athlete_id', 'game_id', 'event_id', 'noc', 'age', 'height', 'weight', 'medal']
+        athletes = chunk[['ID', 'Name', 'Sex']].drop_duplicates(subset=['ID'])
+        athletes = athletes[~athletes['ID'].isin(seen_athletes)]
+        athletes.columns = TABLES['athletes']
+        seen_athletes.update(athletes['athlete_id'].tolist())
 
-    print("Inizio l'inserimento dei dati nel database. L'operazione richiedera' alcuni minuti...")
+        games = chunk[['Games', 'Year', 'Season', 'City']].drop_duplicates(subset=['Games'])
+        games = games[~games['Games'].isin(game_ids)].copy()
+        games.insert(0, 'game_id', range(len(game_ids) + 1, len(game_ids) + len(games) + 1))
+        game_ids.update(zip(games['Games'], games['game_id']))
+        games.columns = TABLES['games']
 
+        events = chunk[['Sport', 'Event']].drop_duplicates(subset=['Event'])
+        events = events[~events['Event'].isin(event_ids)].copy()
+        events.insert(0, 'event_id', range(len(event_ids) + 1, len(event_ids) + len(events) + 1))
+        event_ids.update(zip(events['Event'], events['event_id']))
+        events.columns = TABLES['events']
+
+        participations = pd.DataFrame({
+            'athlete_id': chunk['ID'],
+            'game_id': chunk['Games'].map(game_ids).astype('int16'),
+            'event_id': chunk['Event'].map(event_ids).astype('int32'),
+            'noc': chunk['NOC'],
+            'age': chunk['Age'],
+            'height': chunk['Height'],
+            'weight': chunk['Weight'],
+            'medal': chunk['Medal'],
+        })
+        yield {'nations': nations, 'athletes': athletes, 'games': games, 'events': events,
+               'participations': participations}
+
+
+def stream_ingestion(cur, stats, writer=None):
+    # Con writer le stesse righe finiscono anche nello snapshot, blocco per blocco.
+    try:
+        for chunk_no, frames in enumerate(normalize(), start=1):
+            for table, frame in frames.items():
+                copy_frame(cur, table, frame, stats)
+                if writer:
+                    writer.write(table, frame)
+            print(f"Blocco {chunk_no}: {stats.rows['participations']} partecipazioni caricate.")
+    except BaseException:
+        if writer:
+            writer.abort()
+        raise
+    if writer:
+        print(f"Snapshot delle tabelle normalizzate salvato in {writer.close()}.")
+
+
+def snapshot_ingestion(cur, directory, stats):
+    # Nessun parsing ne' normalizzazione: le tabelle sono lette a blocchi dal Parquet.
+    for table in TABLES:
+        for rows, data in snapshot.csv_batches(directory, table, CHUNK_SIZE):
+            copy_csv(cur, table, data, rows, stats)
+        print(f"Tabella {table}: {stats.rows[table]} righe caricate dallo snapshot.")
+
+
+def build_snapshot(digest):
+    writer = snapshot.SnapshotWriter(digest)
     try:
-        with engine.begin() as connection:
-            nations.to_sql('nations', con=connection, if_exists='append', index=False)
-            print("Caricamento tabella 'nations' completato.")
+        for frames in normalize():
+            for table, frame in frames.items():
+                writer.write(table, frame)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.close()
+
+
+def run_ingestion(use_snapshot=True, partitioned=False):
+    print("Avvio del processo di preparazione e caricamento dati...")
+
+    if not os.path.exists(EVENTS_CSV) or not os.path.exists(REGIONS_CSV):
+        print("Errore: Impossibile trovare i file CSV. Assicurarsi che siano presenti nella cartella 'data/'.")
+        return
+
+    # Lo snapshot e' identificato dall'hash dei due CSV: se i file non cambiano si salta
+    # la lettura e la normalizzazione.
+    digest = None
+    if use_snapshot and snapshot.available():
+        digest = snapshot.source_hash(EVENTS_CSV, REGIONS_CSV)
+    elif use_snapshot:
+        print("pyarrow non installato: snapshot delle tabelle normalizzate disattivato.")
+    directory = snapshot.find_snapshot(digest) if digest else None
+
+    stats = CopyStats()
+    start = time.perf_counter()
+
+    try:
+        with psycopg.connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS) as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT EXISTS (SELECT 1 FROM participations)")
+                if cur.fetchone()[0]:
+                    print("Errore: le tabelle contengono gia' dati. Svuotarle prima di un caricamento completo.")
+                    return
+
+                # Le partizioni vengono create dal trigger su Games durante il COPY.
+                if partitioned and not is_partitioned(cur):
+                    rebuild_participations(cur, True)
+                    print("Tabella 'participations' partizionata per edizione.")
 
-            athletes.to_sql('athletes', con=connection, if_exists='append', index=False)
-            print("Caricamento tabella 'athletes' completato.")
+                indexes, constraints = drop_indexes_and_constraints(cur)
+                print(f"Rimossi temporaneamente {len(indexes)} indici e {len(constraints)} chiavi esterne.")
 
-            games.to_sql('games', con=connection, if_exists='append', index=False)
-            print("Caricamento tabella 'games' completato.")
+                if directory:
+                    print(f"Caricamento tramite COPY dallo snapshot {directory} (CSV non riletto)...")
+                    snapshot_ingestion(cur, directory, stats)
+                else:
+                    print("Caricamento in streaming dei dati tramite COPY...")
+                    stream_ingestion(cur, stats, snapshot.SnapshotWriter(digest) if digest else None)
 
-            events.to_sql('events', con=connection, if_exists='append', index=False)
-            print("Caricamento tabella 'events' completato.")
+                print("Ricostruzione di indici e vincoli...")
+                restore_indexes_and_constraints(cur, indexes, constraints)
+                sync_sequences(cur)
+                for table in TABLES:
+                    cur.execute(f"ANALYZE {table}")
 
-            participations.to_sql('participations', con=connection, if_exists='append', index=False)
-            print("Caricamento tabella 'participations' completato.")
+                rebuild_athlete_summary(cur)
+                rebuild_medal_rollup(cur)
+                bump_data_version(cur)
+                print("Ricostruzione delle tabelle 'athletesummary' e 'medalrollup' completata.")
 
         print("Processo terminato con successo. La transazione e' stata confermata (COMMIT).")
+        stats.report()
+        print(f"Tempo totale: {time.perf_counter() - start:.1f} s")
 
     except Exception as e:
         print(f"Si e' verificato un errore critico durante l'inserimento: {e}")
         print("La transazione e' stata annullata. Nessun dato e' stato salvato.")
 
 if __name__ == "__main__":
-    run_ingestion()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Carica il dataset olimpico in PostgreSQL.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="applica solo le differenze rispetto ai dati gia' presenti nel database")
+    parser.add_argument('--no-snapshot', action='store_true',
+                        help="rilegge sempre il CSV senza usare ne' aggiornare lo snapshot Parquet")
+    parser.add_argument('--partitioned', action='store_true',
+                        help="partiziona Participations per edizione prima del caricamento completo")
+    args = parser.parse_args()
+    if args.incremental:
+        from incremental import run_incremental_ingestion
+        run_incremental_ingestion()
+    else:
+        run_ingestion(use_snapshot=not args.no_snapshot, partitioned=args.partitioned)
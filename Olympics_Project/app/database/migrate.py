@@ -0,0 +1,190 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+
+import psycopg
+
+DB_USER = os.getenv('DB_USER', 'user')
+DB_PASS = os.getenv('DB_PASS', 'password')
+DB_HOST = os.getenv('DB_HOST', 'db')
+DB_NAME = os.getenv('DB_NAME', 'olympics_db')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MIGRATIONS_DIR = os.path.join(BASE_DIR, 'migrations')
+BASE_SCHEMA = os.path.join(BASE_DIR, 'Create_table.sql')
+PLAN_QUERIES = os.path.join(BASE_DIR, 'query.sql')
+
+MIGRATION_FILE = re.compile(r'^(\d{4})_([\w-]+)\.sql$')
+
+
+def split_statements(sql):
+    # Divide un file SQL sui ';' fuori dalle stringhe e rimuove i commenti di riga.
+    statements = []
+    current = []
+    in_string = False
+    for line in sql.splitlines():
+        if not in_string and line.lstrip().startswith('--'):
+            continue
+        for ch in line:
+            if ch == "'":
+                in_string = not in_string
+            if ch == ';' and not in_string:
+                statement = ''.join(current).strip()
+                if statement:
+                    statements.append(statement)
+                current = []
+            else:
+                current.append(ch)
+        current.append('\n')
+    statement = ''.join(current).strip()
+    if statement:
+        statements.append(statement)
+    return statements
+
+
+def list_migrations():
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = MIGRATION_FILE.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(MIGRATIONS_DIR, filename), encoding='utf-8') as f:
+            sql = f.read()
+        migrations.append({
+            'version': int(match.group(1)),
+            'name': match.group(2),
+            'sql': sql,
+            'checksum': hashlib.sha256(sql.encode('utf-8')).hexdigest(),
+        })
+    return migrations
+
+
+def ensure_tracking_tables(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            checksum TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migration_plans (
+            version INTEGER NOT NULL REFERENCES schema_migrations(version),
+            phase TEXT NOT NULL CHECK (phase IN ('before', 'after')),
+            query_no INTEGER NOT NULL,
+            query TEXT NOT NULL,
+            total_cost NUMERIC,
+            plan JSONB,
+            error TEXT,
+            PRIMARY KEY (version, phase, query_no)
+        )
+    """)
+
+
+def explain_queries(conn, queries):
+    plans = []
+    for query_no, query in enumerate(queries, start=1):
+        try:
+            # Savepoint: un EXPLAIN fallito non deve invalidare la transazione della migrazione.
+            with conn.transaction():
+                with conn.cursor() as cur:
+                    cur.execute("EXPLAIN (FORMAT JSON) " + query)
+                    plan = cur.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            plans.append((query_no, query, plan[0]['Plan']['Total Cost'], plan, None))
+        except psycopg.Error as e:
+            plans.append((query_no, query, None, None, str(e).strip()))
+    return plans
+
+
+def apply_migration(conn, migration, queries):
+    with conn.transaction():
+        before = explain_queries(conn, queries)
+        with conn.cursor() as cur:
+            cur.execute(migration['sql'])
+        after = explain_queries(conn, queries)
+
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+                (migration['version'], migration['name'], migration['checksum']),
+            )
+            for phase, plans in (('before', before), ('after', after)):
+                cur.executemany(
+                    """
+                    INSERT INTO schema_migration_plans (version, phase, query_no, query, total_cost, plan, error)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    """,
+                    [
+                        (migration['version'], phase, query_no, query, cost,
+                         json.dumps(plan) if plan is not None else None, error)
+                        for query_no, query, cost, plan, error in plans
+                    ],
+                )
+    return before, after
+
+
+def print_plan_diff(before, after):
+    for (query_no, query, cost_before, _, _), (_, _, cost_after, _, _) in zip(before, after):
+        first_line = ' '.join(query.split())[:70]
+        if cost_before is None or cost_after is None:
+            print(f"  #{query_no:<3} {'n/d':>12} -> {'n/d':>12}  {first_line}")
+            continue
+        marker = ' *' if cost_after < cost_before else ''
+        print(f"  #{query_no:<3} {cost_before:>12.2f} -> {cost_after:>12.2f}{marker}  {first_line}")
+
+
+def run_migrations(show_status=False):
+    with open(PLAN_QUERIES, encoding='utf-8') as f:
+        queries = split_statements(f.read())
+
+    with psycopg.connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS) as conn:
+        with conn.cursor() as cur:
+            ensure_tracking_tables(cur)
+            cur.execute("SELECT version, checksum FROM schema_migrations")
+            applied = dict(cur.fetchall())
+        conn.commit()
+
+        migrations = list_migrations()
+        if show_status:
+            for migration in migrations:
+                state = 'applicata' if migration['version'] in applied else 'in attesa'
+                print(f"{migration['version']:04d} {migration['name']}: {state}")
+            return
+
+        with open(BASE_SCHEMA, encoding='utf-8') as f:
+            base_sql = f.read()
+        with conn.cursor() as cur:
+            cur.execute(base_sql)
+        conn.commit()
+        print("Schema di base verificato (Create_table.sql).")
+
+        pending = []
+        for migration in migrations:
+            if migration['version'] in applied:
+                if applied[migration['version']] != migration['checksum']:
+                    print(f"Attenzione: la migrazione {migration['version']:04d} e' stata modificata dopo l'applicazione.")
+                continue
+            pending.append(migration)
+
+        if not pending:
+            print("Nessuna migrazione da applicare.")
+            return
+
+        for migration in pending:
+            print(f"Applicazione migrazione {migration['version']:04d}_{migration['name']}...")
+            before, after = apply_migration(conn, migration, queries)
+            print("Costo stimato delle query di query.sql (prima -> dopo):")
+            print_plan_diff(before, after)
+        print(f"Migrazioni applicate: {len(pending)}.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Applica in ordine le migrazioni dello schema non ancora eseguite.")
+    parser.add_argument('--status', action='store_true', help="mostra lo stato delle migrazioni senza applicarle")
+    args = parser.parse_args()
+    run_migrations(show_status=args.status)
@@ -0,0 +1,25 @@
+-- Indici sulle chiavi esterne di Participations per le pagine di dettaglio
+-- (atleta, nazione, edizione, sport) e indice parziale sulle righe con medaglia.
+
+ALTER TABLE Participations ALTER COLUMN medal SET DEFAULT 'NA';
+
+CREATE INDEX IF NOT EXISTS idx_participations_athlete
+    ON Participations (athlete_id) INCLUDE (game_id, event_id, noc, medal);
+
+CREATE INDEX IF NOT EXISTS idx_participations_noc
+    ON Participations (noc, athlete_id) INCLUDE (game_id, event_id, medal);
+
+CREATE INDEX IF NOT EXISTS idx_participations_game
+    ON Participations (game_id, athlete_id) INCLUDE (event_id, noc, medal);
+
+CREATE INDEX IF NOT EXISTS idx_participations_event
+    ON Participations (event_id, athlete_id) INCLUDE (game_id, noc, medal);
+
+CREATE INDEX IF NOT EXISTS idx_participations_medals
+    ON Participations (medal, athlete_id) INCLUDE (game_id, event_id, noc)
+    WHERE medal <> 'NA';
+
+CREATE INDEX IF NOT EXISTS idx_events_sport ON Events (sport, event_id);
+
+ANALYZE Participations;
+ANALYZE Events;
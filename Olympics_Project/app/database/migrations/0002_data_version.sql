@@ -0,0 +1,9 @@
+-- Contatore globale dei dati: ogni scrittura lo incrementa, le cache dell'applicazione
+-- (risposte HTTP, tabelle di riferimento) lo usano per sapere quando invalidarsi.
+
+CREATE TABLE IF NOT EXISTS DataVersion (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO DataVersion (id, version) VALUES (TRUE, 0) ON CONFLICT (id) DO NOTHING;
@@ -0,0 +1,9 @@
+-- Sequenza per gli ID degli atleti: sostituisce il calcolo MAX(athlete_id) + 1, che a ogni
+-- inserimento legge l'indice e assegna lo stesso ID a due scritture concorrenti.
+-- Gli import massivi riservano un blocco di ID con una sola chiamata.
+
+CREATE SEQUENCE IF NOT EXISTS athletes_athlete_id_seq OWNED BY Athletes.athlete_id;
+
+ALTER TABLE Athletes ALTER COLUMN athlete_id SET DEFAULT nextval('athletes_athlete_id_seq');
+
+SELECT setval('athletes_athlete_id_seq', COALESCE(MAX(athlete_id), 0) + 1, false) FROM Athletes;
@@ -0,0 +1,34 @@
+-- Cubo precalcolato per il medagliere: per ogni nazione, edizione e sport il numero di
+-- ori, argenti, bronzi e partecipazioni, piu' una riga di totale per nazione ed edizione
+-- (sport = ''). Le celle sono limitate da nazioni x edizioni x sport indipendentemente dal
+-- numero di partecipazioni: ogni combinazione di filtri su stagione, anni, sport e nazione
+-- aggrega poche righe invece di Participations.
+
+CREATE TABLE IF NOT EXISTS MedalRollup (
+    noc VARCHAR(3) NOT NULL,
+    game_id INTEGER NOT NULL,
+    sport VARCHAR(255) NOT NULL,
+    gold INTEGER NOT NULL,
+    silver INTEGER NOT NULL,
+    bronze INTEGER NOT NULL,
+    participations INTEGER NOT NULL,
+    PRIMARY KEY (noc, game_id, sport)
+);
+
+CREATE INDEX IF NOT EXISTS idx_medal_rollup_game ON MedalRollup (game_id);
+
+CREATE INDEX IF NOT EXISTS idx_medal_rollup_sport ON MedalRollup (sport);
+
+TRUNCATE MedalRollup;
+
+INSERT INTO MedalRollup (noc, game_id, sport, gold, silver, bronze, participations)
+SELECT p.noc, p.game_id, COALESCE(e.sport, ''),
+        COUNT(*) FILTER (WHERE p.medal = 'Gold'),
+        COUNT(*) FILTER (WHERE p.medal = 'Silver'),
+        COUNT(*) FILTER (WHERE p.medal = 'Bronze'),
+        COUNT(*)
+FROM Participations p
+JOIN Events e ON p.event_id = e.event_id
+GROUP BY GROUPING SETS ((p.noc, p.game_id, e.sport), (p.noc, p.game_id));
+
+ANALYZE MedalRollup;
@@ -0,0 +1,159 @@
+-- Totali globali (homepage e /api/v1/stats) mantenuti esatti dai trigger: ogni istruzione
+-- su Athletes, Nations, Games e Participations aggiorna la riga unica di GlobalStats con i
+-- conteggi delle proprie tabelle di transizione, invece di ricontare le tabelle a ogni visita.
+-- I trigger sono per istruzione: un COPY o un'operazione massiva aggiornano la riga una volta.
+
+CREATE TABLE IF NOT EXISTS GlobalStats (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    athletes BIGINT NOT NULL DEFAULT 0,
+    nations BIGINT NOT NULL DEFAULT 0,
+    games BIGINT NOT NULL DEFAULT 0,
+    participations BIGINT NOT NULL DEFAULT 0,
+    medals BIGINT NOT NULL DEFAULT 0,
+    gold BIGINT NOT NULL DEFAULT 0,
+    silver BIGINT NOT NULL DEFAULT 0,
+    bronze BIGINT NOT NULL DEFAULT 0,
+    summer_medals BIGINT NOT NULL DEFAULT 0,
+    winter_medals BIGINT NOT NULL DEFAULT 0
+);
+
+-- Ricalcolo completo: usato qui per l'inizializzazione, dopo un TRUNCATE e quando cambia
+-- la stagione di un'edizione.
+CREATE OR REPLACE FUNCTION refresh_global_stats() RETURNS void AS $$
+    INSERT INTO GlobalStats (id, athletes, nations, games, participations, medals, gold, silver, bronze,
+                             summer_medals, winter_medals)
+    SELECT TRUE,
+           (SELECT COUNT(*) FROM Athletes),
+           (SELECT COUNT(*) FROM Nations),
+           (SELECT COUNT(*) FROM Games),
+           COUNT(*),
+           COUNT(*) FILTER (WHERE p.medal <> 'NA'),
+           COUNT(*) FILTER (WHERE p.medal = 'Gold'),
+           COUNT(*) FILTER (WHERE p.medal = 'Silver'),
+           COUNT(*) FILTER (WHERE p.medal = 'Bronze'),
+           COUNT(*) FILTER (WHERE p.medal <> 'NA' AND g.season = 'Summer'),
+           COUNT(*) FILTER (WHERE p.medal <> 'NA' AND g.season = 'Winter')
+    FROM Participations p
+    LEFT JOIN Games g ON g.game_id = p.game_id
+    ON CONFLICT (id) DO UPDATE SET
+        athletes = EXCLUDED.athletes,
+        nations = EXCLUDED.nations,
+        games = EXCLUDED.games,
+        participations = EXCLUDED.participations,
+        medals = EXCLUDED.medals,
+        gold = EXCLUDED.gold,
+        silver = EXCLUDED.silver,
+        bronze = EXCLUDED.bronze,
+        summer_medals = EXCLUDED.summer_medals,
+        winter_medals = EXCLUDED.winter_medals;
+$$ LANGUAGE sql;
+
+-- Athletes, Nations e Games: il totale cambia del numero di righe inserite o eliminate.
+-- TG_ARGV[0] e' la colonna di GlobalStats da aggiornare.
+CREATE OR REPLACE FUNCTION global_stats_count() RETURNS trigger AS $$
+DECLARE
+    delta BIGINT;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT COUNT(*) INTO delta FROM new_rows;
+    ELSE
+        SELECT -COUNT(*) INTO delta FROM old_rows;
+    END IF;
+    IF delta <> 0 THEN
+        EXECUTE format('UPDATE GlobalStats SET %1$I = %1$I + $1', TG_ARGV[0]) USING delta;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Participations: le righe nuove contano +1 e quelle vecchie -1, quindi una modifica di
+-- medaglia o edizione sposta il conteggio senza ricontare la tabella.
+CREATE OR REPLACE FUNCTION global_stats_participations() RETURNS trigger AS $$
+BEGIN
+    EXECUTE format($sql$
+        UPDATE GlobalStats s SET
+            participations = s.participations + d.participations,
+            medals = s.medals + d.medals,
+            gold = s.gold + d.gold,
+            silver = s.silver + d.silver,
+            bronze = s.bronze + d.bronze,
+            summer_medals = s.summer_medals + d.summer_medals,
+            winter_medals = s.winter_medals + d.winter_medals
+        FROM (
+            SELECT COALESCE(SUM(c.sign), 0) AS participations,
+                   COALESCE(SUM(c.sign) FILTER (WHERE c.medal <> 'NA'), 0) AS medals,
+                   COALESCE(SUM(c.sign) FILTER (WHERE c.medal = 'Gold'), 0) AS gold,
+                   COALESCE(SUM(c.sign) FILTER (WHERE c.medal = 'Silver'), 0) AS silver,
+                   COALESCE(SUM(c.sign) FILTER (WHERE c.medal = 'Bronze'), 0) AS bronze,
+                   COALESCE(SUM(c.sign) FILTER (WHERE c.medal <> 'NA' AND g.season = 'Summer'), 0) AS summer_medals,
+                   COALESCE(SUM(c.sign) FILTER (WHERE c.medal <> 'NA' AND g.season = 'Winter'), 0) AS winter_medals
+            FROM (%s) c
+            LEFT JOIN Games g ON g.game_id = c.game_id
+        ) d
+        WHERE (d.participations, d.medals, d.gold, d.silver, d.bronze, d.summer_medals, d.winter_medals)
+            <> (0, 0, 0, 0, 0, 0, 0)
+    $sql$, CASE TG_OP
+        WHEN 'INSERT' THEN 'SELECT 1 AS sign, game_id, medal FROM new_rows'
+        WHEN 'DELETE' THEN 'SELECT -1 AS sign, game_id, medal FROM old_rows'
+        ELSE 'SELECT 1 AS sign, game_id, medal FROM new_rows UNION ALL SELECT -1, game_id, medal FROM old_rows'
+    END);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION global_stats_refresh() RETURNS trigger AS $$
+BEGIN
+    PERFORM refresh_global_stats();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS global_stats_athletes_insert ON Athletes;
+CREATE TRIGGER global_stats_athletes_insert AFTER INSERT ON Athletes
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION global_stats_count('athletes');
+DROP TRIGGER IF EXISTS global_stats_athletes_delete ON Athletes;
+CREATE TRIGGER global_stats_athletes_delete AFTER DELETE ON Athletes
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION global_stats_count('athletes');
+
+DROP TRIGGER IF EXISTS global_stats_nations_insert ON Nations;
+CREATE TRIGGER global_stats_nations_insert AFTER INSERT ON Nations
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION global_stats_count('nations');
+DROP TRIGGER IF EXISTS global_stats_nations_delete ON Nations;
+CREATE TRIGGER global_stats_nations_delete AFTER DELETE ON Nations
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION global_stats_count('nations');
+
+DROP TRIGGER IF EXISTS global_stats_games_insert ON Games;
+CREATE TRIGGER global_stats_games_insert AFTER INSERT ON Games
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION global_stats_count('games');
+DROP TRIGGER IF EXISTS global_stats_games_delete ON Games;
+CREATE TRIGGER global_stats_games_delete AFTER DELETE ON Games
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION global_stats_count('games');
+-- Il cambio di stagione di un'edizione sposta le sue medaglie tra estive e invernali.
+DROP TRIGGER IF EXISTS global_stats_games_update ON Games;
+CREATE TRIGGER global_stats_games_update AFTER UPDATE OF season ON Games
+    FOR EACH STATEMENT EXECUTE FUNCTION global_stats_refresh();
+
+DROP TRIGGER IF EXISTS global_stats_participations_insert ON Participations;
+CREATE TRIGGER global_stats_participations_insert AFTER INSERT ON Participations
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION global_stats_participations();
+DROP TRIGGER IF EXISTS global_stats_participations_update ON Participations;
+CREATE TRIGGER global_stats_participations_update AFTER UPDATE ON Participations
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION global_stats_participations();
+DROP TRIGGER IF EXISTS global_stats_participations_delete ON Participations;
+CREATE TRIGGER global_stats_participations_delete AFTER DELETE ON Participations
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION global_stats_participations();
+
+DROP TRIGGER IF EXISTS global_stats_athletes_truncate ON Athletes;
+CREATE TRIGGER global_stats_athletes_truncate AFTER TRUNCATE ON Athletes
+    FOR EACH STATEMENT EXECUTE FUNCTION global_stats_refresh();
+DROP TRIGGER IF EXISTS global_stats_nations_truncate ON Nations;
+CREATE TRIGGER global_stats_nations_truncate AFTER TRUNCATE ON Nations
+    FOR EACH STATEMENT EXECUTE FUNCTION global_stats_refresh();
+DROP TRIGGER IF EXISTS global_stats_games_truncate ON Games;
+CREATE TRIGGER global_stats_games_truncate AFTER TRUNCATE ON Games
+    FOR EACH STATEMENT EXECUTE FUNCTION global_stats_refresh();
+DROP TRIGGER IF EXISTS global_stats_participations_truncate ON Participations;
+CREATE TRIGGER global_stats_participations_truncate AFTER TRUNCATE ON Participations
+    FOR EACH STATEMENT EXECUTE FUNCTION global_stats_refresh();
+
+SELECT refresh_global_stats();
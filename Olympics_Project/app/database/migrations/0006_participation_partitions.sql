@@ -0,0 +1,23 @@
+-- Layout partizionato facoltativo (app/database/partitions.py): Participations divisa per
+-- edizione con LIST (game_id). Ogni nuova riga di Games riceve la sua partizione, anche
+-- durante il COPY di load_data.py; con la tabella non partizionata le funzioni non fanno nulla.
+
+CREATE OR REPLACE FUNCTION create_participation_partition(gid INTEGER) RETURNS void AS $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'participations'::regclass) = 'p' THEN
+        EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF Participations FOR VALUES IN (%s)',
+                       'participations_g' || gid, gid);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION games_create_partitions() RETURNS trigger AS $$
+BEGIN
+    PERFORM create_participation_partition(game_id) FROM new_rows;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS games_create_partitions ON Games;
+CREATE TRIGGER games_create_partitions AFTER INSERT ON Games
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION games_create_partitions();
@@ -0,0 +1,44 @@
+-- Riepilogo precalcolato per atleta (nome, ultima squadra, sport, edizioni, medaglie) letto
+-- dalla lista /athletes al posto dell'aggregazione su Participations. L'indice segue
+-- l'ordinamento della classifica. Le scritture lo aggiornano con app/database/summary.py.
+
+CREATE TABLE IF NOT EXISTS AthleteSummary (
+    athlete_id INTEGER PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    sex CHAR(1),
+    max_age INTEGER,
+    team VARCHAR(255),
+    noc VARCHAR(3),
+    sports TEXT,
+    games TEXT,
+    gold INTEGER NOT NULL DEFAULT 0,
+    silver INTEGER NOT NULL DEFAULT 0,
+    bronze INTEGER NOT NULL DEFAULT 0
+);
+
+-- Creata da versioni precedenti di Create_table.sql, non letta da nessuna query.
+ALTER TABLE AthleteSummary DROP COLUMN IF EXISTS regions;
+
+CREATE INDEX IF NOT EXISTS idx_athlete_summary_ranking
+    ON AthleteSummary ((-gold), (-silver), (-bronze), name, athlete_id);
+
+TRUNCATE AthleteSummary;
+
+INSERT INTO AthleteSummary (athlete_id, name, sex, max_age, team, noc, sports, games, gold, silver, bronze)
+SELECT a.athlete_id, a.name, a.sex,
+        MAX(p.age),
+        (ARRAY_AGG(n.region ORDER BY g.year DESC, p.participation_id DESC))[1],
+        (ARRAY_AGG(p.noc ORDER BY g.year DESC, p.participation_id DESC))[1],
+        STRING_AGG(DISTINCT e.sport, ', '),
+        STRING_AGG(DISTINCT g.game_name, ', '),
+        COUNT(p.medal) FILTER (WHERE p.medal = 'Gold'),
+        COUNT(p.medal) FILTER (WHERE p.medal = 'Silver'),
+        COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze')
+FROM Participations p
+JOIN Athletes a ON p.athlete_id = a.athlete_id
+JOIN Games g ON p.game_id = g.game_id
+JOIN Events e ON p.event_id = e.event_id
+JOIN Nations n ON p.noc = n.noc
+GROUP BY a.athlete_id, a.name, a.sex;
+
+ANALYZE AthleteSummary;
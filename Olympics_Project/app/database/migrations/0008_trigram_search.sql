@@ -0,0 +1,10 @@
+-- Ricerche libere (q) su atleti, nazioni, edizioni e sport: indici GIN trigram per i filtri
+-- ILIKE '%testo%' e per l'ordinamento per similarity() di app/search.py.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_athletes_name_trgm ON Athletes USING GIN (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_nations_region_trgm ON Nations USING GIN (region gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_nations_noc_trgm ON Nations USING GIN (noc gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_games_city_trgm ON Games USING GIN (city gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_events_sport_trgm ON Events USING GIN (sport gin_trgm_ops);
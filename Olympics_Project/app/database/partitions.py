@@ -0,0 +1,227 @@
+import argparse
+import io
+import os
+import time
+
+import psycopg
+
+from summary import refresh_athlete_summary
+from rollup import refresh_medal_rollup_games
+from versioning import bump_data_version
+
+# Layout facoltativo di Participations: una partizione LIST (game_id) per edizione, creata
+# dal trigger games_create_partitions (migrazione 0006). La chiave primaria diventa
+# (participation_id, game_id), perche' deve contenere la colonna di partizionamento.
+
+PARTITION_PREFIX = 'participations_g'
+EDITION_COLUMNS = ['athlete_id', 'game_id', 'event_id', 'noc', 'age', 'height', 'weight', 'medal']
+
+
+def is_partitioned(cur):
+    cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = 'participations'::regclass")
+    return cur.fetchone()[0]
+
+
+def partition_name(game_id):
+    return f'{PARTITION_PREFIX}{int(game_id)}'
+
+
+def rebuild_participations(cur, partitioned):
+    # Ricrea Participations nel layout richiesto e vi copia le righe. Indici secondari,
+    # chiavi esterne e trigger (GlobalStats) sono letti dal catalogo e ricreati a fine
+    # copia; la sequenza degli ID passa alla nuova tabella. I dati non cambiano, quindi
+    # tabelle derivate e DataVersion restano validi.
+    cur.execute("SELECT to_regproc('create_participation_partition') IS NOT NULL")
+    if partitioned and not cur.fetchone()[0]:
+        raise RuntimeError("funzione create_participation_partition assente: applicare la migrazione 0006 con migrate.py.")
+    cur.execute("LOCK TABLE participations IN ACCESS EXCLUSIVE MODE")
+    cur.execute("""
+        SELECT i.indexdef
+        FROM pg_indexes i
+        WHERE i.schemaname = current_schema() AND i.tablename = 'participations'
+          AND NOT EXISTS (
+              SELECT 1 FROM pg_constraint c
+              WHERE c.conindid = format('%I.%I', i.schemaname, i.indexname)::regclass
+          )
+    """)
+    indexes = [row[0].replace(' ON ONLY ', ' ON ', 1) for row in cur.fetchall()]
+    cur.execute("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = 'participations'::regclass AND contype = 'f'
+    """)
+    constraints = cur.fetchall()
+    cur.execute("""
+        SELECT pg_get_triggerdef(oid) FROM pg_trigger
+        WHERE tgrelid = 'participations'::regclass AND NOT tgisinternal
+    """)
+    triggers = [row[0] for row in cur.fetchall()]
+    cur.execute("SELECT pg_get_serial_sequence('participations', 'participation_id')")
+    sequence = cur.fetchone()[0]
+
+    cur.execute("ALTER TABLE participations RENAME TO participations_old")
+    cur.execute("ALTER TABLE participations_old RENAME CONSTRAINT participations_pkey TO participations_old_pkey")
+    cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY NONE")
+    layout = " PARTITION BY LIST (game_id)" if partitioned else ""
+    cur.execute(
+        "CREATE TABLE participations (LIKE participations_old INCLUDING DEFAULTS INCLUDING CONSTRAINTS)" + layout
+    )
+    if partitioned:
+        cur.execute("SELECT create_participation_partition(game_id) FROM games")
+    cur.execute("INSERT INTO participations SELECT * FROM participations_old")
+    cur.execute("DROP TABLE participations_old")
+
+    key = "participation_id, game_id" if partitioned else "participation_id"
+    cur.execute(f"ALTER TABLE participations ADD CONSTRAINT participations_pkey PRIMARY KEY ({key})")
+    cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY participations.participation_id")
+    for definition in indexes:
+        cur.execute(definition)
+    for name, definition in constraints:
+        cur.execute(f'ALTER TABLE participations ADD CONSTRAINT "{name}" {definition}')
+    for definition in triggers:
+        cur.execute(definition)
+    cur.execute("ANALYZE participations")
+
+
+def swap_edition_rows(cur, game_id, data, rows):
+    # Sostituisce le partecipazioni di un'edizione con le righe CSV di data (colonne
+    # EDITION_COLUMNS). Con il layout partizionato le righe vanno in una tabella nuova che
+    # prende il posto della partizione (DETACH/ATTACH) invece di DELETE e INSERT riga per
+    # riga. Restituisce il metodo usato.
+    game_id = int(game_id)
+    columns = ', '.join(EDITION_COLUMNS)
+
+    if is_partitioned(cur):
+        method = 'partition'
+        name = partition_name(game_id)
+        staging = f'{name}_load'
+        cur.execute(f"DROP TABLE IF EXISTS {staging}")
+        cur.execute(f"CREATE TABLE {staging} (LIKE participations INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        # Con il vincolo gia' presente ATTACH non deve rileggere la tabella per verificarlo.
+        cur.execute(f"ALTER TABLE {staging} ADD CONSTRAINT {staging}_game CHECK (game_id = {game_id})")
+        if rows:
+            with cur.copy(f"COPY {staging} ({columns}) FROM STDIN (FORMAT csv)") as copy:
+                copy.write(data)
+        cur.execute("SELECT to_regclass(%s)", (name,))
+        if cur.fetchone()[0]:
+            cur.execute(f"ALTER TABLE participations DETACH PARTITION {name}")
+            cur.execute(f"DROP TABLE {name}")
+        cur.execute(f"ALTER TABLE {staging} RENAME TO {name}")
+        cur.execute(f"ALTER TABLE participations ATTACH PARTITION {name} FOR VALUES IN ({game_id})")
+        cur.execute(f"ALTER TABLE {name} DROP CONSTRAINT {staging}_game")
+        cur.execute(f"ANALYZE {name}")
+        # ATTACH e DETACH non attivano i trigger di GlobalStats.
+        cur.execute("SELECT refresh_global_stats()")
+    else:
+        method = 'rows'
+        cur.execute("DELETE FROM participations WHERE game_id = %s", (game_id,))
+        if rows:
+            with cur.copy(f"COPY participations ({columns}) FROM STDIN (FORMAT csv)") as copy:
+                copy.write(data)
+    return method
+
+
+def replace_edition(cur, game_id, data, rows):
+    # Ricarica completa di un'edizione: righe, riepilogo degli atleti vecchi e nuovi,
+    # cubo delle medaglie e DataVersion.
+    cur.execute("SELECT DISTINCT athlete_id FROM participations WHERE game_id = %s", (game_id,))
+    athlete_ids = {row[0] for row in cur.fetchall()}
+    method = swap_edition_rows(cur, game_id, data, rows)
+    cur.execute("SELECT DISTINCT athlete_id FROM participations WHERE game_id = %s", (game_id,))
+    athlete_ids.update(row[0] for row in cur.fetchall())
+    refresh_athlete_summary(cur, athlete_ids)
+    refresh_medal_rollup_games(cur, [game_id])
+    bump_data_version(cur)
+    return method
+
+
+def edition_rows(cur, game_name):
+    # Righe dell'edizione lette dal CSV sorgente. Atleti, eventi e nazioni devono essere
+    # gia' nel database: le dimensioni nuove si caricano con load_data.py --incremental.
+    from incremental import read_source, read_table
+
+    participations = read_source()[-1]
+    cur.execute("SELECT game_id FROM games WHERE game_name = %s", (game_name,))
+    row = cur.fetchone()
+    if row is None:
+        raise ValueError(f"Edizione '{game_name}' non presente nel database.")
+    edition = participations[participations['game_name'] == game_name].copy()
+    if edition.empty:
+        raise ValueError(f"Edizione '{game_name}' non presente nel CSV sorgente.")
+
+    events = read_table(cur, "SELECT event_id, event_name FROM events")
+    edition = edition.merge(events, on='event_name', how='left')
+    cur.execute("SELECT athlete_id FROM athletes WHERE athlete_id = ANY(%s)",
+                (edition['athlete_id'].unique().tolist(),))
+    known_athletes = {r[0] for r in cur.fetchall()}
+    cur.execute("SELECT noc FROM nations")
+    known_nations = {r[0] for r in cur.fetchall()}
+    if (edition['event_id'].isna().any() or not edition['athlete_id'].isin(known_athletes).all()
+            or not edition['noc'].isin(known_nations).all()):
+        raise ValueError("L'edizione contiene atleti, eventi o nazioni nuovi: usare load_data.py --incremental.")
+
+    edition['game_id'] = row[0]
+    edition['event_id'] = edition['event_id'].astype('int64')
+    buffer = io.StringIO()
+    edition[EDITION_COLUMNS].to_csv(buffer, header=False, index=False)
+    return row[0], buffer.getvalue(), len(edition)
+
+
+def partition_status(cur):
+    cur.execute("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples::bigint,
+               pg_total_relation_size(c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'participations'::regclass
+        ORDER BY c.relname
+    """)
+    return cur.fetchall()
+
+
+if __name__ == "__main__":
+    conninfo = {
+        'host': os.getenv('DB_HOST', 'db'),
+        'dbname': os.getenv('DB_NAME', 'olympics_db'),
+        'user': os.getenv('DB_USER', 'user'),
+        'password': os.getenv('DB_PASS', 'password'),
+    }
+    parser = argparse.ArgumentParser(description="Gestisce il layout partizionato per edizione della tabella Participations.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('status', help="mostra il layout corrente e le partizioni")
+    commands.add_parser('partition', help="converte Participations in una tabella partizionata per edizione")
+    commands.add_parser('unpartition', help="riporta Participations a una tabella unica")
+    reload_parser = commands.add_parser('reload', help="ricarica dal CSV le partecipazioni di un'edizione")
+    reload_parser.add_argument('game_name', help="nome dell'edizione, es. '2016 Summer'")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with psycopg.connect(**conninfo) as conn:
+        with conn.cursor() as cur:
+            partitioned = is_partitioned(cur)
+            if args.command == 'status':
+                if not partitioned:
+                    print("Participations non e' partizionata.")
+                else:
+                    partitions = partition_status(cur)
+                    for name, bound, rows, size in partitions:
+                        print(f"  {name:<22} {bound:<20} {rows:>9} righe  {size / 1024:>9.0f} KB")
+                    print(f"Participations partizionata per edizione: {len(partitions)} partizioni.")
+            elif args.command in ('partition', 'unpartition'):
+                if partitioned == (args.command == 'partition'):
+                    print("Participations ha gia' il layout richiesto.")
+                else:
+                    print("Ricostruzione della tabella Participations...")
+                    try:
+                        rebuild_participations(cur, args.command == 'partition')
+                    except RuntimeError as e:
+                        raise SystemExit(f"Errore: {e}")
+                    print(f"Layout aggiornato in {time.perf_counter() - start:.1f} s.")
+            else:
+                try:
+                    game_id, data, rows = edition_rows(cur, args.game_name)
+                except ValueError as e:
+                    raise SystemExit(f"Errore: {e}")
+                method = replace_edition(cur, game_id, data, rows)
+                label = "sostituzione della partizione" if method == 'partition' else "DELETE e COPY"
+                print(f"Edizione {args.game_name}: {rows} partecipazioni ricaricate ({label}) "
+                      f"in {time.perf_counter() - start:.1f} s.")
@@ -1,8 +1,6 @@
-SELECT
-    (SELECT COUNT(*) FROM Athletes) AS athletes,
-    (SELECT COUNT(*) FROM Nations) AS nations,
-    (SELECT COUNT(*) FROM Games) AS games,
-    (SELECT COUNT(*) FROM Participations WHERE medal != 'NA') AS medals;
+SELECT athletes, nations, games, participations, medals, gold, silver, bronze,
+        summer_medals, winter_medals
+FROM GlobalStats WHERE id;
 
 SELECT a.athlete_id as id, a.name, a.sex, 
         MAX(p.age) as age, 
@@ -20,8 +18,8 @@ JOIN Events e ON p.event_id = e.event_id
 JOIN Nations n ON p.noc = n.noc
 WHERE 1=1 
 GROUP BY a.athlete_id, a.name, a.sex
-ORDER BY gold DESC, silver DESC, bronze DESC, a.name ASC
-LIMIT 500 OFFSET 0;
+ORDER BY gold DESC, silver DESC, bronze DESC, a.name ASC, a.athlete_id ASC
+LIMIT 501;
 
 SELECT a.athlete_id, a.name, a.sex, p.age, p.height, p.weight, n.region, e.sport, e.event_name, g.game_name, p.medal,
         g.game_id, e.event_id
@@ -33,8 +31,6 @@ JOIN Events e ON p.event_id = e.event_id
 WHERE a.athlete_id = 1
 ORDER BY g.year DESC;
 
-SELECT region FROM Nations WHERE noc = 'ITA';
-
 SELECT
     COUNT(DISTINCT p.athlete_id) AS total_athletes,
     COUNT(DISTINCT p.game_id) AS total_editions,
@@ -46,34 +42,20 @@ FROM Participations p
 JOIN Events e ON p.event_id = e.event_id
 WHERE p.noc = 'ITA';
 
-SELECT a.athlete_id, a.name, a.sex,
-    COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
-    COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
-    COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze,
-    COUNT(p.medal) FILTER (WHERE p.medal IN ('Gold', 'Silver', 'Bronze')) AS total_medals
-FROM Participations p
-JOIN Athletes a ON p.athlete_id = a.athlete_id
-WHERE p.noc = 'ITA'
-GROUP BY a.athlete_id, a.name, a.sex
-ORDER BY gold DESC, silver DESC, bronze DESC, a.name ASC
-LIMIT 3;
-
-SELECT a.athlete_id as id, a.name, 
+SELECT a.athlete_id, a.athlete_id AS id, a.name, a.sex,
         STRING_AGG(DISTINCT e.sport, ', ') as sport, 
-        COUNT(DISTINCT g.game_name)::text as game_name,
+        STRING_AGG(DISTINCT g.game_name, ', ') as game_name,
         COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
         COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
-        COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze
+        COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze,
+        COUNT(p.medal) FILTER (WHERE p.medal IN ('Gold', 'Silver', 'Bronze')) AS total_medals
 FROM Participations p
 JOIN Athletes a ON p.athlete_id = a.athlete_id
 JOIN Events e ON p.event_id = e.event_id
 JOIN Games g ON p.game_id = g.game_id
 WHERE p.noc = 'ITA'
-GROUP BY a.athlete_id, a.name
-ORDER BY gold DESC, silver DESC, bronze DESC, a.name ASC
-OFFSET 3;
-
-SELECT city, season, year FROM Games WHERE game_name = '2016 Summer';
+GROUP BY a.athlete_id, a.name, a.sex
+ORDER BY gold DESC, silver DESC, bronze DESC, a.name ASC, a.athlete_id ASC;
 
 SELECT
     COUNT(DISTINCT p.athlete_id) AS total_athletes,
@@ -85,38 +67,24 @@ SELECT
     COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze
 FROM Participations p
 JOIN Events e ON p.event_id = e.event_id
-JOIN Games g ON p.game_id = g.game_id
-WHERE g.game_name = '2016 Summer';
-
-SELECT a.athlete_id, a.name, n.region AS nation, a.sex,
-    COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
-    COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
-    COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze,
-    COUNT(p.medal) FILTER (WHERE p.medal IN ('Gold', 'Silver', 'Bronze')) AS total_medals
-FROM Participations p
-JOIN Athletes a ON p.athlete_id = a.athlete_id
-JOIN Nations n ON p.noc = n.noc
-JOIN Games g ON p.game_id = g.game_id
-WHERE g.game_name = '2016 Summer'
-GROUP BY a.athlete_id, a.name, n.region, a.sex
-ORDER BY gold DESC, silver DESC, bronze DESC, a.name ASC
-LIMIT 3;
+WHERE p.game_id = 1;
 
-SELECT a.athlete_id as id, a.name, MAX(n.region) as region, 
+SELECT a.athlete_id, a.athlete_id AS id, a.name, a.sex,
+        MAX(n.region) AS nation, MAX(n.region) AS region,
         STRING_AGG(DISTINCT e.sport, ', ') as sport,
         STRING_AGG(DISTINCT e.event_name, ', ') as event_name,
         COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
         COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
-        COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze
+        COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze,
+        COUNT(p.medal) FILTER (WHERE p.medal IN ('Gold', 'Silver', 'Bronze')) AS total_medals
 FROM Participations p
 JOIN Athletes a ON p.athlete_id = a.athlete_id
 JOIN Nations n ON p.noc = n.noc
 JOIN Events e ON p.event_id = e.event_id
-JOIN Games g ON p.game_id = g.game_id
-WHERE g.game_name = '2016 Summer'
-GROUP BY a.athlete_id, a.name
-ORDER BY gold DESC, silver DESC, bronze DESC, a.name ASC
-LIMIT 500 OFFSET 3;
+WHERE p.game_id = 1
+GROUP BY a.athlete_id, a.name, a.sex
+ORDER BY gold DESC, silver DESC, bronze DESC, a.name ASC, a.athlete_id ASC
+LIMIT 503;
 
 SELECT
     COUNT(DISTINCT p.athlete_id) AS total_athletes,
@@ -166,7 +134,7 @@ SELECT year, season, game_name, city FROM Games WHERE 1=1 ORDER BY year DESC, se
 SELECT sport, COUNT(DISTINCT event_name) as total_events FROM Events WHERE 1=1 GROUP BY sport ORDER BY sport ASC;
 
 SELECT noc, region FROM Nations ORDER BY region ASC;
-SELECT game_id, game_name, city FROM Games ORDER BY year DESC, season ASC;
+SELECT game_id, game_name, city, season, year FROM Games ORDER BY year DESC, season ASC;
 SELECT event_id, sport, event_name FROM Events ORDER BY sport ASC, event_name ASC;
 
 SELECT a.name, g.game_name, e.event_name, e.sport, 
@@ -179,7 +147,7 @@ JOIN Events e ON p.event_id = e.event_id
 JOIN Nations n ON p.noc = n.noc
 WHERE p.athlete_id = 1 AND p.game_id = 1 AND p.event_id = 1;
 
-SELECT COALESCE(MAX(athlete_id), 0) + 1 FROM Athletes;
+SELECT nextval(pg_get_serial_sequence('athletes', 'athlete_id')) FROM generate_series(1, 1000);
 
 INSERT INTO Athletes (athlete_id, name, sex) VALUES (2000001, 'Mario Rossi', 'M');
 
@@ -0,0 +1,5 @@
+#!/bin/bash
+# Eseguito una sola volta dall'immagine postgres alla creazione del database primario:
+# consente le connessioni di replica usate dal servizio db-replica di docker-compose.
+set -e
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
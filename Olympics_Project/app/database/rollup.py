@@ -0,0 +1,98 @@
+import os
+
+import psycopg
+
+# Il cubo ha due livelli nella stessa tabella: una riga per nazione, edizione e sport, e
+# una riga di totale per nazione ed edizione con sport = ''. I medaglieri che non filtrano
+# ne' raggruppano per sport leggono solo le righe di totale.
+
+ROLLUP_COLUMNS = "noc, game_id, sport, gold, silver, bronze, participations"
+
+ROLLUP_SELECT = """
+    SELECT p.noc, p.game_id, COALESCE(e.sport, ''),
+            COUNT(*) FILTER (WHERE p.medal = 'Gold'),
+            COUNT(*) FILTER (WHERE p.medal = 'Silver'),
+            COUNT(*) FILTER (WHERE p.medal = 'Bronze'),
+            COUNT(*)
+    FROM Participations p
+    JOIN Events e ON p.event_id = e.event_id
+"""
+
+ROLLUP_GROUPING = " GROUP BY GROUPING SETS ((p.noc, p.game_id, e.sport), (p.noc, p.game_id))"
+
+ROLLUP_CELLS = """
+    SELECT DISTINCT c.noc, c.game_id, e.sport
+    FROM unnest(%s::varchar[], %s::int[], %s::int[]) AS c(noc, game_id, event_id)
+    JOIN Events e ON e.event_id = c.event_id
+"""
+
+
+def lock_medal_rollup(cur):
+    # Due scritture concorrenti sulla stessa cella la ricalcolerebbero entrambe partendo
+    # dallo stesso snapshot: il lock serializza gli aggiornamenti del cubo fino al COMMIT.
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext('medal_rollup'))")
+
+
+def refresh_medal_rollup(cur, cells):
+    # Ricalcola solo le celle (nazione, edizione, sport) toccate da una scrittura e i totali
+    # delle relative coppie (nazione, edizione). Le celle arrivano come (noc, game_id,
+    # event_id): per una modifica vanno passati sia i valori vecchi sia quelli nuovi.
+    cells = {(str(noc), int(game_id), int(event_id)) for noc, game_id, event_id in cells}
+    if not cells:
+        return
+    params = tuple(list(values) for values in zip(*sorted(cells)))
+    lock_medal_rollup(cur)
+    cur.execute(f"""
+        DELETE FROM MedalRollup r USING ({ROLLUP_CELLS}) c
+        WHERE r.noc = c.noc AND r.game_id = c.game_id AND (r.sport = c.sport OR r.sport = '')
+    """, params)
+    cur.execute(f"""
+        WITH cells AS ({ROLLUP_CELLS})
+        INSERT INTO MedalRollup ({ROLLUP_COLUMNS}) {ROLLUP_SELECT}
+        JOIN cells c ON c.noc = p.noc AND c.game_id = p.game_id AND c.sport = e.sport
+        GROUP BY p.noc, p.game_id, e.sport
+    """, params)
+    # I totali si ricavano dalle celle per sport gia' aggiornate, senza rileggere Participations.
+    cur.execute(f"""
+        INSERT INTO MedalRollup ({ROLLUP_COLUMNS})
+        SELECT r.noc, r.game_id, '', SUM(r.gold), SUM(r.silver), SUM(r.bronze), SUM(r.participations)
+        FROM MedalRollup r
+        JOIN (SELECT DISTINCT noc, game_id FROM unnest(%s::varchar[], %s::int[]) AS c(noc, game_id)) c
+          ON c.noc = r.noc AND c.game_id = r.game_id
+        WHERE r.sport <> ''
+        GROUP BY r.noc, r.game_id
+    """, params[:2])
+
+
+def refresh_medal_rollup_games(cur, game_ids):
+    # Variante per edizione intera, usata dall'ingestione incrementale.
+    game_ids = sorted({int(i) for i in game_ids})
+    if not game_ids:
+        return
+    lock_medal_rollup(cur)
+    cur.execute("DELETE FROM MedalRollup WHERE game_id = ANY(%s)", (game_ids,))
+    cur.execute(
+        f"INSERT INTO MedalRollup ({ROLLUP_COLUMNS}) {ROLLUP_SELECT} WHERE p.game_id = ANY(%s) {ROLLUP_GROUPING}",
+        (game_ids,),
+    )
+
+
+def rebuild_medal_rollup(cur):
+    cur.execute("TRUNCATE MedalRollup")
+    cur.execute(f"INSERT INTO MedalRollup ({ROLLUP_COLUMNS}) {ROLLUP_SELECT} {ROLLUP_GROUPING}")
+    cur.execute("ANALYZE MedalRollup")
+
+
+if __name__ == "__main__":
+    conninfo = {
+        'host': os.getenv('DB_HOST', 'db'),
+        'dbname': os.getenv('DB_NAME', 'olympics_db'),
+        'user': os.getenv('DB_USER', 'user'),
+        'password': os.getenv('DB_PASS', 'password'),
+    }
+    print("Ricostruzione completa della tabella MedalRollup...")
+    with psycopg.connect(**conninfo) as conn:
+        with conn.cursor() as cur:
+            rebuild_medal_rollup(cur)
+            cur.execute("SELECT COUNT(*) FROM MedalRollup")
+            print(f"Cubo ricostruito: {cur.fetchone()[0]} celle.")
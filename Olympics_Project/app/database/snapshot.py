@@ -0,0 +1,128 @@
+import argparse
+import hashlib
+import os
+import shutil
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pa_csv = None
+    pq = None
+
+SNAPSHOT_DIR = os.getenv('LOAD_SNAPSHOT_DIR', 'data/snapshots')
+# Da incrementare quando cambia la normalizzazione: gli snapshot precedenti non valgono piu'.
+SNAPSHOT_FORMAT = 1
+
+if pa is not None:
+    SCHEMAS = {
+        'nations': pa.schema([('noc', pa.string()), ('region', pa.string()), ('notes', pa.string())]),
+        'athletes': pa.schema([('athlete_id', pa.int32()), ('name', pa.string()), ('sex', pa.string())]),
+        'games': pa.schema([('game_id', pa.int16()), ('game_name', pa.string()), ('year', pa.int16()),
+                            ('season', pa.string()), ('city', pa.string())]),
+        'events': pa.schema([('event_id', pa.int32()), ('sport', pa.string()), ('event_name', pa.string())]),
+        'participations': pa.schema([('athlete_id', pa.int32()), ('game_id', pa.int16()), ('event_id', pa.int32()),
+                                     ('noc', pa.string()), ('age', pa.int16()), ('height', pa.int16()),
+                                     ('weight', pa.float32()), ('medal', pa.string())]),
+    }
+    # Colonne a pochi valori distinti lette come categorie.
+    DICTIONARY_COLUMNS = {
+        'athletes': ['sex'],
+        'games': ['season', 'city'],
+        'events': ['sport'],
+        'participations': ['noc', 'medal'],
+    }
+
+
+def available():
+    return pa is not None
+
+
+def source_hash(*paths):
+    digest = hashlib.sha256(f'format={SNAPSHOT_FORMAT}'.encode())
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def find_snapshot(digest, base_dir=SNAPSHOT_DIR):
+    directory = os.path.join(base_dir, digest)
+    if all(os.path.exists(os.path.join(directory, f'{table}.parquet')) for table in SCHEMAS):
+        return directory
+    return None
+
+
+class SnapshotWriter:
+    # Scrive le tabelle normalizzate blocco per blocco (un row group per blocco) in una
+    # cartella temporanea, resa visibile solo da close(): uno snapshot interrotto non
+    # viene mai letto.
+
+    def __init__(self, digest, base_dir=SNAPSHOT_DIR):
+        self.directory = os.path.join(base_dir, digest)
+        self._tmp = self.directory + '.tmp'
+        shutil.rmtree(self._tmp, ignore_errors=True)
+        os.makedirs(self._tmp)
+        self._writers = {}
+
+    def write(self, table, frame):
+        if table not in self._writers:
+            self._writers[table] = pq.ParquetWriter(os.path.join(self._tmp, f'{table}.parquet'), SCHEMAS[table])
+        if not frame.empty:
+            self._writers[table].write_table(pa.Table.from_pandas(frame, schema=SCHEMAS[table], preserve_index=False))
+
+    def close(self):
+        for table in SCHEMAS:
+            if table not in self._writers:
+                self._writers[table] = pq.ParquetWriter(os.path.join(self._tmp, f'{table}.parquet'), SCHEMAS[table])
+            self._writers[table].close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.replace(self._tmp, self.directory)
+        return self.directory
+
+    def abort(self):
+        for writer in self._writers.values():
+            writer.close()
+        shutil.rmtree(self._tmp, ignore_errors=True)
+
+
+def to_pandas(table):
+    # Interi nullabili (Int16/Int32) invece di float64 per le colonne con valori mancanti.
+    return table.to_pandas(types_mapper={pa.int16(): pd.Int16Dtype(), pa.int32(): pd.Int32Dtype()}.get)
+
+
+def csv_batches(directory, table, batch_size):
+    # Blocchi gia' serializzati in CSV da Arrow, senza passare da pandas. I valori nulli
+    # restano campi vuoti non quotati, cioe' NULL per COPY.
+    parquet = pq.ParquetFile(os.path.join(directory, f'{table}.parquet'))
+    options = pa_csv.WriteOptions(include_header=False)
+    for batch in parquet.iter_batches(batch_size=batch_size):
+        buffer = pa.BufferOutputStream()
+        pa_csv.write_csv(batch, buffer, options)
+        yield batch.num_rows, buffer.getvalue()
+
+
+def load_table(directory, table):
+    # Tabella completa in un DataFrame, per test e preparazione dei benchmark.
+    return to_pandas(pq.read_table(os.path.join(directory, f'{table}.parquet'),
+                                   read_dictionary=DICTIONARY_COLUMNS.get(table)))
+
+
+if __name__ == "__main__":
+    from load_data import EVENTS_CSV, REGIONS_CSV, build_snapshot
+
+    parser = argparse.ArgumentParser(description="Crea lo snapshot Parquet delle tabelle normalizzate senza accedere al database.")
+    parser.parse_args()
+    if not available():
+        raise SystemExit("pyarrow non installato: snapshot non disponibile.")
+    digest = source_hash(EVENTS_CSV, REGIONS_CSV)
+    directory = find_snapshot(digest) or build_snapshot(digest)
+    for table in SCHEMAS:
+        path = os.path.join(directory, f'{table}.parquet')
+        print(f"  {table:<15} {pq.ParquetFile(path).metadata.num_rows:>9} righe  {os.path.getsize(path) / 1024:>9.0f} KB")
+    print(f"Snapshot {digest} in {directory}")
@@ -0,0 +1,57 @@
+import os
+
+import psycopg
+
+SUMMARY_SELECT = """
+    SELECT a.athlete_id, a.name, a.sex,
+            MAX(p.age) AS max_age,
+            (ARRAY_AGG(n.region ORDER BY g.year DESC, p.participation_id DESC))[1] AS team,
+            (ARRAY_AGG(p.noc ORDER BY g.year DESC, p.participation_id DESC))[1] AS noc,
+            STRING_AGG(DISTINCT e.sport, ', ') AS sports,
+            STRING_AGG(DISTINCT g.game_name, ', ') AS games,
+            COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
+            COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
+            COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze
+    FROM Participations p
+    JOIN Athletes a ON p.athlete_id = a.athlete_id
+    JOIN Games g ON p.game_id = g.game_id
+    JOIN Events e ON p.event_id = e.event_id
+    JOIN Nations n ON p.noc = n.noc
+"""
+
+SUMMARY_COLUMNS = "athlete_id, name, sex, max_age, team, noc, sports, games, gold, silver, bronze"
+
+
+def refresh_athlete_summary(cur, athlete_ids):
+    # Ricalcola il riepilogo solo per gli atleti toccati da una scrittura; un atleta
+    # senza piu' partecipazioni sparisce dal riepilogo come dalla lista /athletes.
+    athlete_ids = sorted({int(i) for i in athlete_ids})
+    if not athlete_ids:
+        return
+    cur.execute("DELETE FROM AthleteSummary WHERE athlete_id = ANY(%s)", (athlete_ids,))
+    cur.execute(
+        f"INSERT INTO AthleteSummary ({SUMMARY_COLUMNS}) {SUMMARY_SELECT}"
+        " WHERE p.athlete_id = ANY(%s) GROUP BY a.athlete_id, a.name, a.sex",
+        (athlete_ids,),
+    )
+
+
+def rebuild_athlete_summary(cur):
+    cur.execute("TRUNCATE AthleteSummary")
+    cur.execute(f"INSERT INTO AthleteSummary ({SUMMARY_COLUMNS}) {SUMMARY_SELECT} GROUP BY a.athlete_id, a.name, a.sex")
+    cur.execute("ANALYZE AthleteSummary")
+
+
+if __name__ == "__main__":
+    conninfo = {
+        'host': os.getenv('DB_HOST', 'db'),
+        'dbname': os.getenv('DB_NAME', 'olympics_db'),
+        'user': os.getenv('DB_USER', 'user'),
+        'password': os.getenv('DB_PASS', 'password'),
+    }
+    print("Ricostruzione completa della tabella AthleteSummary...")
+    with psycopg.connect(**conninfo) as conn:
+        with conn.cursor() as cur:
+            rebuild_athlete_summary(cur)
+            cur.execute("SELECT COUNT(*) FROM AthleteSummary")
+            print(f"Riepilogo ricostruito: {cur.fetchone()[0]} atleti.")
@@ -0,0 +1,4 @@
+def bump_data_version(cur):
+    # Va eseguito nella stessa transazione della scrittura: il nuovo valore diventa
+    # visibile agli altri processi solo con il COMMIT dei dati.
+    cur.execute("UPDATE DataVersion SET version = version + 1")
@@ -0,0 +1,54 @@
+import logging
+import os
+import threading
+import time
+
+from db import get_db_connection, release_db_connection
+
+DATA_VERSION_CHECK_INTERVAL = float(os.getenv('DATA_VERSION_CHECK_INTERVAL', '2'))
+
+logger = logging.getLogger('olympics.cache')
+
+
+class DataVersionTracker:
+    # Copia locale del contatore DataVersion, riletta dal database al massimo una volta
+    # ogni DATA_VERSION_CHECK_INTERVAL secondi (o subito dopo una scrittura del processo).
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+
+    def current(self):
+        if self._version is not None and time.monotonic() - self._checked_at < self.interval:
+            return self._version
+        with self._lock:
+            if self._version is None or time.monotonic() - self._checked_at >= self.interval:
+                self._version = self._read()
+                self._checked_at = time.monotonic()
+            return self._version
+
+    def expire(self):
+        self._checked_at = 0.0
+
+    def _read(self):
+        try:
+            conn = get_db_connection()
+        except Exception:
+            logger.warning("Contatore DataVersion non leggibile: cache disattivata", exc_info=True)
+            return None
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT version FROM DataVersion")
+            row = cur.fetchone()
+            cur.close()
+            return row[0] if row else None
+        except Exception:
+            logger.warning("Contatore DataVersion non leggibile: cache disattivata", exc_info=True)
+            return None
+        finally:
+            release_db_connection(conn)
+
+
+data_version = DataVersionTracker(DATA_VERSION_CHECK_INTERVAL)
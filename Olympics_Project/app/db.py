@@ -0,0 +1,240 @@
+import atexit
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from psycopg.pq import TransactionStatus
+from psycopg_pool import ConnectionPool, PoolTimeout
+
+from instrument import instrument_connection, record_query
+
+DB_HOST = os.getenv('DB_HOST', 'localhost')
+DB_NAME = os.getenv('DB_NAME', 'olympics_db')
+DB_USER = os.getenv('DB_USER', 'user')
+DB_PASS = os.getenv('DB_PASS', 'password')
+
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '2'))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+DB_POOL_MAX_IDLE = float(os.getenv('DB_POOL_MAX_IDLE', '300'))
+DB_POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', '3600'))
+
+DB_PARALLEL_QUERIES = os.getenv('DB_PARALLEL_QUERIES', '0') == '1'
+DB_PARALLEL_BORROW_TIMEOUT = float(os.getenv('DB_PARALLEL_BORROW_TIMEOUT', '0.05'))
+
+# Repliche in streaming per le sole letture: elenco "host[:porta]" separato da virgole.
+DB_REPLICA_HOSTS = [h.strip() for h in os.getenv('DB_REPLICA_HOSTS', '').split(',') if h.strip()]
+DB_REPLICA_TIMEOUT = float(os.getenv('DB_REPLICA_TIMEOUT', '1'))
+
+_pool = None
+_pool_pid = None
+_replica_pools = {}
+_replica_pools_pid = None
+_pool_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+
+logger = logging.getLogger('olympics.db')
+
+
+def init_pool():
+    # Il pool appartiene al processo che lo crea: dopo un fork (gunicorn, multiprocessing)
+    # ogni worker ne apre uno nuovo invece di condividere i socket del processo padre.
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            return _pool
+        _pool = _open_pool({'host': DB_HOST}, DB_POOL_TIMEOUT, f'olympics-{os.getpid()}')
+        _pool_pid = os.getpid()
+        return _pool
+
+
+def _open_pool(kwargs, timeout, name):
+    return ConnectionPool(
+        kwargs={'dbname': DB_NAME, 'user': DB_USER, 'password': DB_PASS, **kwargs},
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        timeout=timeout,
+        max_idle=DB_POOL_MAX_IDLE,
+        max_lifetime=DB_POOL_MAX_LIFETIME,
+        check=ConnectionPool.check_connection,
+        configure=instrument_connection,
+        name=name,
+        open=True,
+    )
+
+
+def get_replica_pool(host):
+    # Un pool per replica e per processo, aperto al primo uso; il timeout breve fa
+    # ripiegare sul primario invece di far attendere la richiesta.
+    global _replica_pools, _replica_pools_pid
+    if _replica_pools_pid == os.getpid() and host in _replica_pools:
+        return _replica_pools[host]
+    with _pool_lock:
+        if _replica_pools_pid != os.getpid():
+            _replica_pools = {}
+            _replica_pools_pid = os.getpid()
+        if host not in _replica_pools:
+            address, _, port = host.partition(':')
+            kwargs = {'host': address, 'connect_timeout': max(int(DB_REPLICA_TIMEOUT), 1)}
+            if port:
+                kwargs['port'] = port
+            _replica_pools[host] = _open_pool(kwargs, DB_REPLICA_TIMEOUT, f'olympics-replica-{host}-{os.getpid()}')
+        return _replica_pools[host]
+
+
+def close_pool():
+    global _pool, _pool_pid, _executor, _executor_pid
+    with _pool_lock:
+        if _executor is not None and _executor_pid == os.getpid():
+            _executor.shutdown(wait=False)
+        _executor = None
+        _executor_pid = None
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.close()
+        _pool = None
+        _pool_pid = None
+        if _replica_pools_pid == os.getpid():
+            for pool in _replica_pools.values():
+                pool.close()
+        _replica_pools.clear()
+
+
+def get_pool():
+    if _pool is None or _pool_pid != os.getpid():
+        return init_pool()
+    return _pool
+
+
+def get_db_connection():
+    return get_pool().getconn()
+
+
+def _owned_pool(conn):
+    # Pool (primario o replica) del processo corrente da cui proviene la connessione.
+    pool = getattr(conn, '_pool', None)
+    if pool is None:
+        return None
+    if pool is _pool and _pool_pid == os.getpid():
+        return pool
+    if _replica_pools_pid == os.getpid() and any(pool is p for p in _replica_pools.values()):
+        return pool
+    return None
+
+
+def release_db_connection(conn):
+    pool = _owned_pool(conn)
+    # Una connessione gia' restituita (es. doppio finally in add_athlete) puo' essere
+    # nel frattempo in uso da un'altra richiesta: non va toccata.
+    if pool is None:
+        return
+    if not conn.closed and conn.info.transaction_status != TransactionStatus.IDLE:
+        try:
+            conn.rollback()
+        except Exception:
+            logger.warning("Rollback fallito durante la restituzione della connessione al pool", exc_info=True)
+    pool.putconn(conn)
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    with _pool_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=DB_POOL_MAX_SIZE, thread_name_prefix='db-query')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _fetch_all(conn, sql, params, row_factory):
+    with conn.cursor(row_factory=row_factory) as cur:
+        cur.execute(sql, params)
+        return cur.fetchall()
+
+
+def _borrow_connections(pool, count):
+    # Prende in prestito connessioni libere senza attendere: se il pool e' sotto carico
+    # e' meglio ripiegare sulla pipeline che togliere connessioni alle altre richieste.
+    borrowed = []
+    try:
+        for _ in range(count):
+            borrowed.append(pool.getconn(timeout=DB_PARALLEL_BORROW_TIMEOUT))
+    except PoolTimeout:
+        for other in borrowed:
+            release_db_connection(other)
+        return None
+    return borrowed
+
+
+def _fetch_parallel(conn, statements, row_factory):
+    # Le connessioni aggiuntive vengono dallo stesso pool (primario o replica) di conn.
+    borrowed = _borrow_connections(_owned_pool(conn) or get_pool(), len(statements) - 1)
+    if borrowed is None:
+        return None
+    futures = []
+    try:
+        executor = _get_executor()
+        # Il contesto copiato porta con se' la richiesta Flask: le metriche delle query
+        # eseguite nei thread restano attribuite alla route giusta.
+        for other, (sql, params) in zip(borrowed, statements[1:]):
+            futures.append(executor.submit(contextvars.copy_context().run, _fetch_all, other, sql, params, row_factory))
+        sql, params = statements[0]
+        first = _fetch_all(conn, sql, params, row_factory)
+        return [first] + [future.result() for future in futures]
+    finally:
+        # Anche dopo un errore le connessioni tornano al pool solo quando nessun thread le
+        # usa piu'; l'errore viene propagato dopo.
+        wait(futures)
+        for other in borrowed:
+            release_db_connection(other)
+
+
+def _fetch_pipeline(conn, statements, row_factory):
+    cursors = []
+    try:
+        start = time.perf_counter()
+        with conn.pipeline():
+            for sql, params in statements:
+                cur = conn.cursor(row_factory=row_factory)
+                cursors.append(cur)
+                cur.execute(sql, params)
+        elapsed = time.perf_counter() - start
+        results = [cur.fetchall() for cur in cursors]
+        # In pipeline le query non hanno una durata propria: a ciascuna viene attribuito
+        # il tempo dell'intero round trip, cioe' quello che la pagina ha atteso.
+        for (sql, params), rows in zip(statements, results):
+            record_query(conn, sql, params, elapsed, len(rows))
+        return results
+    finally:
+        for cur in cursors:
+            cur.close()
+
+
+def fetch_many(conn, statements, row_factory=None, parallel=None):
+    # Esegue query indipendenti in un solo passaggio. Di default le invia in pipeline
+    # (un round trip); con DB_PARALLEL_QUERIES=1 ciascuna gira su una propria connessione
+    # del pool, cosi' la latenza della pagina e' quella della query piu' lenta.
+    if parallel is None:
+        parallel = DB_PARALLEL_QUERIES
+    if parallel and len(statements) > 1:
+        results = _fetch_parallel(conn, statements, row_factory)
+        if results is not None:
+            return results
+    return _fetch_pipeline(conn, statements, row_factory)
+
+
+def get_pool_stats():
+    if _pool is None or _pool_pid != os.getpid():
+        return {}
+    return _pool.get_stats()
+
+
+def get_replica_stats():
+    if _replica_pools_pid != os.getpid():
+        return {}
+    return {host: pool.get_stats() for host, pool in list(_replica_pools.items())}
+
+
+atexit.register(close_pool)
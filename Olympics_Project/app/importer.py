@@ -0,0 +1,252 @@
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import time
+from decimal import Decimal, InvalidOperation
+
+from db import get_db_connection, release_db_connection
+from database.summary import refresh_athlete_summary
+from database.rollup import refresh_medal_rollup
+from database.versioning import bump_data_version
+from dataversion import data_version
+from refcache import reference_cache
+
+IMPORT_MAX_ROWS = int(os.getenv('IMPORT_MAX_ROWS', '100000'))
+IMPORT_MAX_ERRORS = int(os.getenv('IMPORT_MAX_ERRORS', '50'))
+
+IMPORT_CSV_REQUIRED = ('name', 'sex', 'noc', 'game', 'event')
+MEDALS = ('Gold', 'Silver', 'Bronze', 'NA')
+# Tipo e valore massimo delle colonne numeriche di Participations (INTEGER e NUMERIC(5,2)):
+# un valore fuori intervallo va segnalato sulla riga, non scoperto dal COPY.
+NUMBER_FIELDS = {
+    'age': (int, 2**31 - 1),
+    'height': (int, 2**31 - 1),
+    'weight': (Decimal, Decimal('999.99')),
+}
+
+logger = logging.getLogger('olympics.import')
+
+
+def read_csv(text):
+    # Una riga per partecipazione. Le righe con lo stesso 'ref' appartengono allo stesso
+    # nuovo atleta (nome e sesso si leggono dalla prima); senza 'ref' ogni riga e' un atleta.
+    reader = csv.DictReader(io.StringIO(text))
+    missing = set(IMPORT_CSV_REQUIRED) - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f"Colonne mancanti nel CSV: {', '.join(sorted(missing))}")
+    athletes = []
+    by_ref = {}
+    for line, row in enumerate(reader, start=2):
+        participation = dict(row, where=f"riga {line}")
+        ref = (row.get('ref') or '').strip()
+        athlete = by_ref.get(ref) if ref else None
+        if athlete is None:
+            athlete = {'where': f"riga {line}", 'name': row.get('name'), 'sex': row.get('sex'), 'participations': []}
+            athletes.append(athlete)
+            if ref:
+                by_ref[ref] = athlete
+        athlete['participations'].append(participation)
+    return athletes
+
+
+def read_json(text):
+    # Lista di atleti (oppure {"athletes": [...]}), ciascuno con le proprie partecipazioni.
+    data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get('athletes')
+    if not isinstance(data, list):
+        raise ValueError("Il JSON deve essere una lista di atleti o un oggetto con la chiave 'athletes'.")
+    athletes = []
+    for i, item in enumerate(data):
+        if not isinstance(item, dict):
+            raise ValueError(f"athletes[{i}]: atteso un oggetto.")
+        participations = item.get('participations') or []
+        if not isinstance(participations, list):
+            raise ValueError(f"athletes[{i}].participations: attesa una lista.")
+        athletes.append({
+            'where': f"athletes[{i}]",
+            'name': item.get('name'),
+            'sex': item.get('sex'),
+            'participations': [
+                dict(p if isinstance(p, dict) else {}, where=f"athletes[{i}].participations[{j}]")
+                for j, p in enumerate(participations)
+            ],
+        })
+    return athletes
+
+
+def parse_import(text, fmt):
+    if fmt == 'csv':
+        athletes = read_csv(text)
+    elif fmt == 'json':
+        try:
+            athletes = read_json(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"JSON non valido: {e}")
+    else:
+        raise ValueError("Formato non supportato: usare CSV o JSON.")
+    rows = sum(len(a['participations']) for a in athletes)
+    if rows > IMPORT_MAX_ROWS:
+        raise ValueError(f"Troppe partecipazioni nel file ({rows}), il limite e' {IMPORT_MAX_ROWS}.")
+    return athletes
+
+
+def to_number(value, field):
+    kind, maximum = NUMBER_FIELDS[field]
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    # True e False sono interi per Python, NaN e Infinity decimali validi: vanno rifiutati.
+    if isinstance(value, bool):
+        raise ValueError
+    if kind is int:
+        if isinstance(value, float) and not value.is_integer():
+            raise ValueError
+        number = int(value)
+    else:
+        try:
+            number = Decimal(str(value))
+            if not number.is_finite():
+                raise ValueError
+            number = number.quantize(Decimal('0.01'))
+        except InvalidOperation:
+            raise ValueError
+    if not 0 <= number <= maximum:
+        raise ValueError
+    return number
+
+
+def lookup_game(value):
+    if isinstance(value, int) or (isinstance(value, str) and value.strip().isdigit()):
+        return reference_cache.game_by_id(int(value))
+    return reference_cache.game(str(value or '').strip())
+
+
+def lookup_event(value):
+    if isinstance(value, int) or (isinstance(value, str) and value.strip().isdigit()):
+        return reference_cache.event(int(value))
+    return reference_cache.event_by_name(str(value or '').strip())
+
+
+def validate_participation(p, errors):
+    where = p['where']
+    noc = str(p.get('noc') or '').strip().upper()
+    if reference_cache.nation(noc) is None:
+        errors.append(f"{where}: nazione '{noc}' sconosciuta")
+    game = lookup_game(p.get('game', p.get('game_id')))
+    if game is None:
+        errors.append(f"{where}: edizione '{p.get('game', p.get('game_id'))}' sconosciuta")
+    event = lookup_event(p.get('event', p.get('event_id')))
+    if event is None:
+        errors.append(f"{where}: evento '{p.get('event', p.get('event_id'))}' sconosciuto")
+    medal = str(p.get('medal') or 'NA').strip()
+    if medal not in MEDALS:
+        errors.append(f"{where}: medaglia '{medal}' non valida")
+
+    values = {}
+    for field in NUMBER_FIELDS:
+        try:
+            values[field] = to_number(p.get(field), field)
+        except (TypeError, ValueError):
+            errors.append(f"{where}: valore non numerico o fuori intervallo per '{field}'")
+    if game is None or event is None or len(values) < 3:
+        return None
+    return (game['game_id'], event['event_id'], noc, values['age'], values['height'], values['weight'], medal)
+
+
+def validate(athletes):
+    # Controlla l'intero lotto sulle tabelle di riferimento in memoria, senza query: il
+    # lotto viene scritto solo se non contiene errori.
+    valid = []
+    errors = []
+    for athlete in athletes:
+        name = str(athlete.get('name') or '').strip()
+        sex = str(athlete.get('sex') or '').strip().upper()
+        if not name or len(name) > 255:
+            errors.append(f"{athlete['where']}: nome mancante o troppo lungo")
+        if sex not in ('M', 'F'):
+            errors.append(f"{athlete['where']}: sesso '{sex}' non valido (M o F)")
+        if not athlete['participations']:
+            errors.append(f"{athlete['where']}: nessuna partecipazione")
+        participations = [validate_participation(p, errors) for p in athlete['participations']]
+        valid.append((name, sex, participations))
+        if len(errors) >= IMPORT_MAX_ERRORS:
+            break
+    return valid, errors[:IMPORT_MAX_ERRORS]
+
+
+def write_import(conn, athletes):
+    # Un blocco di ID dalla sequenza con una sola query, poi COPY di atleti e partecipazioni
+    # e un solo aggiornamento di riepilogo e medagliere, tutto nella stessa transazione.
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT nextval(pg_get_serial_sequence('athletes', 'athlete_id')) FROM generate_series(1, %s)",
+            (len(athletes),),
+        )
+        athlete_ids = [row[0] for row in cur.fetchall()]
+        with cur.copy("COPY Athletes (athlete_id, name, sex) FROM STDIN") as copy:
+            for athlete_id, (name, sex, _) in zip(athlete_ids, athletes):
+                copy.write_row((athlete_id, name, sex))
+        with cur.copy(
+            "COPY Participations (athlete_id, game_id, event_id, noc, age, height, weight, medal) FROM STDIN"
+        ) as copy:
+            for athlete_id, (_, _, participations) in zip(athlete_ids, athletes):
+                for participation in participations:
+                    copy.write_row((athlete_id,) + participation)
+        refresh_athlete_summary(cur, athlete_ids)
+        refresh_medal_rollup(cur, [
+            (noc, game_id, event_id)
+            for _, _, participations in athletes
+            for game_id, event_id, noc, *_ in participations
+        ])
+        bump_data_version(cur)
+    conn.commit()
+    data_version.expire()
+    return athlete_ids
+
+
+def import_athletes(text, fmt):
+    # Restituisce (athlete_ids, errori): con errori di validazione non viene scritto nulla.
+    athletes = parse_import(text, fmt)
+    valid, errors = validate(athletes)
+    if errors:
+        return None, errors
+    if not valid:
+        return [], []
+    conn = get_db_connection()
+    try:
+        athlete_ids = write_import(conn, valid)
+        logger.info("Import completato: %d atleti, %d partecipazioni",
+                    len(athlete_ids), sum(len(p) for _, _, p in valid))
+        return athlete_ids, []
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Importa atleti e partecipazioni da un file CSV o JSON.")
+    parser.add_argument('path', help="file da importare")
+    parser.add_argument('--format', choices=('csv', 'json'), help="default: dall'estensione del file")
+    args = parser.parse_args()
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'))
+
+    fmt = args.format or ('json' if args.path.lower().endswith('.json') else 'csv')
+    with open(args.path, encoding='utf-8') as f:
+        text = f.read()
+    start = time.perf_counter()
+    try:
+        athlete_ids, errors = import_athletes(text, fmt)
+    except ValueError as e:
+        raise SystemExit(f"Errore: {e}")
+    if errors:
+        print("Import annullato, nessun dato salvato:")
+        for error in errors:
+            print(f"  {error}")
+        raise SystemExit(1)
+    print(f"Importati {len(athlete_ids)} atleti in {time.perf_counter() - start:.2f} s "
+          f"(ID {min(athlete_ids, default='-')}-{max(athlete_ids, default='-')}).")
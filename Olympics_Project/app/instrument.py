@@ -0,0 +1,401 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+import psycopg
+from psycopg.pq import PipelineStatus, TransactionStatus
+from flask import has_request_context, request
+
+QUERY_METRICS = os.getenv('QUERY_METRICS', '1') == '1'
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+SLOW_QUERY_EXPLAIN = os.getenv('SLOW_QUERY_EXPLAIN', '0') == '1'
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv('SLOW_QUERY_EXPLAIN_INTERVAL', '300'))
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+slow_log = logging.getLogger('olympics.slow_query')
+logger = logging.getLogger('olympics.metrics')
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|(?<![\w.])-?\d+(?:\.\d+)?\b")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    # Testo normalizzato della query: spazi compattati, parametri e costanti sostituiti da
+    # '?', cosi' le stesse query con valori diversi finiscono nella stessa serie.
+    text = ' '.join(sql.split())
+    text = _LITERALS.sub('?', text.replace('%s', '?'))
+    return text, hashlib.md5(text.encode('utf-8')).hexdigest()[:12]
+
+
+def current_route():
+    if has_request_context():
+        return request.endpoint or 'unknown'
+    return 'none'
+
+
+class Histogram:
+    __slots__ = ('buckets', 'count', 'total')
+
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+
+class Metrics:
+    # Contatori in memoria per processo; con METRICS_DIR /metrics li somma su tutti i
+    # worker (vedi MetricsStore).
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = {}
+        self.query_rows = {}
+        self.query_errors = {}
+        self.query_text = {}
+        self.requests = {}
+
+    def record_query(self, route, query_id, text, seconds, rows, error):
+        with self._lock:
+            key = (route, query_id)
+            self.query_text[query_id] = text
+            histogram = self.queries.get(key)
+            if histogram is None:
+                histogram = self.queries[key] = Histogram()
+            histogram.observe(seconds)
+            if rows and rows > 0:
+                self.query_rows[key] = self.query_rows.get(key, 0) + rows
+            if error:
+                self.query_errors[key] = self.query_errors.get(key, 0) + 1
+
+    def record_request(self, route, method, status, seconds):
+        with self._lock:
+            key = (route, method, str(status))
+            histogram = self.requests.get(key)
+            if histogram is None:
+                histogram = self.requests[key] = Histogram()
+            histogram.observe(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'queries': [[list(k), h.buckets, h.count, h.total] for k, h in self.queries.items()],
+                'requests': [[list(k), h.buckets, h.count, h.total] for k, h in self.requests.items()],
+                'query_rows': [[list(k), v] for k, v in self.query_rows.items()],
+                'query_errors': [[list(k), v] for k, v in self.query_errors.items()],
+                'query_text': dict(self.query_text),
+            }
+
+    def merge(self, snapshot):
+        with self._lock:
+            for name in ('queries', 'requests'):
+                series = getattr(self, name)
+                for key, buckets, count, total in snapshot[name]:
+                    histogram = series.setdefault(tuple(key), Histogram())
+                    histogram.buckets = [a + b for a, b in zip(histogram.buckets, buckets)]
+                    histogram.count += count
+                    histogram.total += total
+            for name in ('query_rows', 'query_errors'):
+                series = getattr(self, name)
+                for key, value in snapshot[name]:
+                    series[tuple(key)] = series.get(tuple(key), 0) + value
+            self.query_text.update(snapshot['query_text'])
+
+    def render(self, gauges=None):
+        with self._lock:
+            lines = []
+            render_histogram(lines, 'olympics_db_query_duration_seconds',
+                             "Durata delle query SQL per route e query.", ('route', 'query'), self.queries)
+            render_counter(lines, 'olympics_db_query_rows_total',
+                           "Righe restituite o modificate dalle query.", ('route', 'query'), self.query_rows)
+            render_counter(lines, 'olympics_db_query_errors_total',
+                           "Query terminate con errore.", ('route', 'query'), self.query_errors)
+            lines.append("# HELP olympics_db_query_info Testo normalizzato di ogni query.")
+            lines.append("# TYPE olympics_db_query_info gauge")
+            for query_id, text in sorted(self.query_text.items()):
+                lines.append(f'olympics_db_query_info{{query="{query_id}",fingerprint="{escape(text[:300])}"}} 1')
+            render_histogram(lines, 'olympics_http_request_duration_seconds',
+                             "Durata delle richieste HTTP.", ('route', 'method', 'status'), self.requests)
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE olympics_db_pool_{name} gauge")
+            lines.append(f"olympics_db_pool_{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+def labels(names, values, extra=''):
+    parts = [f'{n}="{escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}'
+
+
+def render_histogram(lines, name, help_text, label_names, series):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for key, histogram in sorted(series.items()):
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, histogram.buckets):
+            cumulative += count
+            bucket = labels(label_names, key, 'le="%s"' % bound)
+            lines.append(f"{name}_bucket{bucket} {cumulative}")
+        bucket = labels(label_names, key, 'le="+Inf"')
+        lines.append(f"{name}_bucket{bucket} {histogram.count}")
+        lines.append(f"{name}_sum{labels(label_names, key)} {histogram.total:.6f}")
+        lines.append(f"{name}_count{labels(label_names, key)} {histogram.count}")
+
+
+def render_counter(lines, name, help_text, label_names, series):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} counter")
+    for key, value in sorted(series.items()):
+        lines.append(f"{name}{labels(label_names, key)} {value}")
+
+
+metrics = Metrics()
+_explained_at = {}
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MetricsStore:
+    # Con piu' worker ogni richiesta a /metrics arriva a un processo qualsiasi: ogni worker
+    # scrive i propri contatori in METRICS_DIR/metrics_<pid>.json ogni
+    # METRICS_FLUSH_INTERVAL secondi e /metrics somma i file di tutti i processi. Quando un
+    # worker termina il suo file viene sommato a metrics_exited.json e rimosso, cosi' i
+    # contatori non tornano mai indietro e i file non crescono con i riavvii dei worker; le
+    # statistiche del pool si sommano solo sui worker ancora attivi.
+
+    EXITED_FILE = 'metrics_exited.json'
+
+    def __init__(self, directory, interval):
+        self.directory = directory
+        self.interval = interval
+        self._gauges = None
+        self._pid = None
+        self._flush_lock = threading.Lock()
+        self._retired = False
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def path(self, pid):
+        return os.path.join(self.directory, f'metrics_{pid}.json')
+
+    def start(self, gauges=None):
+        # Da chiamare dopo il fork: un thread di scrittura per processo.
+        if not self.enabled or self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._gauges = gauges
+        threading.Thread(target=self._run, name='metrics-flush', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Scrittura delle metriche in %s non riuscita", self.directory)
+
+    @contextmanager
+    def _directory_lock(self, mode):
+        # Chi somma un file a metrics_exited.json e lo rimuove tiene il lock esclusivo:
+        # /metrics (lock condiviso) non conta mai due volte un worker terminato e non lo perde.
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, 'metrics.lock'), 'a') as f:
+            fcntl.flock(f, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _write(self, path, data):
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(path + '.tmp', path)
+
+    def _read(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def flush(self, final=False):
+        with self._flush_lock:
+            # Dopo retire() il file del processo non va piu' ricreato dal thread di scrittura.
+            if self._retired:
+                return
+            pid = os.getpid()
+            data = {
+                'pid': pid,
+                'series': metrics.snapshot(),
+                'gauges': {} if final or self._gauges is None else self._gauges(),
+            }
+            os.makedirs(self.directory, exist_ok=True)
+            self._write(self.path(pid), data)
+
+    def retire(self, pid=None):
+        # Somma il file di un worker terminato a metrics_exited.json e lo rimuove. Chiamata
+        # da worker_exit per il processo stesso e da child_exit del master per i worker
+        # terminati senza passare da worker_exit (timeout, SIGKILL).
+        if pid is None or pid == os.getpid():
+            pid = os.getpid()
+            with self._flush_lock:
+                self._retired = True
+        path = self.path(pid)
+        with self._directory_lock(fcntl.LOCK_EX):
+            data = self._read(path)
+            if data is None:
+                return
+            total = Metrics()
+            exited = self._read(os.path.join(self.directory, self.EXITED_FILE))
+            if exited is not None:
+                total.merge(exited['series'])
+            total.merge(data['series'])
+            self._write(os.path.join(self.directory, self.EXITED_FILE),
+                        {'pid': None, 'series': total.snapshot(), 'gauges': {}})
+            os.remove(path)
+
+    def render(self, gauges=None):
+        self.start(gauges)
+        self.flush()
+        total = Metrics()
+        pool = {}
+        with self._directory_lock(fcntl.LOCK_SH):
+            for name in sorted(os.listdir(self.directory)):
+                if not name.endswith('.json'):
+                    continue
+                data = self._read(os.path.join(self.directory, name))
+                if data is None:
+                    continue
+                total.merge(data['series'])
+                if data['gauges'] and process_alive(data['pid']):
+                    for key, value in data['gauges'].items():
+                        pool[key] = pool.get(key, 0) + value
+        return total.render(gauges=pool)
+
+
+metrics_store = MetricsStore(METRICS_DIR, METRICS_FLUSH_INTERVAL)
+
+
+def render_metrics(gauges=None):
+    # gauges: funzione che restituisce le statistiche del pool del processo.
+    if metrics_store.enabled:
+        return metrics_store.render(gauges)
+    return metrics.render(gauges=gauges() if gauges else None)
+
+
+def explain_plan(conn, sql, params):
+    # Piano stimato (senza ANALYZE) catturato al massimo una volta ogni
+    # SLOW_QUERY_EXPLAIN_INTERVAL secondi per query, solo per le letture.
+    head = sql.lstrip()[:6].upper()
+    if not (head.startswith('SELECT') or head.startswith('WITH')):
+        return None
+    if conn.info.transaction_status == TransactionStatus.INERROR:
+        return None
+    try:
+        with psycopg.Cursor(conn) as cur:
+            cur.execute("EXPLAIN " + sql, params)
+            return '\n'.join(row[0] for row in cur.fetchall())
+    except psycopg.Error as e:
+        return f"EXPLAIN non disponibile: {e}"
+
+
+def record_query(conn, sql, params, seconds, rows, error=False):
+    if not QUERY_METRICS:
+        return
+    if not isinstance(sql, str):
+        try:
+            sql = sql.as_string(conn)
+        except Exception:
+            sql = str(sql)
+    text, query_id = fingerprint(sql)
+    if not text:
+        return
+    route = current_route()
+    metrics.record_query(route, query_id, text, seconds, rows, error)
+
+    if seconds * 1000 < SLOW_QUERY_MS or error:
+        return
+    plan = None
+    if SLOW_QUERY_EXPLAIN and conn is not None:
+        now = time.monotonic()
+        if now - _explained_at.get(query_id, -SLOW_QUERY_EXPLAIN_INTERVAL) >= SLOW_QUERY_EXPLAIN_INTERVAL:
+            _explained_at[query_id] = now
+            plan = explain_plan(conn, sql, params)
+    slow_log.warning(
+        "Query lenta %.1f ms route=%s query=%s righe=%s parametri=%.500r\n%s%s",
+        seconds * 1000, route, query_id, rows, params, text[:1000],
+        ('\n' + plan) if plan else '',
+    )
+
+
+class InstrumentedCursor(psycopg.Cursor):
+    # In pipeline il tempo di execute() non e' quello della query: la misura la fa
+    # fetch_many() in db.py al termine della pipeline.
+
+    def execute(self, query, params=None, **kwargs):
+        if self.connection.info.pipeline_status != PipelineStatus.OFF:
+            return super().execute(query, params, **kwargs)
+        start = time.perf_counter()
+        try:
+            result = super().execute(query, params, **kwargs)
+        except Exception:
+            record_query(self.connection, query, params, time.perf_counter() - start, 0, error=True)
+            raise
+        record_query(self.connection, query, params, time.perf_counter() - start, self.rowcount)
+        return result
+
+
+class InstrumentedServerCursor(psycopg.ServerCursor):
+    # Cursore con nome: la durata va dalla DECLARE alla chiusura e le righe sono quelle
+    # effettivamente lette dal client.
+
+    def execute(self, query, params=None, **kwargs):
+        self._instrument = (query, params, time.perf_counter())
+        return super().execute(query, params, **kwargs)
+
+    def close(self):
+        started = getattr(self, '_instrument', None)
+        if started is not None and not self.closed:
+            query, params, start = started
+            self._instrument = None
+            record_query(self.connection, query, params, time.perf_counter() - start, self.rownumber)
+        super().close()
+
+
+def instrument_connection(conn):
+    if QUERY_METRICS:
+        conn.cursor_factory = InstrumentedCursor
+        conn.server_cursor_factory = InstrumentedServerCursor
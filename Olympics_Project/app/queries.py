@@ -0,0 +1,524 @@
+from psycopg.rows import dict_row
+import base64
+import json
+
+from analytics import columnar_engine
+from db import fetch_many
+from refcache import reference_cache
+from search import like_pattern, text_match, relevance, participation_match
+
+ATHLETES_PAGE_SIZE = 500
+DETAIL_PAGE_SIZE = 100
+PODIUM_SIZE = 3
+
+ATHLETE_KEY = ('-s.gold', '-s.silver', '-s.bronze', 's.name', 's.id')
+SPORT_RESULT_KEY = ('-s.year', 's.name', 's.athlete_id', 's.game_id', 's.event_id')
+
+# Letture condivise tra le pagine HTML (app.py) e l'API JSON (api.py): ogni funzione
+# riceve una connessione del pool e restituisce righe gia' pronte per template o JSON.
+
+def encode_key(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+def decode_key(token, types):
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if len(values) != len(types):
+            return None
+        return [kind(value) for kind, value in zip(types, values)]
+    except (ValueError, TypeError):
+        return None
+
+def encode_cursor(row):
+    return encode_key([row['gold'], row['silver'], row['bronze'], row['name'], row['id']])
+
+def decode_cursor(token):
+    return decode_key(token, (int, int, int, str, int))
+
+def athlete_key(cursor):
+    # I medaglieri sono decrescenti: vengono negati per poter usare il confronto tra righe.
+    return [-cursor[0], -cursor[1], -cursor[2], cursor[3], cursor[4]] if cursor else None
+
+def encode_sport_cursor(row):
+    return encode_key([row['year'], row['name'], row['athlete_id'], row['game_id'], row['event_id']])
+
+def sport_result_key(token):
+    cursor = decode_key(token, (int, str, int, int, int))
+    return [-cursor[0]] + cursor[1:] if cursor else None
+
+def keyset_query(query, params, key, after, before, limit):
+    # Paginazione keyset: `key` e' la tupla dell'ordinamento (espressioni crescenti sulla
+    # sottoquery s), after/before i valori della riga di confine nello stesso ordine.
+    columns = ', '.join(key)
+    marks = ', '.join(['%s'] * len(key))
+    query = "SELECT * FROM (" + query + ") s"
+    params = list(params)
+    if after:
+        query += f" WHERE ({columns}) > ({marks})"
+        params.extend(after)
+    elif before:
+        query += f" WHERE ({columns}) < ({marks})"
+        params.extend(before)
+    direction = ' DESC' if before else ''
+    query += " ORDER BY " + ', '.join(column + direction for column in key) + " LIMIT %s"
+    params.append(limit)
+    return query, params
+
+def split_page(rows, after, before, limit):
+    # Le query chiedono una riga in piu' del limite per sapere se esiste un'altra pagina.
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before:
+        rows.reverse()
+        return rows, has_more, True
+    return rows, bool(after), has_more
+
+def split_ranking(rows, after, before, limit):
+    # La prima pagina di una classifica ha il podio (primi PODIUM_SIZE) e la tabella; le
+    # altre solo la tabella. Tornando indietro fino all'inizio si ricompone la prima pagina.
+    if after:
+        return ([],) + split_page(rows, after, None, limit)
+    if before:
+        if len(rows) > limit + PODIUM_SIZE:
+            return ([],) + split_page(rows, None, before, limit)
+        rows = rows[::-1]
+    has_next = bool(before) or len(rows) > PODIUM_SIZE + limit
+    return rows[:PODIUM_SIZE], rows[PODIUM_SIZE:PODIUM_SIZE + limit], False, has_next
+
+def ranking_limit(after, limit):
+    return limit + 1 if after else limit + PODIUM_SIZE + 1
+
+def build_athlete_query(args):
+    # Filtri comuni alla lista atleti e all'esportazione: restituisce la query aggregata
+    # per atleta (senza ordinamento) e i relativi parametri.
+    q = args.get('q', '').strip()
+    team = args.get('team', '').strip()
+    game_filter = args.get('games', '').strip()
+    medals = args.getlist('medal')
+    seasons = args.getlist('season')
+    sexes = args.getlist('sex')
+    year = args.get('year', '').strip()
+    sport = args.get('sport', '').strip()
+
+    params = []
+
+    if q or team or game_filter or medals or seasons or year.isdigit() or sport:
+        query = """
+            SELECT a.athlete_id as id, a.name, a.sex, 
+                    MAX(p.age) as age, 
+                    MAX(n.region) as team,
+                    MAX(n.noc) as noc,
+                    STRING_AGG(DISTINCT e.sport, ', ') as sport, 
+                    STRING_AGG(DISTINCT g.game_name, ', ') as games,
+                    COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
+                    COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
+                    COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze
+            FROM Participations p
+            JOIN Athletes a ON p.athlete_id = a.athlete_id
+            JOIN Games g ON p.game_id = g.game_id
+            JOIN Events e ON p.event_id = e.event_id
+            JOIN Nations n ON p.noc = n.noc
+            WHERE 1=1
+        """
+
+        if q:
+            match_sql, match_params = participation_match(q)
+            query += " AND " + match_sql
+            params.extend(match_params)
+        if team:
+            query += " AND n.region = %s"
+            params.append(team)
+        if game_filter:
+            query += " AND g.game_name = %s"
+            params.append(game_filter)
+        if medals:
+            query += " AND p.medal = ANY(%s::text[])"
+            params.append(medals)
+        if seasons:
+            query += " AND g.season = ANY(%s::text[])"
+            params.append(seasons)
+        if sexes:
+            query += " AND a.sex = ANY(%s::text[])"
+            params.append(sexes)
+        if year.isdigit():
+            query += " AND g.year = %s"
+            params.append(int(year))
+        if sport:
+            query += " AND e.sport ILIKE %s"
+            params.append(like_pattern(sport))
+
+        query += " GROUP BY a.athlete_id, a.name, a.sex"
+    else:
+        # Senza filtri sulle partecipazioni i conteggi coincidono con quelli
+        # precalcolati in AthleteSummary: niente aggregazione sulle righe grezze.
+        query = """
+            SELECT athlete_id as id, name, sex, max_age as age, team, noc,
+                    sports as sport, games, gold, silver, bronze
+            FROM AthleteSummary
+            WHERE 1=1
+        """
+        if sexes:
+            query += " AND sex = ANY(%s::text[])"
+            params.append(sexes)
+
+    return query, params
+
+def fetch_global_stats(conn):
+    # Totali mantenuti dai trigger della migrazione 0005: una lettura per chiave primaria.
+    cur = conn.cursor(row_factory=dict_row)
+    cur.execute("""
+        SELECT athletes, nations, games, participations, medals, gold, silver, bronze,
+                summer_medals, winter_medals
+        FROM GlobalStats WHERE id
+    """)
+    stats = cur.fetchone()
+    cur.close()
+    return stats
+
+def fetch_athletes(conn, args, limit=ATHLETES_PAGE_SIZE):
+    after = decode_cursor(args.get('after', ''))
+    before = decode_cursor(args.get('before', ''))
+    result = columnar_engine.athletes(args, after, before, limit)
+    if result is not None:
+        return result
+    cur = conn.cursor(row_factory=dict_row)
+    
+    query, params = build_athlete_query(args)
+
+    # Stessa tupla dell'ordinamento dell'indice idx_athlete_summary_ranking.
+    query, params = keyset_query(query, params, ATHLETE_KEY, athlete_key(after), athlete_key(before), limit + 1)
+
+    cur.execute(query, params)
+    athletes_list = cur.fetchall()
+    cur.close()
+    return split_page(athletes_list, after, before, limit)
+
+def fetch_athlete_detail(conn, athlete_id):
+    cur = conn.cursor(row_factory=dict_row)
+    query = """
+        SELECT a.athlete_id, a.name, a.sex, p.age, p.height, p.weight, n.region, e.sport, e.event_name, g.game_name, p.medal,
+                g.game_id, e.event_id
+        FROM Athletes a
+        JOIN Participations p ON a.athlete_id = p.athlete_id
+        JOIN Nations n ON p.noc = n.noc
+        JOIN Games g ON p.game_id = g.game_id
+        JOIN Events e ON p.event_id = e.event_id
+        WHERE a.athlete_id = %s
+        ORDER BY g.year DESC
+    """
+    cur.execute(query, (athlete_id,))
+    athlete_data = cur.fetchall()
+    cur.close()
+    return athlete_data
+
+def fetch_nation_detail(conn, noc, args=None, limit=DETAIL_PAGE_SIZE):
+    after = athlete_key(decode_cursor(args.get('after', ''))) if args else None
+    before = athlete_key(decode_cursor(args.get('before', ''))) if args else None
+    cur = conn.cursor(row_factory=dict_row)
+    
+    nation = reference_cache.nation(noc)
+    if nation:
+        nation_info = {'region': nation['region']}
+    else:
+        cur.execute("SELECT region FROM Nations WHERE noc = %s", (noc,))
+        nation_info = cur.fetchone()
+    
+    # Statistiche e classifica in pipeline; podio e tabella vengono dalla stessa
+    # aggregazione, letta una pagina alla volta: la memoria usata e il tempo di risposta
+    # non dipendono dal numero di atleti della nazione.
+    ranking_sql, ranking_params = keyset_query("""
+            SELECT a.athlete_id, a.athlete_id AS id, a.name, a.sex,
+                    STRING_AGG(DISTINCT e.sport, ', ') as sport, 
+                    STRING_AGG(DISTINCT g.game_name, ', ') as game_name,
+                    COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
+                    COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
+                    COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze,
+                    COUNT(p.medal) FILTER (WHERE p.medal IN ('Gold', 'Silver', 'Bronze')) AS total_medals
+            FROM Participations p
+            JOIN Athletes a ON p.athlete_id = a.athlete_id
+            JOIN Events e ON p.event_id = e.event_id
+            JOIN Games g ON p.game_id = g.game_id
+            WHERE p.noc = %s
+            GROUP BY a.athlete_id, a.name, a.sex
+    """, (noc,), ATHLETE_KEY, after, before, ranking_limit(after, limit))
+    stats_rows, ranking = fetch_many(conn, [
+        ("""
+            SELECT
+                COUNT(DISTINCT p.athlete_id) AS total_athletes,
+                COUNT(DISTINCT p.game_id) AS total_editions,
+                COUNT(DISTINCT e.sport) AS total_sports,
+                COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
+                COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
+                COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze
+            FROM Participations p
+            JOIN Events e ON p.event_id = e.event_id
+            WHERE p.noc = %s
+        """, (noc,)),
+        (ranking_sql, ranking_params),
+    ], row_factory=dict_row)
+    nation_stats = stats_rows[0]
+    top_athletes, details, has_prev, has_next = split_ranking(ranking, after, before, limit)
+    cur.close()
+    return {'nation_info': nation_info, 'nation_stats': nation_stats, 'top_athletes': top_athletes, 'details': details,
+            'prev': encode_cursor(details[0]) if details and has_prev else None,
+            'next': encode_cursor(details[-1]) if details and has_next else None}
+
+def fetch_game_detail(conn, game_name, args=None, limit=DETAIL_PAGE_SIZE):
+    after = athlete_key(decode_cursor(args.get('after', ''))) if args else None
+    before = athlete_key(decode_cursor(args.get('before', ''))) if args else None
+    cur = conn.cursor(row_factory=dict_row)
+    game_info = None
+    
+    game = reference_cache.game(game_name)
+    if not game:
+        cur.execute("SELECT game_id, city, season, year FROM Games WHERE game_name = %s", (game_name,))
+        game = cur.fetchone()
+    game_id = game['game_id'] if game else None
+    if game:
+        game_info = {'city': game['city'], 'season': game['season'], 'year': game['year']}
+    
+    ranking_sql, ranking_params = keyset_query("""
+            SELECT a.athlete_id, a.athlete_id AS id, a.name, a.sex,
+                    MAX(n.region) AS nation, MAX(n.region) AS region,
+                    STRING_AGG(DISTINCT e.sport, ', ') as sport,
+                    STRING_AGG(DISTINCT e.event_name, ', ') as event_name,
+                    COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
+                    COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
+                    COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze,
+                    COUNT(p.medal) FILTER (WHERE p.medal IN ('Gold', 'Silver', 'Bronze')) AS total_medals
+            FROM Participations p
+            JOIN Athletes a ON p.athlete_id = a.athlete_id
+            JOIN Nations n ON p.noc = n.noc
+            JOIN Events e ON p.event_id = e.event_id
+            WHERE p.game_id = %s
+            GROUP BY a.athlete_id, a.name, a.sex
+    """, (game_id,), ATHLETE_KEY, after, before, ranking_limit(after, limit))
+    stats_rows, ranking = fetch_many(conn, [
+        ("""
+            SELECT
+                COUNT(DISTINCT p.athlete_id) AS total_athletes,
+                COUNT(DISTINCT p.noc) AS total_nations,
+                COUNT(DISTINCT e.sport) AS total_sports,
+                COUNT(DISTINCT p.event_id) AS total_events,
+                COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
+                COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
+                COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze
+            FROM Participations p
+            JOIN Events e ON p.event_id = e.event_id
+            WHERE p.game_id = %s
+        """, (game_id,)),
+        (ranking_sql, ranking_params),
+    ], row_factory=dict_row)
+    game_stats = stats_rows[0]
+    top_athletes, details, has_prev, has_next = split_ranking(ranking, after, before, limit)
+    cur.close()
+    return {'game_info': game_info, 'game_stats': game_stats, 'top_athletes': top_athletes, 'details': details,
+            'prev': encode_cursor(details[0]) if details and has_prev else None,
+            'next': encode_cursor(details[-1]) if details and has_next else None}
+
+def fetch_sport_detail(conn, sport_name, args=None, limit=DETAIL_PAGE_SIZE):
+    after = sport_result_key(args.get('after', '')) if args else None
+    before = sport_result_key(args.get('before', '')) if args else None
+    results_sql, results_params = keyset_query("""
+            SELECT a.athlete_id, a.name, MAX(n.region) as region, 
+                    MAX(g.game_name) as game_name, MAX(e.event_name) as event_name,
+                    g.year, g.game_id, e.event_id,
+                    COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
+                    COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
+                    COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze
+            FROM Participations p
+            JOIN Athletes a ON p.athlete_id = a.athlete_id
+            JOIN Nations n ON p.noc = n.noc
+            JOIN Events e ON p.event_id = e.event_id
+            JOIN Games g ON p.game_id = g.game_id
+            WHERE e.sport = %s
+            GROUP BY a.athlete_id, a.name, g.game_id, e.event_id
+    """, (sport_name,), SPORT_RESULT_KEY, after, before, limit + 1)
+    # Le tre letture sono indipendenti: una sola andata e ritorno in pipeline.
+    stats_rows, top_athletes, details = fetch_many(conn, [
+        ("""
+            SELECT
+                COUNT(DISTINCT p.athlete_id) AS total_athletes,
+                COUNT(DISTINCT p.noc) AS total_nations,
+                COUNT(DISTINCT e.event_id) AS total_events,
+                COUNT(DISTINCT p.game_id) AS total_editions,
+                COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
+                COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
+                COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze
+            FROM Participations p
+            JOIN Events e ON p.event_id = e.event_id
+            WHERE e.sport = %s
+        """, (sport_name,)),
+        ("""
+            SELECT a.athlete_id, a.name, MAX(n.region) AS nation, a.sex,
+                COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
+                COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
+                COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze,
+                COUNT(p.medal) FILTER (WHERE p.medal IN ('Gold', 'Silver', 'Bronze')) AS total_medals
+            FROM Participations p
+            JOIN Athletes a ON p.athlete_id = a.athlete_id
+            JOIN Nations n ON p.noc = n.noc
+            JOIN Events e ON p.event_id = e.event_id
+            WHERE e.sport = %s AND p.medal IN ('Gold', 'Silver', 'Bronze')
+            GROUP BY a.athlete_id, a.name, a.sex
+            ORDER BY total_medals DESC, gold DESC, silver DESC, bronze DESC
+            LIMIT 3
+        """, (sport_name,)),
+        (results_sql, results_params),
+    ], row_factory=dict_row)
+    sport_stats = stats_rows[0]
+    details, has_prev, has_next = split_page(details, after, before, limit)
+    return {'sport_stats': sport_stats, 'top_athletes': top_athletes, 'details': details,
+            'prev': encode_sport_cursor(details[0]) if details and has_prev else None,
+            'next': encode_sport_cursor(details[-1]) if details and has_next else None}
+
+def fetch_nations(conn, q=''):
+    cur = conn.cursor(row_factory=dict_row)
+    
+    query = "SELECT noc AS code, region AS name FROM Nations WHERE 1=1"
+    params = []
+    order = "region ASC"
+    
+    if q:
+        match_sql, match_params = text_match(['region', 'noc'], q)
+        query += " AND " + match_sql
+        params.extend(match_params)
+        rank_sql, rank_params = relevance(['region', 'noc'], q)
+        order = f"{rank_sql} DESC, region ASC"
+        params.extend(rank_params)
+        
+    query += " ORDER BY " + order
+    
+    cur.execute(query, params)
+    nations_list = cur.fetchall()
+    cur.close()
+    return nations_list
+
+def fetch_games(conn, q='', seasons=None):
+    cur = conn.cursor(row_factory=dict_row)
+    
+    query = "SELECT year, season, game_name, city FROM Games WHERE 1=1"
+    params = []
+    order = "year DESC, season ASC"
+    
+    if q:
+        match_sql, match_params = text_match(['city'], q)
+        query += " AND " + match_sql
+        params.extend(match_params)
+        
+    if seasons:
+        query += " AND season = ANY(%s::text[])"
+        params.append(seasons)
+
+    if q:
+        rank_sql, rank_params = relevance(['city'], q)
+        order = f"{rank_sql} DESC, " + order
+        params.extend(rank_params)
+        
+    query += " ORDER BY " + order
+    
+    cur.execute(query, params)
+    games_list = cur.fetchall()
+    cur.close()
+    return games_list
+
+def fetch_sports(conn, q=''):
+    cur = conn.cursor(row_factory=dict_row)
+    
+    query = """
+        SELECT sport, COUNT(DISTINCT event_name) as total_events
+        FROM Events
+        WHERE 1=1
+    """
+    params = []
+    
+    order = "sport ASC"
+    
+    if q:
+        match_sql, match_params = text_match(['sport'], q)
+        query += " AND " + match_sql
+        params.extend(match_params)
+        rank_sql, rank_params = relevance(['sport'], q)
+        order = f"{rank_sql} DESC, sport ASC"
+        params.extend(rank_params)
+        
+    query += " GROUP BY sport ORDER BY " + order
+    
+    cur.execute(query, params)
+    sports_list = cur.fetchall()
+    cur.close()
+    return sports_list
+
+MEDAL_TABLE_LIMIT = 500
+
+# Dimensioni del medagliere: colonna di raggruppamento del cubo e query che aggiunge
+# nome ed eventuali attributi alle righe gia' aggregate.
+MEDAL_TABLE_GROUPS = {
+    'nation': ("r.noc", "n.region AS name, {totals} FROM totals t JOIN Nations n ON n.noc = t.key"),
+    'region': ("COALESCE(n.region, r.noc)", "t.key AS name, {totals} FROM totals t"),
+    'game': ("g.game_name", "t.key AS name, g.year, {totals} FROM totals t JOIN Games g ON g.game_name = t.key"),
+    'sport': ("r.sport", "t.key AS name, {totals} FROM totals t"),
+}
+
+def fetch_medal_table(conn, args):
+    # Medagliere letto dal cubo MedalRollup (nazione x edizione x sport, piu' i totali per
+    # nazione ed edizione): ogni combinazione di filtri aggrega le celle del cubo invece
+    # di Participations.
+    group = args.get('group', 'nation')
+    if group not in MEDAL_TABLE_GROUPS:
+        group = 'nation'
+    key, outer = MEDAL_TABLE_GROUPS[group]
+    seasons = args.getlist('season')
+    year_from = args.get('year_from', '').strip()
+    year_to = args.get('year_to', '').strip()
+    sport = args.get('sport', '').strip()
+    noc = args.get('noc', '').strip().upper()
+    limit = min(max(args.get('limit', 20, type=int) or 20, 1), MEDAL_TABLE_LIMIT)
+
+    query = f"""
+        SELECT {key} AS key,
+                SUM(r.gold) AS gold, SUM(r.silver) AS silver, SUM(r.bronze) AS bronze,
+                SUM(r.gold + r.silver + r.bronze) AS total_medals,
+                SUM(r.participations) AS participations
+        FROM MedalRollup r
+        JOIN Games g ON r.game_id = g.game_id
+        {"JOIN Nations n ON r.noc = n.noc" if group == 'region' else ""}
+        WHERE 1=1
+    """
+    params = []
+
+    if seasons:
+        query += " AND g.season = ANY(%s::text[])"
+        params.append(seasons)
+    if year_from.isdigit():
+        query += " AND g.year >= %s"
+        params.append(int(year_from))
+    if year_to.isdigit():
+        query += " AND g.year <= %s"
+        params.append(int(year_to))
+    # Senza filtro o raggruppamento per sport bastano le righe di totale (sport = '').
+    if sport:
+        query += " AND r.sport = %s"
+        params.append(sport)
+    elif group == 'sport':
+        query += " AND r.sport <> ''"
+    else:
+        query += " AND r.sport = ''"
+    if noc:
+        query += " AND r.noc = %s"
+        params.append(noc)
+
+    totals = "t.gold, t.silver, t.bronze, t.total_medals, t.participations"
+    query = (
+        f"WITH totals AS ({query} GROUP BY 1) SELECT t.key AS code, {outer.format(totals=totals)}"
+        " ORDER BY gold DESC, silver DESC, bronze DESC, name ASC LIMIT %s"
+    )
+    params.append(limit)
+
+    cur = conn.cursor(row_factory=dict_row)
+    cur.execute(query, params)
+    rows = cur.fetchall()
+    cur.close()
+    return rows
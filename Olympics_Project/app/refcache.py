@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+
+from psycopg.rows import dict_row
+
+from db import get_db_connection, release_db_connection
+from dataversion import data_version
+
+REFCACHE_TTL = float(os.getenv('REFCACHE_TTL', '300'))
+
+
+class ReferenceCache:
+    # Nations, Games ed Events cambiano solo con un nuovo caricamento dei dati: vengono
+    # letti una volta per processo e serviti dalla memoria fino a invalidazione, scadenza
+    # o cambio del contatore DataVersion.
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = None
+        self._loaded_at = 0.0
+        self._version = None
+
+    def _load(self):
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor(row_factory=dict_row)
+            cur.execute("SELECT noc, region FROM Nations ORDER BY region ASC")
+            nations = cur.fetchall()
+            cur.execute("SELECT game_id, game_name, city, season, year FROM Games ORDER BY year DESC, season ASC")
+            games = cur.fetchall()
+            cur.execute("SELECT event_id, sport, event_name FROM Events ORDER BY sport ASC, event_name ASC")
+            events = cur.fetchall()
+            cur.close()
+        finally:
+            release_db_connection(conn)
+        return {
+            'nations': nations,
+            'games': games,
+            'events': events,
+            'nation_by_noc': {n['noc']: n for n in nations},
+            'game_by_name': {g['game_name']: g for g in games},
+            'game_by_id': {g['game_id']: g for g in games},
+            'event_by_id': {e['event_id']: e for e in events},
+            'event_by_name': {e['event_name']: e for e in events},
+        }
+
+    def _fresh(self, version):
+        return (
+            self._data is not None
+            and self._version == version
+            and time.monotonic() - self._loaded_at < self.ttl
+        )
+
+    def _get(self):
+        version = data_version.current()
+        data = self._data
+        if self._fresh(version):
+            return data
+        with self._lock:
+            if not self._fresh(version):
+                self._data = self._load()
+                self._loaded_at = time.monotonic()
+                self._version = version
+            return self._data
+
+    def invalidate(self):
+        with self._lock:
+            self._data = None
+
+    def warm(self):
+        self._get()
+
+    def nations(self):
+        return self._get()['nations']
+
+    def games(self):
+        return self._get()['games']
+
+    def events(self):
+        return self._get()['events']
+
+    def nation(self, noc):
+        return self._get()['nation_by_noc'].get(noc)
+
+    def game(self, game_name):
+        return self._get()['game_by_name'].get(game_name)
+
+    def game_by_id(self, game_id):
+        return self._get()['game_by_id'].get(game_id)
+
+    def event(self, event_id):
+        return self._get()['event_by_id'].get(event_id)
+
+    def event_by_name(self, event_name):
+        return self._get()['event_by_name'].get(event_name)
+
+
+reference_cache = ReferenceCache(REFCACHE_TTL)
@@ -0,0 +1,123 @@
+import itertools
+import logging
+import os
+import threading
+import time
+
+import psycopg
+from flask import g, has_request_context
+from psycopg_pool import PoolTimeout
+
+from db import DB_REPLICA_HOSTS, get_db_connection, get_replica_pool, release_db_connection
+from dataversion import data_version
+
+DB_REPLICA_RETRY_INTERVAL = float(os.getenv('DB_REPLICA_RETRY_INTERVAL', '30'))
+DB_REPLICA_STICKY_SECONDS = float(os.getenv('DB_REPLICA_STICKY_SECONDS', '5'))
+
+logger = logging.getLogger('olympics.replicas')
+
+
+class ReplicaRouter:
+    # Smista le letture tra le repliche a rotazione. Una replica che non risponde resta
+    # esclusa per DB_REPLICA_RETRY_INTERVAL secondi; una replica viene usata solo se ha gia'
+    # applicato la versione DataVersion vista dal processo, altrimenti si legge dal primario.
+    # Stato e contatori sono condivisi dai thread del worker: si scrivono sotto _lock.
+
+    def __init__(self, hosts, retry_interval):
+        self.hosts = list(hosts)
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._next = itertools.cycle(range(len(self.hosts))) if self.hosts else None
+        self._down_until = {}
+        self._seen = {}
+        self._counts = {host: 0 for host in self.hosts}
+        self._counts['primary'] = 0
+
+    @property
+    def enabled(self):
+        return bool(self.hosts)
+
+    def _candidates(self):
+        with self._lock:
+            start = next(self._next)
+            now = time.monotonic()
+            ordered = self.hosts[start:] + self.hosts[:start]
+            return [host for host in ordered if self._down_until.get(host, 0) <= now]
+
+    def _mark_down(self, host):
+        logger.warning("Replica %s non raggiungibile: letture sul primario per %.0f s",
+                       host, self.retry_interval, exc_info=True)
+        with self._lock:
+            self._down_until[host] = time.monotonic() + self.retry_interval
+
+    def _count(self, target):
+        with self._lock:
+            self._counts[target] += 1
+
+    def _caught_up(self, host, conn, version):
+        # DataVersion cresce solo: se la replica ha gia' mostrato una versione >= di quella
+        # corrente non serve rileggerla.
+        if version is None:
+            return False
+        with self._lock:
+            if self._seen.get(host, -1) >= version:
+                return True
+        cur = conn.cursor()
+        cur.execute("SELECT version FROM DataVersion")
+        row = cur.fetchone()
+        cur.close()
+        conn.rollback()
+        seen = row[0] if row else -1
+        with self._lock:
+            self._seen[host] = max(seen, self._seen.get(host, -1))
+        return seen >= version
+
+    def connection(self):
+        if self.enabled and not primary_only():
+            version = data_version.current()
+            for host in self._candidates():
+                try:
+                    conn = get_replica_pool(host).getconn()
+                except PoolTimeout:
+                    # Pool pieno ma replica sana: si prova il candidato successivo senza escluderla.
+                    continue
+                except psycopg.OperationalError:
+                    self._mark_down(host)
+                    continue
+                try:
+                    if self._caught_up(host, conn, version):
+                        self._count(host)
+                        return conn
+                except Exception:
+                    self._mark_down(host)
+                release_db_connection(conn)
+        self._count('primary')
+        return get_db_connection()
+
+    def status(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                host: {
+                    'available': self._down_until.get(host, 0) <= now,
+                    'version': self._seen.get(host),
+                    'reads': self._counts[host],
+                }
+                for host in self.hosts
+            } | {'primary': {'reads': self._counts['primary']}}
+
+
+def primary_only():
+    # Impostato per la richiesta da app.py: sessioni che hanno appena scritto.
+    return has_request_context() and g.get('read_primary', False)
+
+
+def stick_to_primary(value):
+    g.read_primary = value
+
+
+replica_router = ReplicaRouter(DB_REPLICA_HOSTS, DB_REPLICA_RETRY_INTERVAL)
+
+
+def get_read_connection():
+    return replica_router.connection()
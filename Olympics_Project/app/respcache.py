@@ -0,0 +1,82 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, session, make_response
+
+from dataversion import data_version
+
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', '256'))
+APP_VERSION = os.getenv('APP_VERSION', '')
+
+
+class ResponseCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != version:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, version, body, mimetype):
+        with self._lock:
+            self._entries[key] = (version, body, mimetype)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE)
+
+
+def cache_key():
+    args = sorted(request.args.items(multi=True))
+    return request.endpoint + '|' + request.path + '|' + repr(args)
+
+
+def cached_page(view):
+    # Le pagine dipendono solo dai dati: la chiave e' rotta + argomenti, la validita' e'
+    # legata al contatore DataVersion e l'ETag permette di rispondere 304 senza query.
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != 'GET' or session.get('_flashes'):
+            return view(*args, **kwargs)
+
+        version = data_version.current()
+        if version is None:
+            return view(*args, **kwargs)
+
+        key = cache_key()
+        etag = hashlib.md5(f'{APP_VERSION}|{version}|{key}'.encode()).hexdigest()
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        else:
+            entry = response_cache.get(key, version)
+            if entry is not None:
+                response = make_response(entry[1])
+                response.mimetype = entry[2]
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                response_cache.put(key, version, response.get_data(), response.mimetype)
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return wrapper
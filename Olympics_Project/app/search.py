@@ -0,0 +1,28 @@
+def like_pattern(q):
+    escaped = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def text_match(columns, q):
+    # ILIKE '%q%' sulle colonne indicizzate con gin_trgm_ops viene risolto dall'indice
+    # trigram invece che con una scansione sequenziale.
+    sql = " OR ".join(f"{col} ILIKE %s" for col in columns)
+    return f"({sql})", [like_pattern(q)] * len(columns)
+
+
+def relevance(columns, q):
+    sql = ", ".join(f"similarity({col}, %s)" for col in columns)
+    if len(columns) > 1:
+        sql = f"GREATEST({sql})"
+    return sql, [q] * len(columns)
+
+
+def participation_match(q, alias='p'):
+    # Ogni ramo interroga una tabella piccola tramite il suo indice trigram e filtra le
+    # partecipazioni per chiave, invece di applicare tre ILIKE a ogni riga del join.
+    return (
+        f"({alias}.athlete_id IN (SELECT athlete_id FROM Athletes WHERE name ILIKE %s)"
+        f" OR {alias}.event_id IN (SELECT event_id FROM Events WHERE sport ILIKE %s)"
+        f" OR {alias}.noc IN (SELECT noc FROM Nations WHERE region ILIKE %s))",
+        [like_pattern(q)] * 3,
+    )
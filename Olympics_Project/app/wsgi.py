@@ -0,0 +1,20 @@
+from analytics import columnar_engine
+from app import app
+from db import init_pool, get_pool_stats
+from dataversion import data_version
+from instrument import metrics_store
+from refcache import reference_cache
+
+
+def warm_up(log):
+    # Apre il pool del worker e carica le tabelle di riferimento prima della prima
+    # richiesta; un database non ancora pronto non impedisce l'avvio.
+    metrics_store.start(get_pool_stats)
+    try:
+        init_pool()
+        data_version.current()
+        reference_cache.warm()
+        columnar_engine.warm()
+        log.info("Worker pronto: %s connessioni aperte", get_pool_stats().get('pool_size'))
+    except Exception:
+        log.exception("Riscaldamento delle cache non riuscito, si procede a freddo")
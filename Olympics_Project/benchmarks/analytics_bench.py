@@ -0,0 +1,87 @@
+import argparse
+import sys
+import time
+
+from werkzeug.datastructures import MultiDict
+
+from common import APP_DIR, summarize, write_report
+
+sys.path.insert(0, APP_DIR)
+from analytics import columnar_engine, np
+from db import get_db_connection, release_db_connection, close_pool
+from queries import encode_cursor, fetch_athletes
+
+
+def filter_sets(args):
+    # Le combinazioni di filtri della lista atleti che aggregano Participations.
+    return {
+        'medal_gold_summer': [('medal', 'Gold'), ('season', 'Summer')],
+        'season_winter': [('season', 'Winter')],
+        'year': [('year', str(args.year))],
+        'game': [('games', f'{args.year} Summer')],
+        'team': [('team', args.team)],
+        'sport': [('sport', args.sport)],
+        'team_sport_medals': [('team', args.team), ('sport', args.sport), ('medal', 'Gold'),
+                              ('medal', 'Silver'), ('medal', 'Bronze')],
+        'female_medalists': [('sex', 'F'), ('medal', 'Gold'), ('medal', 'Silver'), ('medal', 'Bronze')],
+    }
+
+
+def run(conn, params, engine):
+    columnar_engine.enabled = engine
+    return fetch_athletes(conn, MultiDict(params))
+
+
+def measure(conn, params, engine, iterations, warmup):
+    for _ in range(warmup):
+        run(conn, params, engine)
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        run(conn, params, engine)
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Confronta la lista atleti filtrata: aggregazione SQL e motore colonnare in memoria.")
+    parser.add_argument('--team', default='Italy')
+    parser.add_argument('--sport', default='Athletics')
+    parser.add_argument('--year', type=int, default=2016)
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--output', help="file JSON di destinazione (default stdout)")
+    args = parser.parse_args()
+    if np is None:
+        raise SystemExit("NumPy non installato: il motore colonnare non e' disponibile.")
+
+    columnar_engine.enabled = True
+    start = time.perf_counter()
+    columnar_engine.warm()
+    load_ms = (time.perf_counter() - start) * 1000
+
+    results = {'engine_load_ms': round(load_ms, 3)}
+    conn = get_db_connection()
+    try:
+        for name, params in filter_sets(args).items():
+            # Prima pagina e pagina successiva (cursore after) devono coincidere con SQL.
+            sql_rows, _, sql_next = run(conn, params, False)
+            pages = [params]
+            if sql_rows and sql_next:
+                pages.append(params + [('after', encode_cursor(sql_rows[-1]))])
+            matches = all(run(conn, page, False) == run(conn, page, True) for page in pages)
+            results[name] = {
+                'rows': len(sql_rows),
+                'matches_sql': matches,
+                'sql': measure(conn, params, False, args.iterations, args.warmup),
+                'engine': measure(conn, params, True, args.iterations, args.warmup),
+            }
+    finally:
+        release_db_connection(conn)
+        close_pool()
+    write_report('analytics', results, args.output, team=args.team, sport=args.sport, year=args.year,
+                 iterations=args.iterations, warmup=args.warmup)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import datetime
+import json
+import os
+import platform
+import subprocess
+
+DB_USER = os.getenv('DB_USER', 'user')
+DB_PASS = os.getenv('DB_PASS', 'password')
+DB_HOST = os.getenv('DB_HOST', 'localhost')
+DB_NAME = os.getenv('DB_NAME', 'olympics_db')
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(BENCH_DIR)
+APP_DIR = os.path.join(PROJECT_DIR, 'app')
+
+
+def percentile(sorted_samples, pct):
+    # Percentile "nearest rank": nessuna interpolazione, valori sempre osservati.
+    if not sorted_samples:
+        return None
+    rank = max(1, -(-len(sorted_samples) * pct // 100))
+    return sorted_samples[int(rank) - 1]
+
+
+def summarize(samples_ms):
+    samples = sorted(samples_ms)
+    if not samples:
+        return {'count': 0}
+    return {
+        'count': len(samples),
+        'min_ms': round(samples[0], 3),
+        'p50_ms': round(percentile(samples, 50), 3),
+        'p95_ms': round(percentile(samples, 95), 3),
+        'p99_ms': round(percentile(samples, 99), 3),
+        'max_ms': round(samples[-1], 3),
+        'mean_ms': round(sum(samples) / len(samples), 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_report(kind, results, output=None, **settings):
+    # Formato stabile e ordinato: due report di commit diversi si confrontano con diff.
+    report = {
+        'benchmark': kind,
+        'commit': git_commit(),
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'settings': settings,
+        'results': results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True, ensure_ascii=False, default=str)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f"Report salvato in {output}")
+    else:
+        print(text)
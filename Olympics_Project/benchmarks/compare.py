@@ -0,0 +1,40 @@
+import argparse
+import json
+
+
+def flatten(report):
+    # Porta ogni report a {nome misura: statistiche} indipendentemente dal tipo di benchmark.
+    results = report['results']
+    if report['benchmark'] == 'query':
+        return {f"#{r['query_no']:02d} {r['query'][:50]}": r.get('execution', {}) for r in results}
+    if report['benchmark'] == 'http':
+        return {r['route']: dict(r['latency'], rps=r['throughput_rps']) for r in results['routes']}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Confronta due report JSON dei benchmark (es. tra due commit).")
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--metric', default='p50_ms', help="statistica da confrontare (p50_ms, p95_ms, p99_ms, ...)")
+    args = parser.parse_args()
+
+    with open(args.before, encoding='utf-8') as f:
+        before = json.load(f)
+    with open(args.after, encoding='utf-8') as f:
+        after = json.load(f)
+    print(f"{before.get('commit')} -> {after.get('commit')}  ({args.metric})")
+
+    old, new = flatten(before), flatten(after)
+    for name in sorted(set(old) | set(new)):
+        a = old.get(name, {}).get(args.metric)
+        b = new.get(name, {}).get(args.metric)
+        if a is None or b is None:
+            print(f"  {name:<60} {a!s:>10} -> {b!s:>10}")
+            continue
+        change = (b - a) / a * 100 if a else 0
+        print(f"  {name:<60} {a:>10.3f} -> {b:>10.3f}  {change:+6.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import argparse
+import sys
+import time
+
+import psycopg
+from psycopg.rows import dict_row
+
+from common import APP_DIR, DB_HOST, DB_NAME, DB_PASS, DB_USER, summarize, write_report
+
+sys.path.insert(0, APP_DIR)
+from db import fetch_many, get_db_connection, release_db_connection, close_pool
+
+NATION_STATS = """
+    SELECT
+        COUNT(DISTINCT p.athlete_id) AS total_athletes,
+        COUNT(DISTINCT p.game_id) AS total_editions,
+        COUNT(DISTINCT e.sport) AS total_sports,
+        COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
+        COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
+        COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze
+    FROM Participations p
+    JOIN Events e ON p.event_id = e.event_id
+    WHERE p.noc = %s
+"""
+
+# Flusso precedente di nation_detail: quattro query in sequenza, podio e tabella
+# calcolati con due aggregazioni separate.
+LEGACY_NATION = [
+    "SELECT region FROM Nations WHERE noc = %s",
+    NATION_STATS,
+    """
+    SELECT a.athlete_id, a.name, a.sex,
+        COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
+        COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
+        COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze,
+        COUNT(p.medal) FILTER (WHERE p.medal IN ('Gold', 'Silver', 'Bronze')) AS total_medals
+    FROM Participations p
+    JOIN Athletes a ON p.athlete_id = a.athlete_id
+    WHERE p.noc = %s
+    GROUP BY a.athlete_id, a.name, a.sex
+    ORDER BY gold DESC, silver DESC, bronze DESC, a.name ASC
+    LIMIT 3
+    """,
+    """
+    SELECT a.athlete_id as id, a.name,
+            STRING_AGG(DISTINCT e.sport, ', ') as sport,
+            STRING_AGG(DISTINCT g.game_name, ', ') as game_name,
+            COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
+            COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
+            COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze
+    FROM Participations p
+    JOIN Athletes a ON p.athlete_id = a.athlete_id
+    JOIN Events e ON p.event_id = e.event_id
+    JOIN Games g ON p.game_id = g.game_id
+    WHERE p.noc = %s
+    GROUP BY a.athlete_id, a.name
+    ORDER BY gold DESC, silver DESC, bronze DESC, a.name ASC
+    OFFSET 3
+    """,
+]
+
+# Flusso attuale: la regione arriva dalla cache di riferimento, statistiche e classifica
+# viaggiano in pipeline e la classifica e' un'unica aggregazione.
+CURRENT_NATION = [
+    NATION_STATS,
+    """
+    SELECT a.athlete_id, a.athlete_id AS id, a.name, a.sex,
+            STRING_AGG(DISTINCT e.sport, ', ') as sport,
+            STRING_AGG(DISTINCT g.game_name, ', ') as game_name,
+            COUNT(p.medal) FILTER (WHERE p.medal = 'Gold') AS gold,
+            COUNT(p.medal) FILTER (WHERE p.medal = 'Silver') AS silver,
+            COUNT(p.medal) FILTER (WHERE p.medal = 'Bronze') AS bronze,
+            COUNT(p.medal) FILTER (WHERE p.medal IN ('Gold', 'Silver', 'Bronze')) AS total_medals
+    FROM Participations p
+    JOIN Athletes a ON p.athlete_id = a.athlete_id
+    JOIN Events e ON p.event_id = e.event_id
+    JOIN Games g ON p.game_id = g.game_id
+    WHERE p.noc = %s
+    GROUP BY a.athlete_id, a.name, a.sex
+    ORDER BY gold DESC, silver DESC, bronze DESC, a.name ASC, a.athlete_id ASC
+    """,
+]
+
+
+def run_legacy(conn, noc):
+    cur = conn.cursor(row_factory=dict_row)
+    for sql in LEGACY_NATION:
+        cur.execute(sql, (noc,))
+        cur.fetchall()
+    cur.close()
+
+
+def run_current(conn, noc):
+    fetch_many(conn, [(sql, (noc,)) for sql in CURRENT_NATION], row_factory=dict_row, parallel=False)
+
+
+def run_parallel(conn, noc):
+    fetch_many(conn, [(sql, (noc,)) for sql in CURRENT_NATION], row_factory=dict_row, parallel=True)
+
+
+def measure(conn, flow, noc, iterations, warmup):
+    for _ in range(warmup):
+        flow(conn, noc)
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        flow(conn, noc)
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Confronta la latenza di nation_detail: quattro query in sequenza, pipeline e connessioni parallele.")
+    parser.add_argument('--noc', default='ITA')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--output', help="file JSON di destinazione (default stdout)")
+    args = parser.parse_args()
+
+    with psycopg.connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS, autocommit=True) as conn:
+        result = {
+            'legacy_sequential': measure(conn, run_legacy, args.noc, args.iterations, args.warmup),
+            'single_roundtrip': measure(conn, run_current, args.noc, args.iterations, args.warmup),
+        }
+
+    # La modalita' parallela usa il pool dell'applicazione (DB_PARALLEL_QUERIES=1).
+    conn = get_db_connection()
+    try:
+        result['parallel_connections'] = measure(conn, run_parallel, args.noc, args.iterations, args.warmup)
+    finally:
+        release_db_connection(conn)
+        close_pool()
+    write_report('detail_roundtrips', result, args.output, host=DB_HOST, noc=args.noc,
+                 iterations=args.iterations, warmup=args.warmup)
+
+
+if __name__ == "__main__":
+    main()
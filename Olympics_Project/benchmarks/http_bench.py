@@ -0,0 +1,116 @@
+import argparse
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from common import summarize, write_report
+
+# Una richiesta rappresentativa per ogni route GET dell'applicazione.
+DEFAULT_ROUTES = [
+    '/',
+    '/athletes',
+    '/athletes?medal=Gold&season=Summer',
+    '/athletes?q={athlete_query}',
+    '/athlete/{athlete_id}',
+    '/athletes/export?format=csv&medal=Gold',
+    '/nations',
+    '/nations?q={nation_query}',
+    '/nation/{noc}',
+    '/games',
+    '/game/{game}',
+    '/sports',
+    '/sport/{sport}',
+    '/add_athlete',
+    '/api/v1/athletes?format=columnar',
+    '/api/v1/nations/{noc}',
+    '/api/v1/games/{game}',
+    '/api/v1/sports/{sport}',
+]
+
+
+def fetch(url, timeout):
+    request = urllib.request.Request(url, headers={'Accept-Encoding': 'gzip'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            size = len(response.read())
+            status = response.status
+    except urllib.error.HTTPError as e:
+        size, status = 0, e.code
+    except (urllib.error.URLError, OSError):
+        size, status = 0, None
+    return (time.perf_counter() - start) * 1000, status, size
+
+
+def bench_route(base_url, route, concurrency, requests, timeout):
+    url = base_url.rstrip('/') + route
+    samples, statuses, sizes = [], {}, []
+    lock = threading.Lock()
+
+    def worker(_):
+        elapsed, status, size = fetch(url, timeout)
+        with lock:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if status == 200:
+                samples.append(elapsed)
+                sizes.append(size)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(requests)))
+    wall = time.perf_counter() - start
+
+    return {
+        'route': route,
+        'latency': summarize(samples),
+        'throughput_rps': round(len(samples) / wall, 2) if wall else None,
+        'statuses': statuses,
+        'avg_bytes': round(sum(sizes) / len(sizes)) if sizes else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carico HTTP su tutte le route dell'applicazione.")
+    parser.add_argument('--base-url', default='http://localhost:5000')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help="richieste per route")
+    parser.add_argument('--warmup', type=int, default=5, help="richieste per route prima della misura")
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--route', action='append', help="route da misurare (ripetibile, default tutte)")
+    parser.add_argument('--noc', default='ITA')
+    parser.add_argument('--game', default='2016 Summer')
+    parser.add_argument('--sport', default='Athletics')
+    parser.add_argument('--athlete-id', default='1')
+    parser.add_argument('--athlete-query', default='Phelps')
+    parser.add_argument('--nation-query', default='ita')
+    parser.add_argument('--output', help="file JSON di destinazione (default stdout)")
+    args = parser.parse_args()
+
+    values = {
+        'noc': args.noc, 'game': args.game, 'sport': args.sport, 'athlete_id': args.athlete_id,
+        'athlete_query': args.athlete_query, 'nation_query': args.nation_query,
+    }
+    values = {k: urllib.parse.quote(v) for k, v in values.items()}
+    routes = [r.format(**values) for r in (args.route or DEFAULT_ROUTES)]
+
+    results = []
+    total_ok, start = 0, time.perf_counter()
+    for route in routes:
+        for _ in range(args.warmup):
+            fetch(args.base_url.rstrip('/') + route, args.timeout)
+        result = bench_route(args.base_url, route, args.concurrency, args.requests, args.timeout)
+        total_ok += result['latency']['count']
+        results.append(result)
+        print(f"{route:<45} p50 {result['latency'].get('p50_ms', '-'):>9} ms  {result['throughput_rps']:>8} req/s")
+
+    write_report('http', {
+        'routes': results,
+        'overall_throughput_rps': round(total_ok / (time.perf_counter() - start), 2),
+    }, args.output, base_url=args.base_url, concurrency=args.concurrency, requests=args.requests, warmup=args.warmup)
+
+
+if __name__ == "__main__":
+    main()
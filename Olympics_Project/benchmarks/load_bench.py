@@ -0,0 +1,80 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from common import APP_DIR, summarize, write_report
+
+sys.path.insert(0, os.path.join(APP_DIR, 'database'))
+
+
+class NullCursor:
+    # COPY senza database: i blocchi vengono serializzati come nel caricamento reale e scartati.
+    @contextlib.contextmanager
+    def copy(self, statement):
+        yield self
+
+    def write(self, data):
+        pass
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(mode):
+    import load_data
+    import snapshot
+
+    baseline = peak_rss_mb()
+    stats = load_data.CopyStats()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if mode == 'csv':
+            start = time.perf_counter()
+            load_data.stream_ingestion(NullCursor(), stats)
+        else:
+            digest = snapshot.source_hash(load_data.EVENTS_CSV, load_data.REGIONS_CSV)
+            directory = snapshot.find_snapshot(digest) or load_data.build_snapshot(digest)
+            start = time.perf_counter()
+            load_data.snapshot_ingestion(NullCursor(), directory, stats)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+    print(json.dumps({'ms': elapsed_ms, 'rows': stats.rows, 'import_rss_mb': baseline, 'peak_rss_mb': peak_rss_mb()}))
+
+
+def run_child(mode, directory):
+    # Ogni misura in un processo nuovo: il picco di memoria (ru_maxrss) non si azzera.
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode],
+                            cwd=directory, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Confronta lettura e normalizzazione del CSV con la lettura dello snapshot Parquet (senza database).")
+    parser.add_argument('--dir', default=os.path.dirname(APP_DIR), help="cartella che contiene data/ (es. l'output di scale_data.py)")
+    parser.add_argument('--iterations', type=int, default=3)
+    parser.add_argument('--output', help="file JSON di destinazione (default stdout)")
+    parser.add_argument('--child', choices=['csv', 'snapshot'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child)
+        return
+
+    results = {}
+    for mode in ('csv', 'snapshot'):
+        runs = [run_child(mode, args.dir) for _ in range(args.iterations)]
+        results[mode] = {
+            'rows': runs[0]['rows'],
+            'time': summarize([r['ms'] for r in runs]),
+            'import_rss_mb': round(min(r['import_rss_mb'] for r in runs), 1),
+            'peak_rss_mb': round(max(r['peak_rss_mb'] for r in runs), 1),
+        }
+    write_report('load', results, args.output, dir=args.dir, iterations=args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import argparse
+import os
+import sys
+import time
+
+import psycopg
+from werkzeug.datastructures import MultiDict
+
+from common import APP_DIR, DB_HOST, DB_NAME, DB_PASS, DB_USER, summarize, write_report
+
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, 'database'))
+from analytics import columnar_engine
+from migrate import split_statements
+from partitions import EDITION_COLUMNS, is_partitioned, replace_edition, swap_edition_rows
+from queries import fetch_athlete_detail, fetch_athletes, fetch_game_detail, fetch_nation_detail, fetch_sport_detail
+
+ANALYTICAL_QUERY = os.path.join(APP_DIR, 'database', 'Analytical_query.sql')
+
+
+def measure(func, iterations, warmup):
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def workloads(conn, args):
+    # Le letture dell'app che filtrano per edizione, stagione, sport o nazione, piu' il
+    # medagliere estivo di Analytical_query.sql.
+    with open(ANALYTICAL_QUERY, encoding='utf-8') as f:
+        analytical = split_statements(f.read())[0]
+    game_id, athlete_id = conn.execute("""
+        SELECT g.game_id, (SELECT athlete_id FROM participations p WHERE p.game_id = g.game_id LIMIT 1)
+        FROM games g WHERE g.game_name = %s
+    """, (args.game,)).fetchone()
+    return {
+        'game_detail': lambda: fetch_game_detail(conn, args.game, MultiDict()),
+        'sport_detail': lambda: fetch_sport_detail(conn, args.sport, MultiDict()),
+        'nation_detail': lambda: fetch_nation_detail(conn, args.noc, MultiDict()),
+        'athlete_detail': lambda: fetch_athlete_detail(conn, athlete_id),
+        'athletes_game': lambda: fetch_athletes(conn, MultiDict([('games', args.game)])),
+        'athletes_season': lambda: fetch_athletes(conn, MultiDict([('season', 'Winter')])),
+        'analytical_summer': lambda: conn.execute(analytical).fetchall(),
+        'edition_medals': lambda: conn.execute(
+            "SELECT noc, COUNT(*) FROM participations WHERE game_id = %s AND medal <> 'NA' GROUP BY noc",
+            (game_id,)).fetchall(),
+    }, game_id
+
+
+def edition_data(conn, game_id):
+    with conn.cursor() as cur:
+        data = bytearray()
+        with cur.copy(f"COPY (SELECT {', '.join(EDITION_COLUMNS)} FROM participations WHERE game_id = {game_id})"
+                      " TO STDOUT (FORMAT csv)") as copy:
+            for block in copy:
+                data += block
+    return bytes(data), data.count(b'\n')
+
+
+def bench_reload(conn, func, game_id, data, rows, iterations):
+    # Ricarica l'edizione con le sue stesse righe e annulla la transazione: con la tabella
+    # unica DELETE e COPY, con quella partizionata sostituzione della partizione.
+    samples = []
+    for _ in range(iterations):
+        with conn.transaction(force_rollback=True):
+            with conn.cursor() as cur:
+                start = time.perf_counter()
+                func(cur, game_id, data, rows)
+                samples.append((time.perf_counter() - start) * 1000)
+    return dict(summarize(samples), rows=rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Misura letture e ricarica di un'edizione sul layout corrente di Participations (tabella unica o partizionata).")
+    parser.add_argument('--game', default='2016 Summer')
+    parser.add_argument('--sport', default='Athletics')
+    parser.add_argument('--noc', default='ITA')
+    parser.add_argument('--iterations', type=int, default=15)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--reload-iterations', type=int, default=5)
+    parser.add_argument('--output', help="file JSON di destinazione (default stdout)")
+    args = parser.parse_args()
+
+    columnar_engine.enabled = False
+    results = {}
+    with psycopg.connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS, autocommit=True) as conn:
+        with conn.cursor() as cur:
+            partitioned = is_partitioned(cur)
+            cur.execute("SELECT COUNT(*) FROM participations")
+            rows = cur.fetchone()[0]
+        funcs, game_id = workloads(conn, args)
+        for name, func in funcs.items():
+            results[name] = measure(func, args.iterations, args.warmup)
+            print(f"{name:<20} p50 {results[name]['p50_ms']:>10} ms", file=sys.stderr)
+        # reload_rows misura solo Participations, reload_edition anche le tabelle derivate.
+        data, edition_rows = edition_data(conn, game_id)
+        for name, func in (('reload_rows', swap_edition_rows), ('reload_edition', replace_edition)):
+            results[name] = bench_reload(conn, func, game_id, data, edition_rows, args.reload_iterations)
+            print(f"{name:<20} p50 {results[name]['p50_ms']:>10} ms", file=sys.stderr)
+
+    write_report('partition', results, args.output, layout='partitioned' if partitioned else 'flat',
+                 participations=rows, game=args.game, sport=args.sport, noc=args.noc,
+                 iterations=args.iterations, warmup=args.warmup, reload_iterations=args.reload_iterations)
+
+
+if __name__ == "__main__":
+    main()
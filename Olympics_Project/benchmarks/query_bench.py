@@ -0,0 +1,90 @@
+import argparse
+import os
+import re
+import sys
+import time
+
+import psycopg
+
+from common import APP_DIR, DB_HOST, DB_NAME, DB_PASS, DB_USER, summarize, write_report
+
+sys.path.insert(0, os.path.join(APP_DIR, 'database'))
+from migrate import PLAN_QUERIES, split_statements
+
+# nextval e setval modificano la sequenza anche se la transazione viene annullata.
+SEQUENCE_CALL = re.compile(r'\b(nextval|setval)\s*\(', re.IGNORECASE)
+
+
+def explain_analyze(conn, query):
+    # EXPLAIN ANALYZE esegue davvero la query: INSERT/UPDATE/DELETE di query.sql vengono
+    # annullati dal ROLLBACK del savepoint. Le query che chiamano nextval o setval non
+    # passano di qui (main le salta), cosi' il database resta invariato.
+    with conn.transaction(force_rollback=True):
+        with conn.cursor() as cur:
+            start = time.perf_counter()
+            cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query)
+            wall_ms = (time.perf_counter() - start) * 1000
+            plan = cur.fetchone()[0][0]
+    return plan, wall_ms
+
+
+def bench_query(conn, query, repeat, warmup):
+    for _ in range(warmup):
+        explain_analyze(conn, query)
+    execution, planning, wall = [], [], []
+    plan = None
+    for _ in range(repeat):
+        plan, wall_ms = explain_analyze(conn, query)
+        execution.append(plan['Execution Time'])
+        planning.append(plan['Planning Time'])
+        wall.append(wall_ms)
+    root = plan['Plan']
+    return {
+        'execution': summarize(execution),
+        'planning': summarize(planning),
+        'wall': summarize(wall),
+        'rows': root.get('Actual Rows'),
+        'node': root.get('Node Type'),
+        'total_cost': root.get('Total Cost'),
+        'shared_hit_blocks': root.get('Shared Hit Blocks'),
+        'shared_read_blocks': root.get('Shared Read Blocks'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Misura con EXPLAIN ANALYZE ogni query di query.sql.")
+    parser.add_argument('--file', default=PLAN_QUERIES, help="file SQL da misurare (default query.sql)")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--only', type=int, nargs='*', help="numeri delle query da misurare (da 1)")
+    parser.add_argument('--output', help="file JSON di destinazione (default stdout)")
+    args = parser.parse_args()
+
+    with open(args.file, encoding='utf-8') as f:
+        queries = split_statements(f.read())
+
+    results = []
+    with psycopg.connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS) as conn:
+        for query_no, query in enumerate(queries, start=1):
+            if args.only and query_no not in args.only:
+                continue
+            entry = {'query_no': query_no, 'query': ' '.join(query.split())}
+            if SEQUENCE_CALL.search(query):
+                entry['skipped'] = "modifica una sequenza, che il ROLLBACK non ripristina"
+                results.append(entry)
+                print(f"#{query_no:<3} {'saltata':>14}     {entry['query'][:60]}", file=sys.stderr)
+                continue
+            try:
+                entry.update(bench_query(conn, query, args.repeat, args.warmup))
+            except psycopg.Error as e:
+                entry['error'] = str(e).strip()
+            results.append(entry)
+            p50 = entry.get('execution', {}).get('p50_ms')
+            print(f"#{query_no:<3} p50 {p50 if p50 is not None else 'errore':>10} ms  {entry['query'][:60]}", file=sys.stderr)
+
+    write_report('query', results, args.output, host=DB_HOST, file=os.path.basename(args.file),
+                 repeat=args.repeat, warmup=args.warmup)
+
+
+if __name__ == "__main__":
+    main()
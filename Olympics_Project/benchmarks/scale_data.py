@@ -0,0 +1,51 @@
+import argparse
+import os
+import shutil
+
+import pandas as pd
+
+from common import PROJECT_DIR
+
+SOURCE_DIR = os.path.join(PROJECT_DIR, 'data')
+CHUNK_SIZE = 100000
+
+
+def scale_dataset(factor, out_dir, source_dir=SOURCE_DIR):
+    # Replica il dataset `factor` volte con atleti nuovi (ID traslati e nomi distinti):
+    # edizioni, eventi e nazioni restano gli stessi, cosi' crescono le partecipazioni per
+    # edizione/nazione/sport come succederebbe con un archivio piu' ampio.
+    events_csv = os.path.join(source_dir, 'athlete_events.csv')
+    target_dir = os.path.join(out_dir, 'data')
+    os.makedirs(target_dir, exist_ok=True)
+    shutil.copy(os.path.join(source_dir, 'noc_regions.csv'), target_dir)
+
+    max_id = int(pd.read_csv(events_csv, usecols=['ID'])['ID'].max())
+    target = os.path.join(target_dir, 'athlete_events.csv')
+    rows = 0
+    with open(target, 'w', encoding='utf-8', newline='') as f:
+        header = True
+        for copy_no in range(factor):
+            for chunk in pd.read_csv(events_csv, chunksize=CHUNK_SIZE):
+                if copy_no:
+                    chunk['ID'] = chunk['ID'] + copy_no * max_id
+                    chunk['Name'] = chunk['Name'] + f' #{copy_no + 1}'
+                chunk.to_csv(f, header=header, index=False)
+                header = False
+                rows += len(chunk)
+            print(f"Copia {copy_no + 1}/{factor} scritta ({rows} righe).")
+    return target, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera un dataset sintetico N volte piu' grande di data/athlete_events.csv.")
+    parser.add_argument('factor', type=int, help="fattore di moltiplicazione (es. 10 o 100)")
+    parser.add_argument('--out', required=True, help="cartella di destinazione (verra' creata OUT/data/)")
+    parser.add_argument('--source', default=SOURCE_DIR, help="cartella con i CSV originali")
+    args = parser.parse_args()
+    target, rows = scale_dataset(args.factor, args.out, args.source)
+    print(f"Dataset scritto in {target}: {rows} righe.")
+    print(f"Caricamento: cd {args.out} && python {os.path.join(PROJECT_DIR, 'app', 'database', 'load_data.py')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+# Configurazione del server di produzione: gunicorn pre-fork con worker a thread.
+# Avvio: gunicorn --config gunicorn.conf.py
+
+chdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app')
+wsgi_app = 'wsgi:app'
+
+bind = os.getenv('WEB_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('WEB_THREADS', '4'))
+worker_class = 'gthread'
+timeout = int(os.getenv('WEB_TIMEOUT', '60'))
+graceful_timeout = int(os.getenv('WEB_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('WEB_KEEPALIVE', '5'))
+max_requests = int(os.getenv('WEB_MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.getenv('WEB_MAX_REQUESTS_JITTER', '0'))
+
+accesslog = os.getenv('WEB_ACCESS_LOG', '-') or None
+errorlog = '-'
+loglevel = os.getenv('LOG_LEVEL', 'info').lower()
+
+# /metrics somma i contatori di tutti i worker tramite i file di questa cartella (una
+# cartella diversa per ogni istanza di gunicorn sullo stesso host).
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'olympics_metrics'))
+
+# L'applicazione viene caricata da ogni worker dopo il fork: il pool di connessioni e le
+# cache nascono direttamente nel processo che le usa.
+preload_app = False
+
+
+def on_starting(server):
+    # I file di un'esecuzione precedente non vanno sommati ai contatori nuovi.
+    shutil.rmtree(os.environ['METRICS_DIR'], ignore_errors=True)
+
+
+def post_worker_init(worker):
+    from wsgi import warm_up
+    warm_up(worker.log)
+
+
+def worker_exit(server, worker):
+    from db import close_pool
+    from instrument import metrics_store
+    if metrics_store.enabled:
+        metrics_store.flush(final=True)
+        metrics_store.retire()
+    close_pool()
+
+
+def child_exit(server, worker):
+    # Worker terminati senza worker_exit (timeout, SIGKILL): il master somma il loro file.
+    from instrument import metrics_store
+    if metrics_store.enabled:
+        metrics_store.retire(worker.pid)